@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DiscuzSentinel 消息热路径微基准
+使用 fixtures/ 中录制的帖子数据离线运行，不访问网络，也不需要真实的 config.json。
+输出每个热点函数的单次调用耗时（平均 / p50 / p95）与单次调用的内存分配峰值。
+
+用法：
+    python bench_sentinel.py                  # 运行全部基准
+    python bench_sentinel.py -k clean         # 只运行名称包含 clean 的基准
+    python bench_sentinel.py --min-time 1     # 每项至少运行 1 秒
+    python bench_sentinel.py --json out.json  # 同时输出 JSON，便于对比前后结果
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+os.environ.setdefault('DISCUZ_SENTINEL_CONFIG', os.path.join(FIXTURES_DIR, 'config.json'))
+
+import discuz_sentinel as ds  # noqa: E402
+
+# 图片文件头样例，用于 _is_valid_image
+IMAGE_SAMPLES = {
+    'png': b'\x89PNG\r\n\x1a\n' + b'\x00' * 2048,
+    'jpeg': b'\xFF\xD8\xFF\xE0' + b'\x00' * 2048,
+    'gif': b'GIF89a' + b'\x00' * 2048,
+    'webp': b'RIFF\x00\x00\x00\x00WEBPVP8 ' + b'\x00' * 2048,
+    'html': b'<!DOCTYPE html><html><head><title>403</title></head><body>' + b'x' * 2048 + b'</body></html>',
+}
+
+TIME_SAMPLES = {
+    'unix': '1767690611',
+    'datetime': '2026-01-06 17:12:05',
+    'invalid': '昨天 17:12',
+}
+
+def size_label(html: str) -> str:
+    """按正文长度给帖子分档"""
+    size = len(html)
+    if size < 500:
+        return 'small'
+    if size < 5000:
+        return 'medium'
+    if size < 50000:
+        return 'large'
+    return 'huge'
+
+def load_fixtures() -> Dict:
+    with open(os.path.join(FIXTURES_DIR, 'posts.json'), 'r', encoding='utf-8') as f:
+        posts = json.load(f)
+    with open(os.path.join(FIXTURES_DIR, 'viewthread.json'), 'r', encoding='utf-8') as f:
+        viewthread = json.load(f)
+
+    # 由全部样例拼接出一个超长帖子，覆盖 huge 档位
+    huge = dict(posts[-1], pid='3199999', message=''.join(post['message'] for post in posts) * 3)
+    posts.append(huge)
+    viewthread['Variables']['postlist'].append(dict(viewthread['Variables']['postlist'][-1], **huge))
+    return {'posts': posts, 'viewthread': viewthread}
+
+def build_cases(sentinel: 'ds.DiscuzSentinel', fixtures: Dict) -> List[Tuple[str, Callable]]:
+    cases = []
+    viewthread = fixtures['viewthread']
+
+    for post in fixtures['posts']:
+        pid = int(post['pid'])
+        label = f"{size_label(post['message'])}/{pid}"
+        post_data = sentinel._extract_post_content(viewthread, pid)
+        message = sentinel._format_message(post_data)
+        image_elements = [
+            {"tag": "img", "img_key": f"img_v3_{i:04d}", "alt": {"tag": "plain_text", "content": "图片"}}
+            for i in range(len(post_data['images']))
+        ]
+
+        cases.append((f"clean_content[{label}]", lambda m=post['message']: sentinel._clean_content(m)))
+        cases.append((f"extract_post_content[{label}]", lambda p=pid: sentinel._extract_post_content(viewthread, p)))
+        cases.append((f"extract_from_livelastpost[{label}]", lambda item=post: sentinel._extract_from_livelastpost(item, 147)))
+        cases.append((f"format_message[{label}]", lambda d=post_data: sentinel._format_message(d)))
+        cases.append((
+            f"feishu_card[{label}]",
+            lambda m=message, d=post_data, e=image_elements: sentinel._build_feishu_card(m, d['subject'], e)
+        ))
+
+    for name, data in IMAGE_SAMPLES.items():
+        cases.append((f"is_valid_image[{name}]", lambda d=data: sentinel._is_valid_image(d)))
+
+    for name, value in TIME_SAMPLES.items():
+        cases.append((f"parse_timestamp[{name}]", lambda v=value: sentinel._parse_timestamp(v)))
+
+    return cases
+
+def measure(func: Callable, min_time: float, min_rounds: int) -> Dict:
+    """计时与内存分配分开测量，避免 tracemalloc 影响耗时结果"""
+    func()  # 预热
+
+    timings = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < min_rounds or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    alloc_rounds = min(len(timings), 20)
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_rounds):
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - base)
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'calls': len(timings),
+        'mean_us': statistics.mean(timings) * 1e6,
+        'p50_us': timings[len(timings) // 2] * 1e6,
+        'p95_us': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1e6,
+        'peak_kib': statistics.mean(peaks) / 1024,
+    }
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="DiscuzSentinel 热路径微基准")
+    parser.add_argument('-k', dest='keyword', default='', help="只运行名称包含该关键字的基准")
+    parser.add_argument('--min-time', type=float, default=0.2, help="每项最少运行时间(秒)")
+    parser.add_argument('--min-rounds', type=int, default=20, help="每项最少调用次数")
+    parser.add_argument('--json', dest='json_file', help="将结果另存为 JSON 文件")
+    args = parser.parse_args(argv)
+
+    sentinel = ds.DiscuzSentinel()
+    print(f"HTML解析后端: {sentinel.html_backend.name}")
+    print(f"{'benchmark':<44} {'calls':>8} {'mean(us)':>10} {'p50(us)':>10} {'p95(us)':>10} {'peak(KiB)':>10}")
+
+    results = {}
+    for name, func in build_cases(sentinel, load_fixtures()):
+        if args.keyword and args.keyword not in name:
+            continue
+        result = measure(func, args.min_time, args.min_rounds)
+        results[name] = result
+        print(f"{name:<44} {result['calls']:>8} {result['mean_us']:>10.1f} {result['p50_us']:>10.1f} "
+              f"{result['p95_us']:>10.1f} {result['peak_kib']:>10.1f}")
+
+    if args.json_file:
+        with open(args.json_file, 'w', encoding='utf-8') as f:
+            json.dump({'html_backend': sentinel.html_backend.name, 'results': results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
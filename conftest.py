@@ -0,0 +1,10 @@
+"""
+测试使用 fixtures/config.json，无需真实的 config.json
+"""
+
+import os
+
+os.environ.setdefault(
+    'DISCUZ_SENTINEL_CONFIG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'config.json')
+)
@@ -7,28 +7,57 @@ DiscuzSentinel - Discuz! 论坛多驿站监控系统
 2. 飞书：自动将图片上传到飞书服务器 (需配置 AppID)，实现原生大图显示
 """
 
+import importlib
 import json
 import logging
 from logging.handlers import TimedRotatingFileHandler
 import os
 import random
+import math
 import re
+import signal
+import socket
+import sqlite3
+import sys
+import threading
 import time
+from collections import Counter as _FeatureCounter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from datetime import datetime
+from html import unescape
+from html.parser import HTMLParser
 from typing import Dict, List, Optional, Tuple
-from urllib.parse import urljoin
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlsplit, urlunsplit
 import urllib.parse
 import hmac
+import io
 import hashlib
 import base64
-import requests
-from bs4 import BeautifulSoup
+
+class _LazyModule:
+    """首次访问属性时才导入的模块：requests 等较重的依赖不在导入本模块时加载，缩短一次性运行的启动时间"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+requests = _LazyModule('requests')
 
 # ==================== 配置加载 ====================
 
-def load_config():
+def config_path() -> str:
+    """配置文件路径（可通过环境变量 DISCUZ_SENTINEL_CONFIG 指定）"""
+    return os.environ.get('DISCUZ_SENTINEL_CONFIG', 'config.json')
+
+def load_config(config_file: Optional[str] = None):
     """加载JSON配置文件"""
-    config_file = 'config.json'
+    config_file = config_file or config_path()
     if not os.path.exists(config_file):
         raise FileNotFoundError(f"配置文件 {config_file} 不存在，请复制 env.example 为 config.json 并填写配置")
 
@@ -39,31 +68,85 @@ def load_config():
     except json.JSONDecodeError as e:
         raise ValueError(f"配置文件 {config_file} 格式错误: {e}")
 
-# 加载配置
-CONFIG = load_config()
+def parse_fids(value) -> List[int]:
+    """解析 target_fids："147,148" 形式的字符串"""
+    return [int(fid.strip()) for fid in str(value).split(',') if fid.strip()]
 
-# ==================== 配置解析 ====================
+class Config:
+    """
+    可热加载的配置快照：重新加载时整体替换引用，读取方拿到的总是一致的一份
+    监控FID、Webhook映射、Cookie 在运行中生效，其余配置仍需重启
+    """
+
+    HOT_KEYS = {('discuz', 'target_fids'), ('discuz', 'cookie'), ('notifications', 'fid_mappings')}
+
+    def __init__(self, data: Dict, path: str = '', mtime: float = 0.0):
+        self.data = data
+        self.path = path
+        self.mtime = mtime
+        discuz = data.get('discuz', {})
+        self.target_fids = parse_fids(discuz.get('target_fids', '147,148'))
+        self.cookie = discuz.get('cookie', 'your_cookie_here')
+        self.fid_mappings = data.get('notifications', {}).get('fid_mappings', {})
 
-# Discuz配置
-TARGET_FIDS_STR = CONFIG.get('discuz', {}).get('target_fids', '147,148')
-TARGET_FIDS = [int(fid.strip()) for fid in TARGET_FIDS_STR.split(',') if fid.strip()]
-COOKIE = CONFIG.get('discuz', {}).get('cookie', 'your_cookie_here')
-BASE_URL = CONFIG.get('discuz', {}).get('base_url', 'https://www.55188.com')
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'Config':
+        path = path or config_path()
+        mtime = os.path.getmtime(path) if os.path.exists(path) else 0.0
+        return cls(load_config(path), path, mtime)
 
-# 图片上传配置（全局）
-IMAGE_UPLOAD_APP_ID = CONFIG.get('image_upload', {}).get('app_id', '')
-IMAGE_UPLOAD_APP_SECRET = CONFIG.get('image_upload', {}).get('app_secret', '')
-IMAGE_UPLOAD_URL = CONFIG.get('image_upload', {}).get('upload_url', 'http://frp-cup.com:12245/upload/upload.html')
+    def cold_changes(self, other: 'Config') -> List[str]:
+        """与新配置相比，需要重启才能生效的改动（section.key）"""
+        changed = []
+        for section in set(self.data) | set(other.data):
+            old, new = self.data.get(section, {}), other.data.get(section, {})
+            if not isinstance(old, dict) or not isinstance(new, dict):
+                if old != new:
+                    changed.append(section)
+                continue
+            for key in set(old) | set(new):
+                if (section, key) not in self.HOT_KEYS and old.get(key) != new.get(key):
+                    changed.append(f"{section}.{key}")
+        return sorted(changed)
 
-# FID到Webhook映射
-FID_MAPPINGS = CONFIG.get('notifications', {}).get('fid_mappings', {})
+# ==================== 配置解析 ====================
+
+# 固定参数（不从配置文件读取）
+# token 剩余有效期不足该值(秒)时由后台线程提前刷新
+FEISHU_TOKEN_REFRESH_AHEAD = 600
+# 正文少于该字数且没有图片时不参与去重（"顶"、"同上"之类的短回复）
+FINGERPRINT_MIN_TEXT = 20
+# 摘要模式：每条帖子在合并消息中的正文预览长度，以及单条合并消息最多包含的帖子数默认值
+DIGEST_PREVIEW_LIMIT = 300
+DIGEST_MAX_POSTS = 20
+# 两段式推送：图片补发消息的队列键后缀，与正文分开排队，慢图片不阻塞后续帖子的正文
+FOLLOWUP_KEY_SUFFIX = '#images'
+# 分片模式下发送前认领消息的有效期(秒)，需覆盖一次发送（含图片上传）的最长耗时
+DELIVERY_CLAIM_TTL = 300
+# 缓存中找不到目标PID时，超过该时长(秒)的缓存会重新拉取一次
+THREAD_REFRESH_AGE = 5
+# pid→页码索引：容量与有效期(秒)，长主题的新回复直接请求所在页
+POST_PAGE_INDEX_MAX_ENTRIES = 20000
+POST_PAGE_INDEX_TTL = 86400
+# 各轮询数据源请求开销的日志汇报间隔(秒)
+SOURCE_REPORT_INTERVAL = 600
+# 断档补抓失败后的重试退避(秒)与最多尝试次数，超过后放弃该断档，恢复该FID的推送
+BACKFILL_RETRY_BASE = 30
+BACKFILL_RETRY_MAX = 1800
+BACKFILL_MAX_ATTEMPTS = 6
+# 发送队列中已完成（已发送/已放弃）的消息保留时间(秒)与清理间隔(秒)
+OUTBOX_RETENTION = 7 * 86400
+OUTBOX_PURGE_INTERVAL = 3600
+# 飞书机器人返回这些错误码时消息本身不合法，重试也不会成功，直接放弃：
+# 9499 请求参数错误（如卡片格式不合法），19024 消息不含安全设置的关键词
+FEISHU_REJECT_CODES = {9499, 19024}
 
-# 系统配置
-PREVIEW_LIMIT = CONFIG.get('system', {}).get('preview_limit', 4000)
-STATE_FILE = CONFIG.get('system', {}).get('state_file', 'monitor_state.json')
-LOG_FILE = CONFIG.get('system', {}).get('log_file', 'discuz_sentinel.log')
-LOG_LEVEL_STR = CONFIG.get('system', {}).get('log_level', 'INFO')
-LOG_RETENTION_DAYS = CONFIG.get('system', {}).get('log_retention_days', 7)
+# 机器人限流默认值：(每分钟次数, 突发上限)
+# 飞书自定义机器人 100次/分钟、5次/秒；钉钉机器人 20次/分钟
+WEBHOOK_RATE_LIMITS = {
+    'feishu': (100, 5),
+    'dingtalk': (20, 5),
+}
 
 # 日志级别映射
 LOG_LEVEL_MAP = {
@@ -73,349 +156,2610 @@ LOG_LEVEL_MAP = {
     'ERROR': logging.ERROR,
     'CRITICAL': logging.CRITICAL
 }
-LOG_LEVEL = LOG_LEVEL_MAP.get(LOG_LEVEL_STR.upper(), logging.INFO)
 
-class DiscuzSentinel:
+def configure(config: Optional[Config] = None):
+    """
+    应用启动配置：按配置文件计算并发、缓存、存储路径等模块级配置，缺省项使用默认值
+    导入本模块时只应用默认值，不读取配置文件；监控FID、Webhook映射与 Cookie 由 Config 热加载
+    """
+    global CONFIG, BASE_URL, IMAGE_UPLOAD_APP_ID, IMAGE_UPLOAD_APP_SECRET, IMAGE_UPLOAD_URL, \
+    FEISHU_BASE_URL, FEISHU_IMAGE_API, FEISHU_TOKEN_API, \
+    IMAGE_WORKERS, IMAGE_UPLOAD_CONCURRENCY, FEISHU_APPS, FEISHU_UPLOAD_RATE_PER_MINUTE, \
+    IMAGE_CACHE_FILE, IMAGE_CACHE_MAX_ENTRIES, IMAGE_CACHE_TTL_DAYS, IMAGE_FAILURE_COOLDOWN, \
+    IMAGE_MAX_BYTES, IMAGE_TRANSCODE, IMAGE_TRANSCODE_WORKERS, IMAGE_MAX_DIMENSION, \
+    IMAGE_TRANSCODE_FORMAT, IMAGE_TRANSCODE_QUALITY, IMAGE_TRANSCODE_MIN_BYTES, PREVIEW_LIMIT, \
+    STATE_FILE, STATE_BACKEND, STATE_FLUSH_INTERVAL, FINGERPRINT_FILE, FINGERPRINT_MAX_ENTRIES, \
+    FINGERPRINT_TTL_DAYS, FINGERPRINT_MAX_DISTANCE, SHARD_FILE, SHARD_LEASE_TTL, WORKER_ID, \
+    LOG_FILE, LOG_LEVEL_STR, LOG_RETENTION_DAYS, HTML_PARSER, METRICS_HOST, METRICS_PORT, \
+    CONFIG_WATCH_INTERVAL, MAX_CONCURRENCY, PER_HOST_CONCURRENCY, PER_HOST_MIN_INTERVAL, \
+    POLL_INTERVAL_MIN, POLL_INTERVAL_MAX, POLL_BUDGET_PER_MINUTE, BACKFILL_WORKERS, BACKFILL_AFTER, \
+    BACKFILL_MAX_PAGES, POLL_SOURCES, HTTP_POOL_SIZE, HTTP_RETRIES, \
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, THREAD_CACHE_TTL, THREAD_CACHE_MAX_ENTRIES, \
+    OUTBOX_FILE, DELIVERY_MAX_ATTEMPTS, DELIVERY_BACKOFF_BASE, DELIVERY_BACKOFF_MAX, LOG_LEVEL
+    CONFIG = config.data if config else {}
+
+    # Discuz配置（监控FID与Cookie可热加载，见 Config）
+    BASE_URL = CONFIG.get('discuz', {}).get('base_url', 'https://www.55188.com')
+
+    # 图片上传配置（全局）
+    IMAGE_UPLOAD_APP_ID = CONFIG.get('image_upload', {}).get('app_id', '')
+    IMAGE_UPLOAD_APP_SECRET = CONFIG.get('image_upload', {}).get('app_secret', '')
+    IMAGE_UPLOAD_URL = CONFIG.get('image_upload', {}).get('upload_url', 'http://frp-cup.com:12245/upload/upload.html')
+    # 飞书开放平台地址（Lark 国际版为 https://open.larksuite.com）
+    FEISHU_BASE_URL = CONFIG.get('image_upload', {}).get('feishu_base_url', 'https://open.feishu.cn').rstrip('/')
+    FEISHU_IMAGE_API = f"{FEISHU_BASE_URL}/open-apis/im/v1/images"
+    FEISHU_TOKEN_API = f"{FEISHU_BASE_URL}/open-apis/auth/v3/tenant_access_token/internal"
+    IMAGE_WORKERS = int(CONFIG.get('image_upload', {}).get('workers', 4))
+    IMAGE_UPLOAD_CONCURRENCY = int(CONFIG.get('image_upload', {}).get('per_destination_concurrency', 3))
+    # 飞书应用凭据池：全局 app_id/app_secret 之外，可在 extra_apps 中追加多个应用分摊图片上传
+    FEISHU_APPS = []
+    for _app in [{'app_id': IMAGE_UPLOAD_APP_ID, 'app_secret': IMAGE_UPLOAD_APP_SECRET}] + \
+            CONFIG.get('image_upload', {}).get('extra_apps', []):
+        if _app.get('app_id') and _app.get('app_secret') and _app['app_id'] not in [a for a, _ in FEISHU_APPS]:
+            FEISHU_APPS.append((_app['app_id'], _app['app_secret']))
+    FEISHU_UPLOAD_RATE_PER_MINUTE = int(CONFIG.get('image_upload', {}).get('feishu_rate_per_minute', 300))
+    IMAGE_CACHE_FILE = CONFIG.get('image_upload', {}).get('cache_file', 'image_cache.json')
+    IMAGE_CACHE_MAX_ENTRIES = int(CONFIG.get('image_upload', {}).get('cache_max_entries', 5000))
+    IMAGE_CACHE_TTL_DAYS = float(CONFIG.get('image_upload', {}).get('cache_ttl_days', 30))
+    IMAGE_FAILURE_COOLDOWN = int(CONFIG.get('image_upload', {}).get('failure_cooldown', 1800))
+    IMAGE_MAX_BYTES = int(CONFIG.get('image_upload', {}).get('max_bytes', 10 * 1024 * 1024))
+    # 上传前压缩/转码（需要安装 Pillow）
+    IMAGE_TRANSCODE = bool(CONFIG.get('image_upload', {}).get('transcode', False))
+    IMAGE_TRANSCODE_WORKERS = int(CONFIG.get('image_upload', {}).get('transcode_workers', 2))
+    IMAGE_MAX_DIMENSION = int(CONFIG.get('image_upload', {}).get('max_dimension', 2048))
+    IMAGE_TRANSCODE_FORMAT = CONFIG.get('image_upload', {}).get('transcode_format', 'jpeg').lower()
+    IMAGE_TRANSCODE_QUALITY = int(CONFIG.get('image_upload', {}).get('transcode_quality', 85))
+    IMAGE_TRANSCODE_MIN_BYTES = int(CONFIG.get('image_upload', {}).get('transcode_min_bytes', 200 * 1024))
+
+    # 系统配置
+    PREVIEW_LIMIT = CONFIG.get('system', {}).get('preview_limit', 4000)
+    STATE_FILE = CONFIG.get('system', {}).get('state_file', 'monitor_state.json')
+    STATE_BACKEND = CONFIG.get('system', {}).get('state_backend', 'json')
+    STATE_FLUSH_INTERVAL = float(CONFIG.get('system', {}).get('state_flush_interval', 5))
+    # 内容指纹去重（跨FID转发、重复发布）
+    FINGERPRINT_FILE = CONFIG.get('system', {}).get('fingerprint_file', 'fingerprints.json')
+    FINGERPRINT_MAX_ENTRIES = int(CONFIG.get('system', {}).get('fingerprint_max_entries', 20000))
+    FINGERPRINT_TTL_DAYS = float(CONFIG.get('system', {}).get('fingerprint_ttl_days', 7))
+    FINGERPRINT_MAX_DISTANCE = int(CONFIG.get('system', {}).get('fingerprint_max_distance', 3))
+    # 分片模式：多个 worker 通过共享 SQLite 文件中的租约分配FID（为空则不分片）
+    SHARD_FILE = CONFIG.get('system', {}).get('shard_file', '')
+    SHARD_LEASE_TTL = float(CONFIG.get('system', {}).get('shard_lease_ttl', 60))
+    WORKER_ID = CONFIG.get('system', {}).get('worker_id') or f"{socket.gethostname()}-{os.getpid()}"
+    LOG_FILE = CONFIG.get('system', {}).get('log_file', 'discuz_sentinel.log')
+    LOG_LEVEL_STR = CONFIG.get('system', {}).get('log_level', 'INFO')
+    LOG_RETENTION_DAYS = CONFIG.get('system', {}).get('log_retention_days', 7)
+    HTML_PARSER = CONFIG.get('system', {}).get('html_parser', 'auto')
+    METRICS_HOST = CONFIG.get('system', {}).get('metrics_host', '127.0.0.1')
+    METRICS_PORT = int(CONFIG.get('system', {}).get('metrics_port', 0))
+    # 配置文件变化检测间隔(秒)，0 为只响应 SIGHUP
+    CONFIG_WATCH_INTERVAL = float(CONFIG.get('system', {}).get('config_watch_interval', 5))
+
+    # 轮询并发配置
+    MAX_CONCURRENCY = int(CONFIG.get('system', {}).get('max_concurrency', 4))
+    PER_HOST_CONCURRENCY = int(CONFIG.get('system', {}).get('per_host_concurrency', 2))
+    PER_HOST_MIN_INTERVAL = float(CONFIG.get('system', {}).get('per_host_min_interval', 0.5))
+    POLL_INTERVAL_MIN = float(CONFIG.get('system', {}).get('poll_interval_min', 15))
+    POLL_INTERVAL_MAX = float(CONFIG.get('system', {}).get('poll_interval_max', 180))
+    POLL_BUDGET_PER_MINUTE = float(CONFIG.get('system', {}).get('poll_budget_per_minute', 60))
+    # 轮询数据源：livelastpost（逐FID）/ rss / guide（一次请求覆盖多个FID），启用多个时按实测开销选择
+    POLL_SOURCES = CONFIG.get('system', {}).get('poll_sources', ['livelastpost'])
+    # 断档补抓：停机或游标丢失后，从版块列表与主题分页找回 livelastpost 未返回的帖子
+    BACKFILL_WORKERS = int(CONFIG.get('system', {}).get('backfill_workers', 4))
+    BACKFILL_AFTER = float(CONFIG.get('system', {}).get('backfill_after', 600))
+    BACKFILL_MAX_PAGES = int(CONFIG.get('system', {}).get('backfill_max_pages', 5))
+    # HTTP 连接池配置（每个目标主机一个长连接 Session）
+    HTTP_POOL_SIZE = int(CONFIG.get('system', {}).get('http_pool_size', 10))
+    HTTP_RETRIES = int(CONFIG.get('system', {}).get('http_retries', 2))
+    # 熔断：同一端点连续失败后快速失败，冷却后放行单个探测请求
+    CIRCUIT_FAILURE_THRESHOLD = int(CONFIG.get('system', {}).get('circuit_failure_threshold', 5))
+    CIRCUIT_RESET_TIMEOUT = float(CONFIG.get('system', {}).get('circuit_reset_timeout', 60))
+
+    # 帖子详情缓存配置
+    THREAD_CACHE_TTL = float(CONFIG.get('system', {}).get('thread_cache_ttl', 30))
+    THREAD_CACHE_MAX_ENTRIES = int(CONFIG.get('system', {}).get('thread_cache_max_entries', 256))
+
+    # 发送队列配置
+    OUTBOX_FILE = CONFIG.get('system', {}).get('outbox_file', 'outbox.db')
+    DELIVERY_MAX_ATTEMPTS = int(CONFIG.get('system', {}).get('delivery_max_attempts', 8))
+    DELIVERY_BACKOFF_BASE = float(CONFIG.get('system', {}).get('delivery_backoff_base', 5))
+    DELIVERY_BACKOFF_MAX = float(CONFIG.get('system', {}).get('delivery_backoff_max', 600))
+
+    LOG_LEVEL = LOG_LEVEL_MAP.get(LOG_LEVEL_STR.upper(), logging.INFO)
+
+configure()
+
+def validate_config(config: Config) -> Tuple[List[str], List[str]]:
+    """检查配置，返回 (错误, 警告)；启动、热加载与 check-config 子命令共用"""
+    errors, warnings = [], []
+    if not config.target_fids:
+        errors.append("discuz.target_fids 为空")
+    if not config.cookie or config.cookie == 'your_cookie_here':
+        warnings.append("Cookie 未配置")
+
+    has_sender = False
+    if not isinstance(config.fid_mappings, dict):
+        errors.append("notifications.fid_mappings 应为以FID为键的对象")
+    for fid, mapping in (config.fid_mappings.items() if isinstance(config.fid_mappings, dict) else ()):
+        if not str(fid).isdigit():
+            errors.append(f"fid_mappings 的键必须是FID数字: {fid}")
+            continue
+        if not isinstance(mapping, dict):
+            errors.append(f"FID {fid}: 映射应为包含 webhook_url / webhook_type 的对象")
+            continue
+        if mapping.get('webhook_url'):
+            has_sender = True
+        if mapping.get('webhook_type', '').lower() not in ('feishu', 'dingtalk'):
+            errors.append(f"FID {fid}: webhook_type 应为 feishu 或 dingtalk")
+        if mapping.get('duplicate_policy', 'off') not in ('off', 'skip', 'annotate'):
+            errors.append(f"FID {fid}: duplicate_policy 应为 off / skip / annotate")
+        if mapping.get('image_delivery', 'inline') not in ('inline', 'followup'):
+            errors.append(f"FID {fid}: image_delivery 应为 inline 或 followup")
+        if int(fid) not in config.target_fids:
+            warnings.append(f"FID {fid} 配置了映射但不在 target_fids 中，不会被轮询")
+    if not has_sender:
+        warnings.append("未配置任何有效的FID到Webhook映射")
+    for fid in config.target_fids:
+        if str(fid) not in config.fid_mappings:
+            warnings.append(f"FID {fid} 未配置Webhook映射，新帖不会推送")
+
+    image_upload = config.data.get('image_upload', {})
+    if not image_upload.get('app_id') or not image_upload.get('app_secret'):
+        warnings.append("未配置全局图片上传AppID/Secret，图片将以链接形式显示")
+    system = config.data.get('system', {})
+    if system.get('state_backend', 'json') not in ('json', 'sqlite'):
+        errors.append("system.state_backend 应为 json 或 sqlite")
+    if system.get('html_parser', 'auto') not in ('auto', 'html.parser', 'lxml', 'selectolax', 'bs4'):
+        errors.append("system.html_parser 应为 auto / html.parser / lxml / selectolax / bs4")
+    sources = system.get('poll_sources', ['livelastpost'])
+    if not isinstance(sources, list) or not sources or \
+            any(name not in ('livelastpost', 'rss', 'guide') for name in sources):
+        errors.append("system.poll_sources 应为 livelastpost / rss / guide 组成的非空列表")
+    elif 'rss' in sources and len(set(sources)) > 1:
+        warnings.append("system.poll_sources: rss 不含回复，与 livelastpost / guide 同时启用时不会被选用")
+    return errors, warnings
+
+# ==================== HTML 解析 ====================
+# 帖子正文解析是每条消息最主要的CPU开销，这里把解析器做成可替换的后端。
+# 所有后端都必须与 BeautifulSoup(html.parser) 的结果完全一致：
+#   extract()      -> 对应 soup.get_text('\n') 与 soup.find_all('img')
+#   extract_node() -> 对应 soup.find(tag, class_=cls) 节点的 get_text 与其中的 img
+
+def _img_src(attrs: Dict) -> Optional[str]:
+    """优先获取高清大图链接"""
+    return attrs.get('zoomfile') or attrs.get('file') or attrs.get('src')
+
+class Bs4Backend:
+    """参考实现：BeautifulSoup + html.parser（构建完整文档树）"""
+
+    name = 'bs4'
+
     def __init__(self):
-        self.logger = logging.getLogger("DiscuzSentinel")
-        self.logger.setLevel(LOG_LEVEL)
-        self._setup_logging()
-        self.session = requests.Session()
-        self.state = self._load_state()
-        self._setup_session()
-        # 飞书 Token 缓存
-        self.feishu_token = ""
-        self.feishu_token_expire = 0.0
-        self._check_config()
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
 
-    def _setup_logging(self):
-        handlers = [logging.StreamHandler()]
-        if LOG_FILE:
-            file_handler = TimedRotatingFileHandler(
-                LOG_FILE, when="midnight", backupCount=LOG_RETENTION_DAYS, encoding='utf-8'
-            )
-            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-            handlers.append(file_handler)
-        
-        for handler in handlers:
-            self.logger.addHandler(handler)
+    def extract(self, html: str) -> Tuple[str, List[Optional[str]]]:
+        soup = self._soup(html, 'html.parser')
+        srcs = [_img_src(img) for img in soup.find_all('img')]
+        for tag in soup(['script', 'style', 'img']):
+            tag.decompose()
+        return soup.get_text('\n'), srcs
 
-    def _setup_session(self):
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Connection': 'keep-alive',
-            'Cookie': COOKIE
-        })
+    def extract_node(self, html: str, tag: str, cls: str) -> Optional[Tuple[str, List[Optional[str]]]]:
+        soup = self._soup(html, 'html.parser')
+        node = soup.find(tag, class_=cls)
+        if not node:
+            return None
+        return node.get_text(separator='\n'), [_img_src(img) for img in node.find_all('img')]
 
-    def _load_state(self) -> Dict:
-        try:
-            with open(STATE_FILE, 'r', encoding='utf-8') as f:
-                state = json.load(f)
-                normalized = {}
-                for k, v in state.items():
-                    fid = int(k)
-                    if isinstance(v, dict):
-                        normalized[fid] = {'last_pid': int(v.get('last_pid', 0)), 'last_tid': int(v.get('last_tid', 0))}
-                    else:
-                        normalized[fid] = {'last_pid': int(v), 'last_tid': 0}
-                return normalized
-        except FileNotFoundError:
-            return {}
-        except Exception:
-            return {}
+class _StopParsing(Exception):
+    pass
 
-    def _save_state(self):
-        try:
-            with open(STATE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.state, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            self.logger.error(f"保存状态失败: {e}")
-    
-    def _check_config(self):
-        if not COOKIE or COOKIE == 'your_cookie_here':
-            self.logger.warning("❌ Cookie 未配置")
-
-        # 检查FID映射配置
-        has_sender = False
-        for fid, config in FID_MAPPINGS.items():
-            if config.get('webhook_url'):
-                has_sender = True
-                break
+class _StreamExtractor(HTMLParser):
+    """
+    基于标准库 html.parser 的流式提取器，不构建文档树。
+    按 BeautifulSoup 的规则切分文本段、折叠纯空白文本、忽略 script/style 等容器内的文本
+    """
 
-        if not has_sender:
-            self.logger.warning("⚠️  未配置任何有效的FID到Webhook映射")
+    VOID_TAGS = {
+        'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+        'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+        'nextid', 'spacer',
+    }
+    STRING_CONTAINERS = {'rt', 'rp', 'style', 'script', 'template'}
+    PRESERVE_WHITESPACE = {'pre', 'textarea'}
+    ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
 
-        # 检查全局图片上传配置
-        if not IMAGE_UPLOAD_APP_ID or not IMAGE_UPLOAD_APP_SECRET:
-            self.logger.warning("⚠️  未配置全局图片上传AppID/Secret，图片将以链接形式显示")
+    def __init__(self, target: Optional[Tuple[str, str]] = None):
+        super().__init__(convert_charrefs=False)
+        self.target = target
+        self.capturing = target is None
+        self.found = False
+        self.strings: List[str] = []
+        self.srcs: List[Optional[str]] = []
+        self._stack: List[str] = []
+        self._target_depth = 0
+        self._data: List[str] = []
+        self._containers = 0
+        self._preserve = 0
+        self._already_closed: List[str] = []
 
-    def _get_livelastpost(self, fid: int, last_pid: int) -> Optional[Dict]:
-        url = f"{BASE_URL}/forum.php"
-        params = {'mod': 'misc', 'action': 'livelastpost', 'type': 'post', 'fid': fid, 'postid': last_pid}
-        headers = {'Referer': f"{BASE_URL}/group-{fid}-1.html", 'Accept': 'application/json', 'X-Requested-With': 'XMLHttpRequest'}
+    def _flush(self, keep: bool = True):
+        if not self._data:
+            return
+        text = ''.join(self._data)
+        self._data = []
+        if not self._preserve and not text.strip(self.ASCII_SPACES):
+            text = '\n' if '\n' in text else ' '
+        if keep and self.capturing and not self._containers:
+            self.strings.append(text)
 
-        # 添加重试机制，最多重试2次
-        for attempt in range(3):
-            try:
-                self.logger.debug(f"FID {fid}: 请求 livelastpost (尝试 {attempt + 1}/3)")
-                response = self.session.get(url, params=params, headers=headers, timeout=15)
+    def _push(self, tag: str):
+        self._stack.append(tag)
+        if tag in self.STRING_CONTAINERS:
+            self._containers += 1
+        if tag in self.PRESERVE_WHITESPACE:
+            self._preserve += 1
 
-                # 检查HTTP状态码
-                if response.status_code == 504:
-                    self.logger.warning(f"FID {fid}: 服务器网关超时 (504)，论坛服务器可能负载过高或维护中")
-                    if attempt < 2:  # 不是最后一次尝试
-                        self.logger.info(f"FID {fid}: {5 * (attempt + 1)} 秒后重试...")
-                        time.sleep(5 * (attempt + 1))
-                        continue
-                    return None
+    def _pop_to(self, tag: str):
+        if tag not in self._stack:
+            return
+        while self._stack:
+            popped = self._stack.pop()
+            if popped in self.STRING_CONTAINERS:
+                self._containers -= 1
+            if popped in self.PRESERVE_WHITESPACE:
+                self._preserve -= 1
+            if self.target and self.capturing and len(self._stack) < self._target_depth:
+                raise _StopParsing()
+            if popped == tag:
+                break
 
-                if response.status_code != 200:
-                    self.logger.warning(f"FID {fid}: HTTP {response.status_code} 错误")
-                    return None
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self._flush()
+        attr_dict = {key: '' if value is None else value for key, value in attrs}
+        if self.target and not self.found and tag == self.target[0]:
+            classes = attr_dict.get('class', '')
+            if self.target[1] == classes or self.target[1] in classes.split():
+                self.found = self.capturing = True
+                self._target_depth = len(self._stack) + 1
+        if tag == 'img' and self.capturing:
+            self.srcs.append(_img_src(attr_dict))
+        self._push(tag)
+        if tag in self.VOID_TAGS and handle_empty_element:
+            self.handle_endtag(tag, check_already_closed=False)
+            self._already_closed.append(tag)
 
-                # 检查响应内容是否包含登录提示
-                response_text = response.text
-                if 'not_loggedin' in response_text:
-                    self.logger.warning(f"FID {fid}: Cookie 可能已失效")
-                    return None
-            
-                if '504 Gateway Time-out' in response_text:
-                    self.logger.warning(f"FID {fid}: 响应内容显示网关超时")
-                    if attempt < 2:
-                        self.logger.info(f"FID {fid}: {5 * (attempt + 1)} 秒后重试...")
-                        time.sleep(5 * (attempt + 1))
-                        continue
-                    return None
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
 
-                # 尝试解析JSON
-                try:
-                    data = response.json()
-                except json.JSONDecodeError as e:
-                    self.logger.warning(f"FID {fid}: 响应不是有效JSON: {e}")
-                    self.logger.debug(f"FID {fid}: 响应内容前200字符: {response_text[:200]}")
-                    return None
-            
-                count = int(data.get('count', 0))
-                if count > 0:
-                    self.logger.info(f"FID {fid}: 发现 {count} 条新内容")
-                    return data
-                else:
-                    self.logger.debug(f"FID {fid}: 暂无新内容 (count={count})")
-                    return None
-            
-            except requests.exceptions.Timeout:
-                self.logger.warning(f"FID {fid}: 请求超时 (尝试 {attempt + 1}/3)")
-                if attempt < 2:
-                    time.sleep(3)
-                    continue
-                return None
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self._already_closed:
+            self._already_closed.remove(tag)
+            return
+        self._flush()
+        self._pop_to(tag)
 
-            except requests.exceptions.RequestException as e:
-                self.logger.error(f"FID {fid}: 网络请求异常: {e}")
-                if attempt < 2:
-                    time.sleep(3)
-                    continue
-                return None
+    def handle_data(self, data):
+        self._data.append(data)
 
-            except Exception as e:
-                self.logger.error(f"FID {fid}: 处理 livelastpost 时出现异常: {e}")
-                return None
+    def handle_charref(self, name):
+        if name[:1] in ('x', 'X'):
+            match = re.match(r'[0-9a-fA-F]+', name[1:])
+            number, extra = (f"x{match.group()}", name[1 + match.end():]) if match else (None, name)
+        else:
+            match = re.match(r'[0-9]+', name)
+            number, extra = (match.group(), name[match.end():]) if match else (None, name)
+        if number is not None:
+            self._data.append(unescape(f"&#{number};"))
+        if extra:
+            self._data.append(extra)
 
-        return None
+    def handle_entityref(self, name):
+        char = unescape(f"&{name};")
+        self._data.append(f"&{name}" if char == f"&{name};" else char)
 
-    def _get_thread_detail(self, tid: int, target_pid: Optional[int]) -> Optional[Dict]:
-        url = f"{BASE_URL}/api/mobile/index.php"
-        params = {'version': '4', 'module': 'viewthread', 'tid': tid}
-        try:
-            response = self.session.get(url, params=params, timeout=15)
-            data = response.json()
-            if 'show_thread_nopermission' in str(data):
-                return self._get_web_content_fallback(tid, fid_hint=None)
-            if target_pid:
-                found = False
-                for post in data.get('Variables', {}).get('postlist', []):
-                    if int(post.get('pid', 0)) == target_pid: found = True
-                if not found: return self._get_web_content_fallback(tid, fid_hint=None)
-            return data
-        except Exception:
-            return self._get_web_content_fallback(tid, fid_hint=None)
+    def handle_comment(self, data):
+        self._flush()
+        self._data.append(data)
+        self._flush(keep=False)
 
-    def _extract_post_content(self, thread_data: Dict, target_pid: int) -> Optional[Dict]:
+    def handle_decl(self, decl):
+        self.handle_comment(decl)
+
+    def handle_pi(self, data):
+        self.handle_comment(data)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self._flush()
+            self._data.append(data[len('CDATA['):])
+            self._flush()
+        else:
+            self.handle_comment(data)
+
+    def run(self, html: str) -> '_StreamExtractor':
         try:
-            if not isinstance(thread_data, dict): return None
-            vars = thread_data.get('Variables', {})
-            post_list = vars.get('postlist', [])
-            target = next((p for p in post_list if int(p.get('pid', 0)) == target_pid), None)
-            if not target: return None
-            
-            subject = vars.get('thread', {}).get('subject', '无标题')
-            text, images = self._clean_content(target.get('message', ''))
-            return {
-                'subject': subject,
-                'author': target.get('author', '未知'),
-                'time': target.get('dateline', ''),
-                'content': text,
-                'images': images,
-                'url': f"{BASE_URL}/thread-{vars.get('thread', {}).get('tid', '')}-1-1.html"
-            }
-        except Exception:
+            self.feed(html)
+            self.close()
+            self._flush()
+        except _StopParsing:
+            pass
+        return self
+
+class StreamBackend:
+    """标准库 html.parser 流式解析（默认回退方案，无需额外依赖）"""
+
+    name = 'html.parser'
+
+    def extract(self, html: str) -> Tuple[str, List[Optional[str]]]:
+        result = _StreamExtractor().run(html)
+        return '\n'.join(result.strings), result.srcs
+
+    def extract_node(self, html: str, tag: str, cls: str) -> Optional[Tuple[str, List[Optional[str]]]]:
+        result = _StreamExtractor(target=(tag, cls)).run(html)
+        if not result.found:
             return None
+        return '\n'.join(result.strings), result.srcs
 
-    def _extract_from_livelastpost(self, post_item: Dict, fid: int) -> Optional[Dict]:
-        text, images = self._clean_content(post_item.get('message', ''))
-        tid = self._extract_tid_from_message(post_item.get('message', ''))
-        return {
-            'subject': text[:30] + '...' if text else '新动态',
-            'author': post_item.get('author', '未知'),
-            'time': post_item.get('dateline', ''),
-            'content': text,
-            'images': images,
-            'url': f"{BASE_URL}/thread-{tid}-1-1.html" if tid else f"{BASE_URL}/group-{fid}-1.html"
-        }
+class LxmlBackend:
+    """lxml (libxml2) 解析，需要安装 lxml"""
 
-    def _get_web_content_fallback(self, tid: int, fid_hint: Optional[int]) -> Tuple[Optional[str], Optional[List[str]]]:
-        url = f"{BASE_URL}/thread-{tid}-1-1.html"
-        try:
-            resp = self.session.get(url, timeout=15)
-            if resp.encoding.lower() in ['gbk', 'gb2312']: resp.encoding = 'gbk'
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            node = soup.find('td', class_='t_f')
-            if not node: return "解析失败", []
-            text = node.get_text(separator='\n').strip()
-            images = []
-            for img in node.find_all('img'):
-                src = img.get('zoomfile') or img.get('file') or img.get('src')
-                if src: images.append(urljoin(BASE_URL + '/', src))
-            return text, images
-        except Exception:
-            return None, None
+    name = 'lxml'
+    SKIP_TAGS = {'script', 'style', 'template', 'rt', 'rp'}
+    PRESERVE_WHITESPACE = {'pre', 'textarea'}
 
-    def _clean_content(self, html_content: str) -> Tuple[str, List[str]]:
-        if not html_content: return "", []
-        soup = BeautifulSoup(html_content, 'html.parser')
-        images = []
-        for img in soup.find_all('img'):
-            # 优先获取高清大图链接
-            src = img.get('zoomfile') or img.get('file') or img.get('src')
+    def __init__(self):
+        import lxml.html
+        self._lxml = lxml.html
 
-            if src and 'smilies' not in src:
-                # =========== 修复代码开始 ===========
-                # 修复：去除末尾可能存在的错误符号 '>'
-                src = src.strip('>')
+    def _walk(self, node, strings: List[str], srcs: List[Optional[str]], preserve: bool = False):
+        if not isinstance(node.tag, str):
+            # 注释、处理指令等不计入文本
+            return
+        if node.tag == 'img':
+            srcs.append(_img_src(node.attrib))
+        preserve = preserve or node.tag in self.PRESERVE_WHITESPACE
+        if node.text and node.tag not in self.SKIP_TAGS:
+            strings.append(self._collapse(node.text, preserve))
+        for child in node:
+            if node.tag in self.SKIP_TAGS:
+                continue
+            self._walk(child, strings, srcs, preserve)
+            if child.tail:
+                strings.append(self._collapse(child.tail, preserve))
 
-                # 修复：只有当不是 Discuz 动态 PHP 链接时，才去除 ? 后面的参数
-                # 如果 URL 包含 forum.php 或 mod=image，说明参数是必须的，不能删
-                if '?' in src and 'forum.php' not in src and 'mod=image' not in src:
-                    src = src.split('?')[0]
-                # =========== 修复代码结束 ===========
+    @staticmethod
+    def _collapse(text: str, preserve: bool) -> str:
+        if not preserve and not text.strip(_StreamExtractor.ASCII_SPACES):
+            return '\n' if '\n' in text else ' '
+        return text
 
-                full_url = urljoin(BASE_URL + '/', src)
+    def extract(self, html: str) -> Tuple[str, List[Optional[str]]]:
+        root = self._lxml.fragment_fromstring(html, create_parent='div')
+        strings, srcs = [], []
+        self._walk(root, strings, srcs)
+        return '\n'.join(strings), srcs
 
-                # 去重：防止同一张图被添加多次
-                if full_url not in images:
-                    images.append(full_url)
+    def extract_node(self, html: str, tag: str, cls: str) -> Optional[Tuple[str, List[Optional[str]]]]:
+        root = self._lxml.document_fromstring(html)
+        nodes = root.xpath(f"//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')]")
+        if not nodes:
+            return None
+        strings, srcs = [], []
+        self._walk(nodes[0], strings, srcs)
+        return '\n'.join(strings), srcs
 
-        for tag in soup(['script', 'style', 'img']):
-            tag.decompose()
-        return soup.get_text('\n').strip(), images
+class SelectolaxBackend:
+    """selectolax (lexbor) 解析，需要安装 selectolax"""
 
-    def _extract_tid_from_message(self, html: str) -> Optional[int]:
-        m = re.search(r'thread-(\d+)', html)
-        return int(m.group(1)) if m else None
+    name = 'selectolax'
+    SKIP_TAGS = LxmlBackend.SKIP_TAGS
+    PRESERVE_WHITESPACE = LxmlBackend.PRESERVE_WHITESPACE
 
-    def _format_message(self, post_data: Dict) -> str:
-        t = post_data.get('time', '')
-        if str(t).isdigit(): t = datetime.fromtimestamp(int(t)).strftime('%Y-%m-%d %H:%M:%S')
-        content = post_data.get('content', '')
-        if PREVIEW_LIMIT > 0: content = content[:PREVIEW_LIMIT]
-        return f"### {post_data.get('subject')}\n**作者**: {post_data.get('author')}  **时间**: {t}\n\n{content}\n\n[🔗 查看原帖]({post_data.get('url')})"
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
 
-    # ================= 通用图片上传 =================
-    def _universal_upload_image(self, img_url: str) -> str:
-        """
-        使用全局配置的AppID和Secret上传图片到图床
-        """
-        if not IMAGE_UPLOAD_APP_ID or not IMAGE_UPLOAD_APP_SECRET:
-            self.logger.warning("[图床] 未配置全局AppID/Secret，无法上传图片")
-            return img_url
+    def _collect(self, node) -> Tuple[List[str], List[Optional[str]]]:
+        strings, srcs = [], []
+        for child in node.traverse(include_text=True):
+            if child.tag == 'img':
+                srcs.append(_img_src(child.attributes))
+            elif child.tag == '-text':
+                ancestors, parent = [], child.parent
+                while parent is not None and parent is not node.parent:
+                    ancestors.append(parent.tag)
+                    parent = parent.parent
+                if self.SKIP_TAGS.intersection(ancestors):
+                    continue
+                preserve = bool(self.PRESERVE_WHITESPACE.intersection(ancestors))
+                strings.append(LxmlBackend._collapse(child.text(deep=False), preserve))
+        return strings, srcs
 
-        try:
-            headers = {"Referer": BASE_URL + "/", "User-Agent": self.session.headers.get("User-Agent")}
-            r = self.session.get(img_url, headers=headers, timeout=15)
+    def extract(self, html: str) -> Tuple[str, List[Optional[str]]]:
+        tree = self._parser(f"<div>{html}</div>")
+        root = tree.body.child if tree.body else None
+        if root is None:
+            return '', []
+        strings, srcs = self._collect(root)
+        return '\n'.join(strings), srcs
 
-            if r.status_code != 200:
-                self.logger.warning(f"[图床] 下载图片失败: HTTP {r.status_code}")
-                return img_url
+    def extract_node(self, html: str, tag: str, cls: str) -> Optional[Tuple[str, List[Optional[str]]]]:
+        node = self._parser(html).css_first(f"{tag}.{cls}")
+        if node is None:
+            return None
+        strings, srcs = self._collect(node)
+        return '\n'.join(strings), srcs
 
-            img_content = r.content
+HTML_BACKENDS = {
+    'selectolax': SelectolaxBackend,
+    'lxml': LxmlBackend,
+    'html.parser': StreamBackend,
+    'bs4': Bs4Backend,
+}
 
-            # 验证内容是否为空
-            if not img_content or len(img_content) < 100:
-                self.logger.warning(f"[图床] 下载的图片太小或为空: {len(img_content)} bytes")
-                return img_url
+# 启动时用于校验后端与参考实现一致的样例
+_HTML_SELF_CHECK = [
+    '<div class="quote"><blockquote>引用 <b>内容</b></blockquote></div>正文&nbsp;&amp;第二行<br />\r\n第三行\r\n结束'
+    '<img src="static/image/smiley/default/smile.gif" smilieid="1" border="0" alt="" />'
+    '<ignore_js_op><img id="aimg_1" aid="1" zoomfile="data/attachment/forum/a.jpg" file="data/attachment/forum/a.jpg" /></ignore_js_op>'
+    '<script type="text/javascript">var x = 1;</script>',
+    '<table cellspacing="0" cellpadding="0"><tr><td class="t_f" id="postmessage_1">\n  第一段<br />\n'
+    '<font color="red">红字</font> <img src="forum.php?mod=image&amp;aid=2&amp;w=500" />\n</td></tr></table>',
+]
 
-            # 严格验证：如果开头是 < !DOCTYPE 或 <html，说明下载的是网页报错
-            if img_content.strip().startswith(b'<'):
-                self.logger.warning(f"[图床] 下载到的是HTML页面(可能是防盗链或404): {img_url}")
-                return img_url
+def _backend_matches_reference(backend) -> bool:
+    reference = Bs4Backend()
+    for html in _HTML_SELF_CHECK:
+        if backend.extract(html) != reference.extract(html):
+            return False
+        if backend.extract_node(html, 'td', 't_f') != reference.extract_node(html, 'td', 't_f'):
+            return False
+    return True
 
-            # 检查是否是有效的图片格式
-            if not self._is_valid_image(img_content):
-                self.logger.warning("[图床] 图片格式无效或损坏")
-                return img_url
+def create_html_backend(name: str, logger: Optional[logging.Logger] = None):
+    """
+    创建HTML解析后端；auto 模式按 selectolax > lxml > html.parser 选择第一个可用且与参考实现一致的后端。
+    lxml/selectolax 会按 HTML5 规范把正文中的 CRLF 换行规范化为 LF，与参考实现不一致时 auto 不会选用，
+    显式指定时仅给出警告
+    """
+    candidates = ['selectolax', 'lxml', 'html.parser'] if name == 'auto' else [name]
+    for candidate in candidates:
+        backend_cls = HTML_BACKENDS.get(candidate)
+        if backend_cls is None:
+            if logger:
+                logger.warning(f"未知的HTML解析后端: {candidate}，使用 html.parser")
+            continue
+        try:
+            backend = backend_cls()
+        except ImportError:
+            continue
+        if not _backend_matches_reference(backend):
+            if name == 'auto':
+                if logger:
+                    logger.debug(f"HTML解析后端 {candidate} 输出与参考实现不一致，已跳过")
+                continue
+            if logger:
+                logger.warning(f"HTML解析后端 {candidate} 输出与 BeautifulSoup 不完全一致，推送内容可能有细微差异")
+        return backend
+    return StreamBackend()
 
-        except Exception as e:
-            self.logger.warning(f"[图床] 下载图片异常: {e}")
-            return img_url
+# ==================== 并发控制 ====================
 
-        # 确定MIME类型和扩展名
-        mime = 'image/jpeg'
-        ext = '.jpg'
-        if img_content.startswith(b'\x89PNG'): mime, ext = 'image/png', '.png'
-        elif img_content.startswith(b'GIF8'): mime, ext = 'image/gif', '.gif'
-        filename = f"img_{int(time.time())}_{random.randint(100,999)}{ext}"
+class HostLimiter:
+    """
+    按主机限制并发请求数，并保证同一主机相邻请求的最小间隔（礼貌限速）
+    """
 
-        # 使用配置的图床上传地址
-        for attempt in range(3):  # 最多重试3次
-            res = None  # 初始化res变量，避免作用域问题
-            try:
-                upload_url = IMAGE_UPLOAD_URL
+    def __init__(self, max_concurrency: int, min_interval: float = 0.0):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_interval = max(0.0, float(min_interval))
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._next_slot: Dict[str, float] = {}
 
-                # 构建multipart/form-data
-                files = {'image': (filename, img_content, mime)}
+    @contextmanager
+    def acquire(self, url: str):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            sem = self._semaphores.get(host)
+            if sem is None:
+                sem = self._semaphores[host] = threading.BoundedSemaphore(self.max_concurrency)
+        with sem:
+            if self.min_interval > 0:
+                # 预约下一个可用时间片，避免多个线程同时打到同一主机
+                with self._lock:
+                    now = time.monotonic()
+                    slot = max(now, self._next_slot.get(host, 0.0))
+                    self._next_slot[host] = slot + self.min_interval
+                if slot > now:
+                    time.sleep(slot - now)
+            yield
 
-                # 从上传URL解析域名用于设置请求头
-                from urllib.parse import urlparse
-                parsed_url = urlparse(upload_url)
-                domain = f"{parsed_url.scheme}://{parsed_url.netloc}"
+# ==================== HTTP 连接池 ====================
 
-                # 设置请求头
-                headers = {
-                    'Accept': 'application/json, text/javascript, */*; q=0.01',
-                    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                    'Connection': 'keep-alive',
-                    'Origin': domain,
-                    'Referer': domain + '/',
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'X-Requested-With': 'XMLHttpRequest',
-                    'Content-Type': None  # 让requests自动设置multipart边界
-                }
+class HttpClients:
+    """
+    按目标 (scheme, host) 复用 requests.Session，保持长连接并调大连接池
+    重试适配器只重试建连失败，请求已发出后的失败（可能已被处理）交给上层逻辑决定
+    """
 
-                self.logger.debug(f"[图床] 尝试上传 {filename} (尝试 {attempt + 1}/3)")
+    def __init__(self, pool_size: int, retries: int):
+        self.pool_size = max(1, pool_size)
+        self.retries = max(0, retries)
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, requests.Session] = {}
 
-                # 发送上传请求
-                upload_timeout = 60 if attempt == 0 else 45
-                res = requests.post(
-                    upload_url,
-                    files=files,
-                    headers=headers,
-                    timeout=upload_timeout,
-                    verify=False,
-                    allow_redirects=True
-                )
+    @staticmethod
+    def _origin(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
 
-                # 检查响应
+    def _mount(self, session: 'requests.Session'):
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        retry = Retry(total=None, connect=self.retries, read=0, status=0, backoff_factor=0.3)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    def register(self, url: str, session: 'requests.Session') -> 'requests.Session':
+        """为指定目标注册已有的 Session（如带 Cookie 的论坛会话）"""
+        self._mount(session)
+        with self._lock:
+            self._sessions[self._origin(url)] = session
+        return session
+
+    def for_url(self, url: str) -> 'requests.Session':
+        origin = self._origin(url)
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                self._mount(session)
+                self._sessions[origin] = session
+        return session
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            session.close()
+
+# ==================== 飞书凭据池 ====================
+
+class FeishuApp:
+    """单个飞书应用的凭据与近期上传记录"""
+
+    def __init__(self, app_id: str, app_secret: str):
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.token = ''
+        self.expire = 0.0
+        self.limited_until = 0.0
+        self.recent: deque = deque()
+        self.refresh_lock = threading.Lock()
+
+class FeishuCredentialPool:
+    """
+    飞书应用凭据池：多个应用分摊图片上传，优先选择近一分钟剩余额度最多、且没有被限流的应用
+    tenant_access_token 由后台线程提前刷新；同一应用的并发请求只会触发一次获取
+    """
+
+    def __init__(self, apps: List[Tuple[str, str]], fetch_token, rate_per_minute: int, refresh_ahead: float):
+        self.apps = [FeishuApp(app_id, app_secret) for app_id, app_secret in apps]
+        self.fetch_token = fetch_token
+        self.rate_per_minute = max(1, rate_per_minute)
+        self.refresh_ahead = refresh_ahead
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.apps)
+
+    def _refresh(self, app: FeishuApp, min_remaining: float) -> Optional[str]:
+        now = time.time()
+        if app.token and app.expire - now > min_remaining:
+            return app.token
+        with app.refresh_lock:
+            # 等锁期间其他线程可能已经刷新完成
+            now = time.time()
+            if app.token and app.expire - now > min_remaining:
+                return app.token
+            result = self.fetch_token(app.app_id, app.app_secret)
+            if result:
+                app.token, expire_in = result
+                app.expire = now + expire_in
+        return app.token if app.expire - time.time() > 60 else None
+
+    def token(self, app: FeishuApp) -> Optional[str]:
+        return self._refresh(app, 60)
+
+    def pick(self) -> Optional[FeishuApp]:
+        """选择本次上传使用的应用，并计入其额度"""
+        if not self.apps:
+            return None
+        now = time.time()
+        with self._lock:
+            for app in self.apps:
+                while app.recent and app.recent[0] < now - 60:
+                    app.recent.popleft()
+            available = [app for app in self.apps if app.limited_until <= now]
+            if available:
+                app = max(available, key=lambda a: self.rate_per_minute - len(a.recent))
+            else:
+                app = min(self.apps, key=lambda a: a.limited_until)
+            app.recent.append(now)
+            return app
+
+    def report_limited(self, app: FeishuApp, retry_after: float):
+        """记录应用被限流(429)，冷却期内不再优先使用"""
+        with self._lock:
+            app.limited_until = max(app.limited_until, time.time() + retry_after)
+
+    def start(self, logger: logging.Logger, interval: float = 60):
+        """启动后台刷新线程"""
+        if not self.apps or self._thread:
+            return
+
+        def refresh_loop():
+            while True:
+                for app in self.apps:
+                    try:
+                        self._refresh(app, self.refresh_ahead)
+                    except Exception as e:
+                        logger.error(f"[飞书] 后台刷新 Token 异常 ({app.app_id}): {e}")
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=refresh_loop, name='feishu-token', daemon=True)
+        self._thread.start()
+
+# ==================== 自适应调度 ====================
+
+class PollScheduler:
+    """
+    自适应轮询调度：按每个FID的发帖速率(EWMA)缩短活跃FID的间隔、放慢冷清FID，
+    并在 [最小间隔, 最大间隔] 范围内保证所有FID的请求总量不超过全局预算
+    """
+
+    ALPHA = 0.3          # EWMA 平滑系数
+    TARGET_POSTS = 1.0   # 期望每次轮询平均拿到的新帖数
+
+    def __init__(self, min_interval: float, max_interval: float, budget_per_minute: float):
+        self.min_interval = max(1.0, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.budget_per_minute = budget_per_minute
+
+    def observe(self, fid_state: Dict, count: int, now: float):
+        """记录一次轮询结果，更新发帖速率（帖/秒）"""
+        last_poll = fid_state.get('last_poll')
+        if last_poll and now > last_poll:
+            observed = count / (now - last_poll)
+            fid_state['rate'] = self.ALPHA * observed + (1 - self.ALPHA) * fid_state.get('rate', 0.0)
+        fid_state['last_poll'] = now
+
+    def _base_interval(self, rate: float) -> float:
+        if rate <= 0:
+            return self.max_interval
+        return min(self.max_interval, max(self.min_interval, self.TARGET_POSTS / rate))
+
+    def interval(self, fid_state: Dict, all_states: List[Dict]) -> float:
+        interval = self._base_interval(fid_state.get('rate', 0.0))
+        if self.budget_per_minute > 0:
+            demand = sum(60.0 / self._base_interval(st.get('rate', 0.0)) for st in all_states)
+            if demand > self.budget_per_minute:
+                interval = min(self.max_interval, interval * demand / self.budget_per_minute)
+        # 加入少量抖动，避免所有FID同时到期
+        return interval * random.uniform(0.9, 1.1)
+
+# ==================== 帖子详情缓存 ====================
+
+class TTLCache:
+    """线程安全、限制容量的短期缓存（LRU 淘汰）"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key, max_age: Optional[float] = None):
+        """读取缓存；max_age 可进一步限制可接受的缓存年龄"""
+        limit = self.ttl if max_age is None else min(self.ttl, max_age)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > limit:
+                if time.time() - stored_at > self.ttl:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+# ==================== 发送队列 ====================
+
+class TokenBucket:
+    """令牌桶限速器：rate_per_minute 为稳定速率，burst 为允许的突发数量"""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = max(float(rate_per_minute), 0.001) / 60.0
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+class Outbox:
+    """
+    持久化发送队列 (SQLite)
+    轮询线程只负责入队，发送线程按 webhook 顺序取出投递，失败后退避重试
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    fid INTEGER NOT NULL,
+                    pid INTEGER NOT NULL,
+                    webhook_key TEXT NOT NULL,
+                    webhook_config TEXT NOT NULL,
+                    post_data TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_error TEXT,
+                    UNIQUE (fid, pid, webhook_key)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (webhook_key, status, id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending_pid ON outbox (webhook_key, status, pid)")
+            # 分片模式下发送前先认领消息，避免多个 worker 重复发送
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+            if 'claimed_by' not in columns:
+                self._conn.execute("ALTER TABLE outbox ADD COLUMN claimed_by TEXT")
+                self._conn.execute("ALTER TABLE outbox ADD COLUMN claim_expires REAL NOT NULL DEFAULT 0")
+
+    def enqueue(self, fid: int, pid: int, webhook_config: Dict, post_data: Dict,
+                webhook_key: Optional[str] = None) -> bool:
+        """入队，同一 (fid, pid, 队列键) 只会入队一次；队列键默认为 webhook 地址"""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO outbox (fid, pid, webhook_key, webhook_config, post_data, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (fid, pid, webhook_key or webhook_config.get('webhook_url', ''),
+                 json.dumps(webhook_config, ensure_ascii=False),
+                 json.dumps(post_data, ensure_ascii=False), time.time())
+            )
+            return cur.rowcount > 0
+
+    @staticmethod
+    def _held_filter(held: Optional[set]) -> Tuple[str, list]:
+        """跳过暂停推送的FID（断档补抓完成前）"""
+        if not held:
+            return '', []
+        return f" AND fid NOT IN ({','.join('?' * len(held))})", sorted(held)
+
+    @staticmethod
+    def _shard_filter(fids: Optional[set], owner: Optional[str]) -> Tuple[str, list]:
+        """分片模式：只处理本 worker 持有的FID，且跳过其他 worker 认领中的消息"""
+        if fids is None:
+            return '', []
+        placeholders = ','.join('?' * len(fids)) or 'NULL'
+        sql = f" AND fid IN ({placeholders}) AND (claimed_by IS NULL OR claimed_by = ? OR claim_expires < ?)"
+        return sql, sorted(fids) + [owner, time.time()]
+
+    def next_pending(self, webhook_key: str, fids: Optional[set] = None, owner: Optional[str] = None,
+                     held: Optional[set] = None) -> Optional[Dict]:
+        """
+        取出该 webhook 最早的待发送消息：按 PID 顺序投递（PID 全站递增），
+        补抓找回的旧帖即使入队较晚也排在更新的帖子之前
+        """
+        shard_sql, shard_args = self._shard_filter(fids, owner)
+        held_sql, held_args = self._held_filter(held)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT * FROM outbox WHERE webhook_key = ? AND status = 'pending'{shard_sql}{held_sql} "
+                f"ORDER BY pid, id LIMIT 1",
+                [webhook_key] + shard_args + held_args
+            ).fetchone()
+        if not row:
+            return None
+        item = dict(row)
+        item['webhook_config'] = json.loads(item['webhook_config'])
+        item['post_data'] = json.loads(item['post_data'])
+        return item
+
+    def pending_batch(self, webhook_key: str, limit: int, fids: Optional[set] = None,
+                      owner: Optional[str] = None, held: Optional[set] = None) -> List[Dict]:
+        """按 PID 顺序取出该 webhook 当前可发送的多条消息（摘要模式）"""
+        shard_sql, shard_args = self._shard_filter(fids, owner)
+        held_sql, held_args = self._held_filter(held)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM outbox WHERE webhook_key = ? AND status = 'pending' AND next_attempt <= ?"
+                f"{shard_sql}{held_sql} ORDER BY pid, id LIMIT ?",
+                [webhook_key, time.time()] + shard_args + held_args + [limit]
+            ).fetchall()
+        items = []
+        for row in rows:
+            item = dict(row)
+            item['webhook_config'] = json.loads(item['webhook_config'])
+            item['post_data'] = json.loads(item['post_data'])
+            items.append(item)
+        return items
+
+    def pending_keys(self, fids: Optional[set] = None, owner: Optional[str] = None) -> List[str]:
+        shard_sql, shard_args = self._shard_filter(fids, owner)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT webhook_key FROM outbox WHERE status = 'pending'{shard_sql}", shard_args
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def due_keys(self, fids: Optional[set] = None, owner: Optional[str] = None,
+                 held: Optional[set] = None) -> List[str]:
+        """队首消息已到发送时间的 webhook，即发送线程仍有工作要做"""
+        shard_sql, shard_args = self._shard_filter(fids, owner)
+        held_sql, held_args = self._held_filter(held)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT webhook_key, next_attempt FROM outbox WHERE status = 'pending'{shard_sql}{held_sql} "
+                f"ORDER BY pid, id",
+                shard_args + held_args
+            ).fetchall()
+        heads: Dict[str, float] = {}
+        for webhook_key, next_attempt in rows:
+            heads.setdefault(webhook_key, next_attempt)
+        now = time.time()
+        return [key for key, next_attempt in heads.items() if next_attempt <= now]
+
+    def claim(self, item_id: int, owner: str, ttl: float) -> bool:
+        """认领一条待发送消息，认领期内其他 worker 不会发送它"""
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE outbox SET claimed_by = ?, claim_expires = ? WHERE id = ? AND status = 'pending' "
+                "AND (claimed_by IS NULL OR claimed_by = ? OR claim_expires < ?)",
+                (owner, now + ttl, item_id, owner, now)
+            )
+            return cur.rowcount > 0
+
+    def mark_sent(self, item_id: int):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'sent', last_error = NULL, claimed_by = NULL WHERE id = ?", (item_id,)
+            )
+
+    def mark_retry(self, item_id: int, error: str, next_attempt: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt = ?, last_error = ?, claimed_by = NULL "
+                "WHERE id = ?",
+                (next_attempt, error, item_id)
+            )
+
+    def mark_dead(self, item_id: int, error: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'dead', attempts = attempts + 1, last_error = ?, claimed_by = NULL "
+                "WHERE id = ?",
+                (error, item_id)
+            )
+
+    def import_pending(self, path: str) -> int:
+        """
+        导入另一个发送队列文件中尚未发送的消息（首次启用分片时迁移原有 outbox.db）
+        导入的消息在原文件中标记为 migrated，不会被重复导入；同一 (fid, pid, 队列键) 已存在时跳过
+        """
+        columns = 'fid, pid, webhook_key, webhook_config, post_data, attempts, next_attempt, created_at, last_error'
+        with self._lock, self._conn:
+            self._conn.execute("ATTACH DATABASE ? AS legacy", (path,))
+        try:
+            with self._lock, self._conn:
+                cur = self._conn.execute(
+                    f"INSERT OR IGNORE INTO outbox ({columns}) SELECT {columns} FROM legacy.outbox "
+                    f"WHERE status = 'pending' ORDER BY id"
+                )
+                self._conn.execute("UPDATE legacy.outbox SET status = 'migrated' WHERE status = 'pending'")
+                return cur.rowcount
+        finally:
+            with self._lock:
+                self._conn.execute("DETACH DATABASE legacy")
+
+    def purge(self, older_than: float):
+        """清理已完成的历史消息"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM outbox WHERE status != 'pending' AND created_at < ?", (older_than,))
+
+def _webhook_url(webhook_key: str) -> str:
+    """由发送队列键得到 webhook 地址（图片补发队列的键带有后缀）"""
+    if webhook_key.endswith(FOLLOWUP_KEY_SUFFIX):
+        return webhook_key[:-len(FOLLOWUP_KEY_SUFFIX)]
+    return webhook_key
+
+# ==================== 图片上传缓存 ====================
+
+# 支持的图片格式：格式名 -> (MIME, 扩展名)
+IMAGE_FORMATS = {
+    'png': ('image/png', '.png'),
+    'jpeg': ('image/jpeg', '.jpg'),
+    'gif': ('image/gif', '.gif'),
+    'bmp': ('image/bmp', '.bmp'),
+    'webp': ('image/webp', '.webp'),
+}
+
+def _sniff_image_format(head: bytes) -> Optional[str]:
+    """按文件头识别图片格式，无法识别返回 None"""
+    if head[:4] == b'\x89PNG':
+        return 'png'
+    if head[:2] == b'\xFF\xD8':
+        return 'jpeg'
+    if head[:4] == b'GIF8':
+        return 'gif'
+    if head[:2] == b'BM':
+        return 'bmp'
+    if len(head) > 12 and head[:4] == b'RIFF' and b'WEBP' in head[8:12]:
+        return 'webp'
+    return None
+
+def _transcode_image(data: bytes, img_format: str, max_dimension: int, target_format: str,
+                     quality: int, min_bytes: int) -> Optional[Tuple[bytes, str]]:
+    """
+    在进程池中运行：超过最大边长的图片等比缩小，较大的 PNG/BMP 重新编码为 JPEG/WebP，输出不带元数据。
+    动图保持原样；无需处理或处理后反而更大时返回 None
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        if getattr(img, 'is_animated', False):
+            return None
+        resize = max(img.size) > max_dimension
+        reencode = img_format in ('png', 'bmp') and len(data) >= min_bytes
+        if not resize and not reencode:
+            return None
+
+        img.load()
+        out_img = img
+        if resize:
+            out_img = img.copy()
+            out_img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        # 只缩放时保留原格式；GIF/BMP 以及需要重新编码的大图使用目标格式
+        if not reencode and img_format in ('jpeg', 'png', 'webp'):
+            out_format = img_format
+        else:
+            out_format = target_format
+        has_alpha = out_img.mode in ('RGBA', 'LA') or (out_img.mode == 'P' and 'transparency' in out_img.info)
+        if has_alpha and out_format == 'jpeg':
+            # JPEG 不支持透明通道，保留 PNG
+            out_format = 'png'
+
+        if out_format == 'jpeg' and out_img.mode not in ('RGB', 'L'):
+            out_img = out_img.convert('RGB')
+
+        buffer = io.BytesIO()
+        if out_format == 'jpeg':
+            out_img.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+        elif out_format == 'webp':
+            out_img.save(buffer, 'WEBP', quality=quality, method=4)
+        else:
+            out_img.save(buffer, 'PNG', optimize=True)
+
+    result = buffer.getvalue()
+    if len(result) >= len(data):
+        return None
+    return result, out_format
+
+def _normalize_image_url(url: str) -> str:
+    """规范化图片URL：协议/域名小写、参数排序、去除锚点"""
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ''))
+
+def _atomic_write_json(path: str, data, indent: Optional[int] = None):
+    """写入临时文件并 fsync 后原子替换，崩溃时不会留下空文件或半截文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # 同步目录项，确保 rename 本身落盘
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+class ImageCache:
+    """
+    图片上传结果缓存
+    - 同时按规范化URL和图片内容SHA-256索引，映射到飞书 image_key 或图床URL
+    - 持久化到磁盘，LRU + TTL 淘汰，重启后仍然有效
+    - 记录已知失败（防盗链HTML、非法图片文件等），冷却期内不再重复下载
+    """
+
+    FLUSH_INTERVAL = 10
+
+    def __init__(self, path: str, max_entries: int, ttl: float, failure_cooldown: float, logger: logging.Logger):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.failure_cooldown = failure_cooldown
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._dirty = False
+        self._last_flush = time.time()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            now = time.time()
+            for key, entry in data.items():
+                if not self._expired(entry, now):
+                    self._entries[key] = entry
+            self.logger.info(f"[图片缓存] 已加载 {len(self._entries)} 条记录")
+        except Exception as e:
+            self.logger.warning(f"[图片缓存] 加载失败，将重新建立缓存: {e}")
+
+    def _expired(self, entry: Dict, now: float) -> bool:
+        limit = self.failure_cooldown if 'error' in entry else self.ttl
+        return limit > 0 and now - entry.get('ts', 0) > limit
+
+    def _get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry, time.time()):
+            del self._entries[key]
+            self._dirty = True
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key: str, entry: Dict):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def lookup(self, backend: str, url: Optional[str] = None, digest: Optional[str] = None) -> Optional[str]:
+        """按URL或内容摘要查找上传结果；摘要命中时顺带补记URL索引"""
+        with self._lock:
+            url_key = f"{backend}|url|{_normalize_image_url(url)}" if url else None
+            if url_key:
+                entry = self._get(url_key)
+                if entry:
+                    return entry['value']
+            if digest:
+                entry = self._get(f"{backend}|sha|{digest}")
+                if entry:
+                    if url_key:
+                        self._put(url_key, {'value': entry['value'], 'ts': entry['ts']})
+                    return entry['value']
+        return None
+
+    def store(self, backend: str, value: str, url: Optional[str] = None, digest: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            if url:
+                self._put(f"{backend}|url|{_normalize_image_url(url)}", {'value': value, 'ts': now})
+            if digest:
+                self._put(f"{backend}|sha|{digest}", {'value': value, 'ts': now})
+        self.maybe_flush()
+
+    def failure(self, url: str, *scopes: str) -> Optional[str]:
+        """返回冷却期内记录的失败原因，无记录返回 None"""
+        normalized = _normalize_image_url(url)
+        with self._lock:
+            for scope in scopes:
+                entry = self._get(f"{scope}|fail|{normalized}")
+                if entry:
+                    return entry['error']
+        return None
+
+    def mark_failure(self, scope: str, url: str, reason: str):
+        with self._lock:
+            self._put(f"{scope}|fail|{_normalize_image_url(url)}", {'error': reason, 'ts': time.time()})
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if self._dirty and time.time() - self._last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self._entries)
+            self._dirty = False
+            self._last_flush = time.time()
+        try:
+            _atomic_write_json(self.path, snapshot)
+        except Exception as e:
+            self.logger.error(f"[图片缓存] 保存失败: {e}")
+
+# ==================== 内容指纹去重 ====================
+
+def content_fingerprint(text: str, images: List[str]) -> Optional[int]:
+    """
+    64 位 SimHash：特征为去除空白后的正文 3-gram 以及规范化后的图片URL（权重更高）
+    正文过短且没有图片时返回 None
+    """
+    text = re.sub(r'\s+', '', text or '')
+    if len(text) < FINGERPRINT_MIN_TEXT and not images:
+        return None
+    features = _FeatureCounter(text[i:i + 3] for i in range(max(1, len(text) - 2)))
+    for url in images:
+        features['img|' + _normalize_image_url(url)] += 3
+
+    weights = [0] * 64
+    for feature, weight in features.items():
+        h = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for i in range(64):
+            weights[i] += weight if (h >> i) & 1 else -weight
+    return sum(1 << i for i in range(64) if weights[i] > 0)
+
+class FingerprintIndex:
+    """
+    内容指纹索引：记录每个指纹首次出现的 FID/PID，按汉明距离查找近似重复
+    64 位指纹切成 4 段分桶，距离不超过 3 时至少有一段完全相同，只需比较同桶的候选
+    LRU + TTL 淘汰，定期持久化
+    """
+
+    FLUSH_INTERVAL = 10
+    BANDS = 4
+
+    def __init__(self, path: str, max_entries: int, ttl: float, max_distance: int, logger: logging.Logger):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.max_distance = max(0, min(max_distance, self.BANDS - 1))
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._bands: Dict[Tuple[int, int], set] = {}
+        self._dirty = False
+        self._last_flush = time.time()
+        self._load()
+
+    def _band_keys(self, fp: int) -> List[Tuple[int, int]]:
+        width = 64 // self.BANDS
+        return [(i, (fp >> (i * width)) & ((1 << width) - 1)) for i in range(self.BANDS)]
+
+    def _add(self, fp: int, entry: Dict):
+        self._entries[fp] = entry
+        self._entries.move_to_end(fp)
+        for key in self._band_keys(fp):
+            self._bands.setdefault(key, set()).add(fp)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, fp: int):
+        self._entries.pop(fp, None)
+        for key in self._band_keys(fp):
+            bucket = self._bands.get(key)
+            if bucket:
+                bucket.discard(fp)
+                if not bucket:
+                    del self._bands[key]
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            now = time.time()
+            for fp_hex, entry in data.items():
+                if not (self.ttl > 0 and now - entry.get('ts', 0) > self.ttl):
+                    self._add(int(fp_hex, 16), entry)
+            self.logger.info(f"[内容去重] 已加载 {len(self._entries)} 条指纹")
+        except Exception as e:
+            self.logger.warning(f"[内容去重] 加载失败，将重新建立索引: {e}")
+
+    def check(self, fp: int, fid: int, pid: int) -> Optional[Dict]:
+        """
+        查找近似重复：命中时返回首次出现的记录 {'fid', 'pid', 'url', 'ts'}；未命中时登记该指纹并返回 None
+        """
+        now = time.time()
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(fp):
+                candidates |= self._bands.get(key, set())
+            for other in sorted(candidates, key=lambda c: bin(c ^ fp).count('1')):
+                if bin(other ^ fp).count('1') > self.max_distance:
+                    break
+                entry = self._entries[other]
+                if self.ttl > 0 and now - entry.get('ts', 0) > self.ttl:
+                    self._remove(other)
+                    self._dirty = True
+                    continue
+                if entry.get('pid') == pid:
+                    # 同一帖子重复检出（如游标回退），交给发送队列去重
+                    return None
+                self._entries.move_to_end(other)
+                return entry
+            self._add(fp, {'fid': fid, 'pid': pid, 'ts': now})
+            self._dirty = True
+        self.maybe_flush()
+        return None
+
+    def maybe_flush(self):
+        if self._dirty and time.time() - self._last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = {f"{fp:016x}": entry for fp, entry in self._entries.items()}
+            self._dirty = False
+            self._last_flush = time.time()
+        try:
+            _atomic_write_json(self.path, snapshot)
+        except Exception as e:
+            self.logger.error(f"[内容去重] 保存失败: {e}")
+
+# ==================== 状态持久化 ====================
+
+def _normalize_fid_state(value) -> Dict:
+    """兼容旧格式（直接保存 last_pid 数字）的单个FID状态"""
+    if not isinstance(value, dict):
+        return {'last_pid': int(value), 'last_tid': 0}
+    fid_state = {'last_pid': int(value.get('last_pid') or 0), 'last_tid': int(value.get('last_tid') or 0)}
+    # 调度信息：发帖速率、上次/下次轮询时间
+    for key in ('rate', 'last_poll', 'next_poll'):
+        if value.get(key) is not None:
+            fid_state[key] = float(value[key])
+    # 待补抓的断档：[[last_pid, 断档上界pid, 起始时间], ...]
+    gaps = value.get('gaps')
+    if isinstance(gaps, str):
+        gaps = json.loads(gaps)
+    if gaps:
+        fid_state['gaps'] = [[int(lo), int(hi), float(since)] for lo, hi, since in gaps]
+    return fid_state
+
+class JsonStateStore:
+    """
+    JSON 状态文件：整体快照写入临时文件，fsync 后原子替换，崩溃时不会留下半截文件
+    """
+
+    name = 'json'
+
+    def __init__(self, path: str, logger: logging.Logger):
+        self.path = path
+        self.logger = logger
+
+    def load(self) -> Dict[int, Dict]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            return {int(k): _normalize_fid_state(v) for k, v in raw.items()}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            # 文件损坏时保留现场，避免被下一次保存覆盖
+            corrupt_path = f"{self.path}.corrupt-{int(time.time())}"
+            self.logger.error(f"状态文件损坏，已另存为 {corrupt_path}，所有FID将从头开始: {e}")
+            try:
+                os.replace(self.path, corrupt_path)
+            except OSError:
+                pass
+            return {}
+
+    def save(self, state: Dict[int, Dict], dirty: set):
+        if not self.path:
+            return
+        _atomic_write_json(self.path, state, indent=2)
+
+    def close(self):
+        pass
+
+class SqliteStateStore:
+    """
+    SQLite 状态库：每个FID一行（游标 + 调度信息），只写入有变化的FID
+    可以与发送队列使用同一个数据库文件；指定 lease_owner 时只写入该 worker 持有租约的FID（分片模式）
+    """
+
+    name = 'sqlite'
+    COLUMNS = ('last_pid', 'last_tid', 'rate', 'last_poll', 'next_poll', 'gaps')
+
+    def __init__(self, path: str, logger: logging.Logger, legacy_json: Optional[str] = None,
+                 lease_owner: Optional[str] = None):
+        self.logger = logger
+        self.lease_owner = lease_owner
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ':memory:', check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS fid_state (
+                    fid INTEGER PRIMARY KEY,
+                    last_pid INTEGER NOT NULL DEFAULT 0,
+                    last_tid INTEGER NOT NULL DEFAULT 0,
+                    rate REAL,
+                    last_poll REAL,
+                    next_poll REAL,
+                    gaps TEXT,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(fid_state)")}
+            if 'gaps' not in columns:
+                self._conn.execute("ALTER TABLE fid_state ADD COLUMN gaps TEXT")
+        if legacy_json and os.path.exists(legacy_json) and not self.load():
+            # 首次切换到 SQLite 时导入原有 JSON 状态
+            state = JsonStateStore(legacy_json, logger).load()
+            if state:
+                self.save(state, set(state))
+                self.logger.info(f"已从 {legacy_json} 导入 {len(state)} 个FID的状态")
+
+    def load(self) -> Dict[int, Dict]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT fid, {', '.join(self.COLUMNS)} FROM fid_state").fetchall()
+        return {row[0]: _normalize_fid_state(dict(zip(self.COLUMNS, row[1:]))) for row in rows}
+
+    def save(self, state: Dict[int, Dict], dirty: set):
+        now = time.time()
+        rows = [
+            (fid,) + tuple(self._column_value(state[fid], col) for col in self.COLUMNS) + (now,)
+            for fid in dirty if fid in state
+        ]
+        if not rows:
+            return
+        updates = ', '.join(f"{col} = excluded.{col}" for col in self.COLUMNS + ('updated_at',))
+        columns = f"fid, {', '.join(self.COLUMNS)}, updated_at"
+        placeholders = ', '.join('?' * (len(self.COLUMNS) + 2))
+        if self.lease_owner:
+            # 租约已转移的FID不再写入，避免覆盖新持有者的游标
+            sql = (f"INSERT INTO fid_state ({columns}) SELECT {placeholders} "
+                   f"WHERE EXISTS (SELECT 1 FROM fid_leases WHERE fid = ? AND owner = ?) "
+                   f"ON CONFLICT(fid) DO UPDATE SET {updates}")
+            rows = [row + (row[0], self.lease_owner) for row in rows]
+        else:
+            sql = f"INSERT INTO fid_state ({columns}) VALUES ({placeholders}) ON CONFLICT(fid) DO UPDATE SET {updates}"
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+
+    def import_missing(self, state: Dict[int, Dict]) -> int:
+        """导入状态库中还没有记录的FID（不检查租约，已有记录的FID保持不变），返回导入数"""
+        columns = f"fid, {', '.join(self.COLUMNS)}, updated_at"
+        placeholders = ', '.join('?' * (len(self.COLUMNS) + 2))
+        now = time.time()
+        rows = [(fid,) + tuple(self._column_value(fid_state, col) for col in self.COLUMNS) + (now,)
+                for fid, fid_state in state.items()]
+        with self._lock, self._conn:
+            cur = self._conn.executemany(
+                f"INSERT INTO fid_state ({columns}) VALUES ({placeholders}) ON CONFLICT(fid) DO NOTHING", rows
+            )
+            return cur.rowcount
+
+    @staticmethod
+    def _column_value(fid_state: Dict, col: str):
+        if col == 'gaps':
+            return json.dumps(fid_state['gaps']) if fid_state.get('gaps') else None
+        return fid_state.get(col, 0 if col in ('last_pid', 'last_tid') else None)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def create_state_store(backend: str, path: str, logger: logging.Logger):
+    """按配置创建状态存储；sqlite 后端沿用 .json 路径时自动改用同名 .db 并导入旧状态"""
+    if backend == 'sqlite':
+        if path.endswith('.json'):
+            return SqliteStateStore(path[:-len('.json')] + '.db', logger, legacy_json=path)
+        return SqliteStateStore(path, logger)
+    if backend != 'json':
+        logger.warning(f"未知的状态存储后端 {backend}，使用 json")
+    return JsonStateStore(path, logger)
+
+# ==================== 分片协调 ====================
+
+class ShardCoordinator:
+    """
+    多 worker 分片：在共享 SQLite 文件中用租约分配FID
+    每个FID同一时刻只属于一个 worker；worker 定期续约并按存活 worker 数均分FID，
+    失联超过租约时间的 worker 所持有的FID由其他 worker 接管
+    """
+
+    def __init__(self, path: str, worker_id: str, fids: List[int], ttl: float):
+        self.worker_id = worker_id
+        self.fids = sorted(set(fids))
+        self.ttl = max(5.0, ttl)
+        self._lock = threading.Lock()
+        self._owned: set = set()
+        # isolation_level=None：手动 BEGIN IMMEDIATE，保证多进程间的认领是原子的
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS shard_workers (worker_id TEXT PRIMARY KEY, heartbeat REAL NOT NULL)"
+            )
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS fid_leases (
+                    fid INTEGER PRIMARY KEY,
+                    owner TEXT,
+                    expires REAL NOT NULL DEFAULT 0,
+                    epoch INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+    def owned(self) -> set:
+        with self._lock:
+            return set(self._owned)
+
+    def rebalance(self, busy: set = frozenset()) -> Tuple[set, set]:
+        """
+        心跳 + 续约 + 均衡，返回 (新获得的FID, 释放的FID)
+        busy 中的FID（正在轮询）本轮不会被释放
+        """
+        now = time.time()
+        me = self.worker_id
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO shard_workers (worker_id, heartbeat) VALUES (?, ?) "
+                    "ON CONFLICT(worker_id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                    (me, now)
+                )
+                conn.execute("DELETE FROM shard_workers WHERE heartbeat < ?", (now - self.ttl,))
+                live = conn.execute("SELECT COUNT(*) FROM shard_workers").fetchone()[0]
+                quota = math.ceil(len(self.fids) / max(1, live))
+
+                conn.execute("UPDATE fid_leases SET expires = ? WHERE owner = ?", (now + self.ttl, me))
+                owned = {row[0] for row in conn.execute("SELECT fid FROM fid_leases WHERE owner = ?", (me,))}
+                owned &= set(self.fids)
+
+                released = set()
+                for fid in sorted(owned - busy, reverse=True):
+                    if len(owned) - len(released) <= quota:
+                        break
+                    released.add(fid)
+                for fid in released:
+                    conn.execute("UPDATE fid_leases SET owner = NULL, expires = 0 WHERE fid = ? AND owner = ?", (fid, me))
+
+                acquired = set()
+                for fid in self.fids:
+                    if len(owned) - len(released) + len(acquired) >= quota:
+                        break
+                    if fid in owned:
+                        continue
+                    conn.execute("INSERT OR IGNORE INTO fid_leases (fid) VALUES (?)", (fid,))
+                    cur = conn.execute(
+                        "UPDATE fid_leases SET owner = ?, expires = ?, epoch = epoch + 1 "
+                        "WHERE fid = ? AND (owner IS NULL OR expires < ?)",
+                        (me, now + self.ttl, fid, now)
+                    )
+                    if cur.rowcount:
+                        acquired.add(fid)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._owned = (owned - released) | acquired
+        return acquired, released
+
+    def set_fids(self, fids: List[int]) -> set:
+        """配置热更新：替换参与分配的FID，不再监控的FID立即释放租约，返回被释放的FID"""
+        with self._lock:
+            removed = set(self.fids) - set(fids)
+            self.fids = sorted(set(fids))
+            self._conn.execute("BEGIN IMMEDIATE")
+            for fid in removed:
+                self._conn.execute(
+                    "UPDATE fid_leases SET owner = NULL, expires = 0 WHERE fid = ? AND owner = ?", (fid, self.worker_id)
+                )
+            self._conn.execute("COMMIT")
+            released = self._owned & removed
+            self._owned -= removed
+        return released
+
+    def release_all(self):
+        """正常退出时立即释放租约，其他 worker 无需等待租约过期"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("UPDATE fid_leases SET owner = NULL, expires = 0 WHERE owner = ?", (self.worker_id,))
+            self._conn.execute("DELETE FROM shard_workers WHERE worker_id = ?", (self.worker_id,))
+            self._conn.execute("COMMIT")
+            self._owned = set()
+
+# ==================== 监控指标 ====================
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class _Metric:
+    """Prometheus 风格指标基类，按标签值分组存储"""
+
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = '') -> str:
+        pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value) -> List[str]:
+        return [f"{self.name}{self._format_labels(key)} {value}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Optional[Tuple[float, ...]] = None):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, **labels)
+
+    def _render_value(self, key, value) -> List[str]:
+        counts, total, count = value
+        lines = []
+        for bound, bucket_count in zip(self.buckets, counts):
+            le = 'le="%s"' % bound
+            lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {bucket_count}")
+        le = 'le="+Inf"'
+        lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {count}")
+        lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+        lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """指标注册表，输出 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+METRICS = MetricsRegistry()
+
+POLL_REQUESTS = METRICS.register(Counter(
+    'sentinel_poll_requests_total', 'livelastpost 请求结果', ('fid', 'result')))
+POLL_RETRIES = METRICS.register(Counter(
+    'sentinel_poll_retries_total', 'livelastpost 重试次数', ('fid', 'reason')))
+POLL_DURATION = METRICS.register(Histogram(
+    'sentinel_poll_duration_seconds', 'livelastpost 耗时(含重试)', ('fid',)))
+THREAD_DETAIL_REQUESTS = METRICS.register(Counter(
+    'sentinel_thread_detail_requests_total', '帖子详情获取次数', ('source',)))
+THREAD_FALLBACKS = METRICS.register(Counter(
+    'sentinel_thread_fallback_total', '帖子详情获取失败、改用 livelastpost 摘要的次数', ('reason',)))
+SOURCE_REQUESTS = METRICS.register(Counter(
+    'sentinel_source_requests_total', '各轮询数据源发出的论坛请求(含详情)', ('source',)))
+SOURCE_POSTS = METRICS.register(Counter(
+    'sentinel_source_posts_total', '各轮询数据源发现的新帖', ('source',)))
+BACKFILL_POSTS = METRICS.register(Counter(
+    'sentinel_backfill_posts_total', '断档补抓找回的帖子', ('fid',)))
+IMAGE_DOWNLOADS = METRICS.register(Counter(
+    'sentinel_image_download_total', '图片下载结果', ('result',)))
+IMAGE_DOWNLOAD_DURATION = METRICS.register(Histogram(
+    'sentinel_image_download_duration_seconds', '图片下载耗时'))
+IMAGE_UPLOADS = METRICS.register(Counter(
+    'sentinel_image_upload_total', '图片上传结果(cache 为命中上传缓存)', ('backend', 'result')))
+IMAGE_UPLOAD_DURATION = METRICS.register(Histogram(
+    'sentinel_image_upload_duration_seconds', '图片上传耗时', ('backend',)))
+IMAGE_TRANSCODE_SAVED = METRICS.register(Counter(
+    'sentinel_image_transcode_saved_bytes_total', '上传前压缩/转码节省的字节数'))
+FEISHU_TOKEN_REFRESHES = METRICS.register(Counter(
+    'sentinel_feishu_token_refresh_total', '飞书 tenant_access_token 刷新次数', ('result',)))
+DUPLICATE_POSTS = METRICS.register(Counter(
+    'sentinel_duplicate_posts_total', '内容指纹命中的重复帖子', ('fid', 'policy')))
+WEBHOOK_SENDS = METRICS.register(Counter(
+    'sentinel_webhook_send_total', 'Webhook 发送结果', ('type', 'result')))
+WEBHOOK_SEND_DURATION = METRICS.register(Histogram(
+    'sentinel_webhook_send_duration_seconds', 'Webhook 发送耗时', ('type',)))
+CIRCUIT_STATE = METRICS.register(Gauge(
+    'sentinel_circuit_state', '端点熔断状态(0 关闭 / 1 打开 / 2 半开)', ('endpoint',)))
+CIRCUIT_REJECTIONS = METRICS.register(Counter(
+    'sentinel_circuit_rejections_total', '熔断打开期间被快速拒绝的调用', ('endpoint',)))
+DELIVERY_LAG = METRICS.register(Histogram(
+    'sentinel_delivery_lag_seconds', '从帖子发布时间（论坛 dateline）到推送成功的端到端延迟', ('fid',),
+    buckets=(5, 10, 30, 60, 120, 300, 600, 1800, 3600)))
+
+def start_metrics_server(host: str, port: int, registry: MetricsRegistry = METRICS) -> 'ThreadingHTTPServer':
+    """在后台线程启动 /metrics HTTP 端点"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if urlsplit(self.path).path != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+# ==================== 熔断器 ====================
+
+class CircuitOpenError(Exception):
+    """熔断打开期间快速失败"""
+
+class DeliveryRejected(Exception):
+    """Webhook 明确拒收该消息，重试也不会成功"""
+
+class _BreakerCall:
+    """一次受熔断保护的调用；调用方按响应设置 failed（如 HTTP 5xx）"""
+
+    __slots__ = ('failed',)
+
+    def __init__(self):
+        self.failed = False
+
+class CircuitBreaker:
+    """
+    单个端点的熔断器：连续失败 failure_threshold 次后打开，打开期间直接拒绝调用；
+    冷却 reset_timeout 秒后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+    STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float,
+                 logger: Optional[logging.Logger] = None):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.logger = logger
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        CIRCUIT_STATE.set(0, endpoint=name)
+
+    def _transition(self, state: str):
+        self.state = state
+        CIRCUIT_STATE.set(self.STATE_VALUES[state], endpoint=self.name)
+        if self.logger:
+            messages = {
+                self.OPEN: f"[熔断] {self.name} 连续失败，{self.reset_timeout:.0f} 秒内快速失败",
+                self.HALF_OPEN: f"[熔断] {self.name} 冷却结束，放行探测请求",
+                self.CLOSED: f"[熔断] {self.name} 已恢复",
+            }
+            (self.logger.warning if state == self.OPEN else self.logger.info)(messages[state])
+
+    def available(self) -> bool:
+        """当前是否可以发起调用（不占用半开探测名额），用于提前走降级路径"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return time.time() - self._opened_at >= self.reset_timeout
+            return not self._probing
+
+    def retry_in(self) -> float:
+        """距离允许探测还有多少秒"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.time())
+
+    def allow(self) -> bool:
+        """申请发起一次调用；半开状态下只有第一个申请者获得探测名额"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._failures = 0
+                if self.state != self.CLOSED:
+                    self._transition(self.CLOSED)
+                return
+            self._failures += 1
+            if self.state != self.CLOSED or self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+                if self.state != self.OPEN:
+                    self._transition(self.OPEN)
+
+    @contextmanager
+    def guard(self):
+        """
+        包裹一次调用：熔断打开时抛出 CircuitOpenError；
+        网络异常或调用方标记 failed 计为失败，其余情况计为成功
+        """
+        if not self.allow():
+            CIRCUIT_REJECTIONS.inc(endpoint=self.name)
+            raise CircuitOpenError(self.name)
+        call = _BreakerCall()
+        try:
+            yield call
+        except requests.exceptions.RequestException:
+            self.record(False)
+            raise
+        except BaseException:
+            self.record(not call.failed)
+            raise
+        self.record(not call.failed)
+
+class CircuitBreakers:
+    """按端点懒创建熔断器：论坛、图床、飞书开放平台按主机区分，webhook 按地址区分"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, logger: logging.Logger):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(
+                    name, self.failure_threshold, self.reset_timeout, self.logger
+                )
+            return breaker
+
+    def for_url(self, url: str) -> CircuitBreaker:
+        return self.get(urlparse(url).netloc)
+
+    def for_webhook(self, webhook_url: str) -> CircuitBreaker:
+        # webhook 地址中含有令牌，指标里只使用摘要
+        return self.get(f"webhook-{hashlib.sha1(webhook_url.encode('utf-8')).hexdigest()[:8]}")
+
+# ==================== 轮询数据源 ====================
+
+class LivelastpostSource:
+    """livelastpost 接口：每个FID一次请求，包含主题与回复"""
+
+    name = 'livelastpost'
+    batch = False
+    replies = True
+
+    def __init__(self, sentinel: 'DiscuzSentinel'):
+        self.sentinel = sentinel
+
+    def fetch(self, fids: List[int], cursors: Dict[int, Dict]) -> Dict[int, Optional[Dict]]:
+        return {fid: self.sentinel._get_livelastpost(fid, cursors[fid].get('last_pid', 0)) for fid in fids}
+
+class RssSource:
+    """
+    Discuz RSS (forum.php?mod=rss)：多个FID时请求全站订阅，一次覆盖所有FID
+    RSS 只包含新主题，不含回复；条目所属FID由版块名称记忆，未知版块的主题取一次详情确认
+    没有游标的FID不在这里处理，由 DiscuzSentinel._seed_cursor 先记下当前最大 pid
+    """
+
+    name = 'rss'
+    batch = True
+    replies = False
+
+    def __init__(self, sentinel: 'DiscuzSentinel'):
+        self.sentinel = sentinel
+        # 已处理过的主题 tid -> 所属FID，避免重复获取详情
+        self._seen = TTLCache(5000, 86400)
+        # 版块名称 -> FID
+        self._forum_fids: Dict[str, int] = {}
+
+    def fetch(self, fids: List[int], cursors: Dict[int, Dict]) -> Dict[int, Optional[Dict]]:
+        from email.utils import parsedate_to_datetime
+        from xml.etree import ElementTree
+
+        tracked = [fid for fid in fids if cursors[fid].get('last_pid')]
+        if not tracked:
+            return {fid: None for fid in fids}
+        params = {'mod': 'rss', 'auth': '0'}
+        if len(tracked) == 1:
+            params['fid'] = tracked[0]
+        response = self.sentinel._forum_get(f"{BASE_URL}/forum.php", params=params, timeout=15)
+        if response.status_code != 200:
+            return {fid: None for fid in fids}
+        root = ElementTree.fromstring(response.content)
+        since = {fid: _source_since(cursors[fid]) for fid in tracked}
+        results: Dict[int, Optional[Dict]] = {fid: None for fid in fids}
+        results.update({fid: {'count': 0, 'list': []} for fid in tracked})
+        for item in root.iter('item'):
+            m = re.search(r'tid=(\d+)|thread-(\d+)-', item.findtext('link') or '')
+            if not m:
+                continue
+            tid = int(m.group(1) or m.group(2))
+            if self._seen.get(tid) is not None:
+                continue
+            try:
+                published = parsedate_to_datetime(item.findtext('pubDate') or '').timestamp()
+            except (TypeError, ValueError):
+                published = None
+            category = item.findtext('category') or ''
+            fid = tracked[0] if len(tracked) == 1 else self._forum_fids.get(category)
+            if fid is not None and fid not in tracked:
+                self._seen.put(tid, fid)
+                continue
+            # 所属FID未知时按最早的游标判断，确认FID后再按该FID的游标判断
+            if published is not None and published < since.get(fid, min(since.values())):
+                continue
+            data = self.sentinel._fetch_viewthread(tid)
+            variables = data.get('Variables', {})
+            fid = int(variables.get('thread', {}).get('fid') or fid or 0)
+            if category and fid:
+                self._forum_fids[category] = fid
+            self._seen.put(tid, fid)
+            postlist = variables.get('postlist', [])
+            if fid not in since or not postlist or (published is not None and published < since[fid]):
+                continue
+            # 主题的第一楼即新帖
+            post = min(postlist, key=lambda p: int(p.get('pid', 0)))
+            if int(post.get('pid', 0)) > cursors[fid].get('last_pid', 0):
+                results[fid]['list'].append(dict(post, tid=tid))
+        for fid in tracked:
+            results[fid]['count'] = len(results[fid]['list'])
+        return results
+
+class ForumGuideSource:
+    """
+    导读“最新回复”列表（mobile API forumguide, view=new）：一次请求覆盖全站有新回复的主题
+    再从这些主题的最后一页向前取出游标之后的帖子，主题与回复都包含
+    没有游标的FID不在这里处理，否则每个主题都要向前翻 backfill_max_pages 页并把历史帖子全部推送
+    """
+
+    name = 'guide'
+    batch = True
+    replies = True
+
+    def __init__(self, sentinel: 'DiscuzSentinel'):
+        self.sentinel = sentinel
+        # 主题 tid -> 已处理的最后回复时间，列表中没有变化的主题不再获取详情
+        self._last_seen = TTLCache(5000, 86400)
+
+    def fetch(self, fids: List[int], cursors: Dict[int, Dict]) -> Dict[int, Optional[Dict]]:
+        tracked = [fid for fid in fids if cursors[fid].get('last_pid')]
+        if not tracked:
+            return {fid: None for fid in fids}
+        response = self.sentinel._forum_get(
+            f"{BASE_URL}/api/mobile/index.php",
+            params={'version': '4', 'module': 'forumguide', 'view': 'new'}, timeout=15
+        )
+        if response.status_code != 200:
+            return {fid: None for fid in fids}
+        threads = response.json().get('Variables', {}).get('forum_threadlist', [])
+        since = {fid: _source_since(cursors[fid]) for fid in tracked}
+        results: Dict[int, Optional[Dict]] = {fid: None for fid in fids}
+        results.update({fid: {'count': 0, 'list': []} for fid in tracked})
+        for thread in threads:
+            fid, tid = int(thread.get('fid') or 0), int(thread.get('tid') or 0)
+            lastpost = int(thread.get('dblastpost') or 0)
+            if fid not in since or lastpost < since[fid] or self._last_seen.get(tid) == lastpost:
+                continue
+            last_pid = cursors[fid].get('last_pid', 0)
+            for data in self.sentinel._thread_pages_after(tid, last_pid):
+                for post in data.get('Variables', {}).get('postlist', []):
+                    if int(post.get('pid', 0)) > last_pid:
+                        results[fid]['list'].append(dict(post, tid=tid))
+            self._last_seen.put(tid, lastpost)
+        for fid in tracked:
+            results[fid]['count'] = len(results[fid]['list'])
+        return results
+
+POLL_SOURCE_CLASSES = {cls.name: cls for cls in (LivelastpostSource, RssSource, ForumGuideSource)}
+
+def _source_since(cursor: Dict) -> float:
+    """批量数据源只处理该FID上次轮询之后的条目（留出论坛时钟偏差余量）；从未轮询过时不限时间，只按 last_pid 过滤"""
+    last_poll = cursor.get('last_poll')
+    return last_poll - POLL_INTERVAL_MAX if last_poll else 0
+
+class PollSources:
+    """
+    已启用的数据源与各自的请求开销：按实测的平均请求数为每组待轮询的FID选择最便宜的数据源
+    逐FID数据源的开销为 组内FID数 × 每FID平均请求数，批量数据源为每次平均请求数（两者都含详情请求）
+    只在覆盖范围相同的数据源之间比较：启用了包含回复的数据源时，不含回复的 RSS 不会被选用，
+    否则 RSS 会把游标推过其间的回复，这些回复之后也无法再取回
+    """
+
+    ALPHA = 0.2
+
+    def __init__(self, sources: List):
+        self.sources = sources
+        self._lock = threading.Lock()
+        # 数据源 -> 平均请求数（逐FID数据源按每FID计，批量数据源按每次计），先验为 1
+        self._avg: Dict[str, float] = {source.name: 1.0 for source in sources}
+        self._totals: Dict[str, List[int]] = {source.name: [0, 0, 0] for source in sources}
+
+    @property
+    def has_batch(self) -> bool:
+        return any(source.batch for source in self.sources)
+
+    def plan(self, fids: List[int]) -> List[Tuple[object, List[int]]]:
+        """为一组待轮询的FID选择数据源，返回 [(数据源, FID列表)]；逐FID数据源每个FID一组"""
+        if not fids:
+            return []
+        candidates = [src for src in self.sources if src.replies] or self.sources
+        with self._lock:
+            source = min(candidates, key=lambda src: self._avg[src.name] * (1 if src.batch else len(fids)))
+        if source.batch:
+            return [(source, list(fids))]
+        return [(source, [fid]) for fid in fids]
+
+    def record(self, name: str, fids: int, requests: int, posts: int):
+        """记录一次轮询的论坛请求数与新帖数"""
+        SOURCE_REQUESTS.inc(requests, source=name)
+        SOURCE_POSTS.inc(posts, source=name)
+        with self._lock:
+            source = next(src for src in self.sources if src.name == name)
+            cost = requests if source.batch else requests / max(1, fids)
+            self._avg[name] = self.ALPHA * cost + (1 - self.ALPHA) * self._avg[name]
+            totals = self._totals[name]
+            totals[0] += 1
+            totals[1] += requests
+            totals[2] += posts
+
+    def report(self) -> List[str]:
+        """各数据源的累计请求数、新帖数与每条新帖的请求开销"""
+        lines = []
+        with self._lock:
+            for name, (polls, requests, posts) in self._totals.items():
+                if not polls:
+                    continue
+                per_post = f"{requests / posts:.2f}" if posts else '-'
+                lines.append(f"{name}: 轮询 {polls} 次，请求 {requests} 次，新帖 {posts} 条，每条新帖 {per_post} 次请求")
+        return lines
+
+def create_poll_sources(names: List[str], sentinel: 'DiscuzSentinel', logger: logging.Logger) -> PollSources:
+    sources = []
+    for name in names:
+        if name not in POLL_SOURCE_CLASSES:
+            logger.warning(f"未知的轮询数据源 {name}，已忽略")
+            continue
+        sources.append(POLL_SOURCE_CLASSES[name](sentinel))
+    return PollSources(sources or [LivelastpostSource(sentinel)])
+
+class DiscuzSentinel:
+    def __init__(self, config: Optional[Config] = None):
+        # 可热加载的配置（监控FID、Webhook映射、Cookie）
+        self.config = config or Config.load()
+        configure(self.config)
+        self._reload_requested = threading.Event()
+        self._stop_requested = threading.Event()
+        self.logger = logging.getLogger("DiscuzSentinel")
+        self.logger.setLevel(LOG_LEVEL)
+        self._setup_logging()
+        self.session = requests.Session()
+        # 论坛、图床、飞书开放平台、各 webhook 主机分别复用长连接
+        self.http_clients = HttpClients(HTTP_POOL_SIZE, HTTP_RETRIES)
+        self.http_clients.register(BASE_URL, self.session)
+        self.host_limiter = HostLimiter(PER_HOST_CONCURRENCY, PER_HOST_MIN_INTERVAL)
+        self.breakers = CircuitBreakers(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, self.logger)
+        # 图片处理线程池 + 按图片主机与上传目标分别限制并发，不占用论坛的礼貌限速
+        self.image_executor = ThreadPoolExecutor(max_workers=max(1, IMAGE_WORKERS), thread_name_prefix='image')
+        self.download_limiter = HostLimiter(IMAGE_UPLOAD_CONCURRENCY)
+        self.upload_limiter = HostLimiter(IMAGE_UPLOAD_CONCURRENCY)
+        self.transcode_pool = self._create_transcode_pool()
+        self.html_backend = create_html_backend(HTML_PARSER, self.logger)
+        self.thread_cache = TTLCache(THREAD_CACHE_MAX_ENTRIES, THREAD_CACHE_TTL)
+        # pid→页码，以及 ('tail', tid)→主题最后一页
+        self.post_pages = TTLCache(POST_PAGE_INDEX_MAX_ENTRIES, POST_PAGE_INDEX_TTL)
+        self.fingerprints = FingerprintIndex(
+            FINGERPRINT_FILE, FINGERPRINT_MAX_ENTRIES, FINGERPRINT_TTL_DAYS * 86400, FINGERPRINT_MAX_DISTANCE, self.logger
+        )
+        self.image_cache = ImageCache(
+            IMAGE_CACHE_FILE, IMAGE_CACHE_MAX_ENTRIES, IMAGE_CACHE_TTL_DAYS * 86400,
+            IMAGE_FAILURE_COOLDOWN, self.logger
+        )
+        self.state_lock = threading.RLock()
+        self.scheduler = PollScheduler(POLL_INTERVAL_MIN, POLL_INTERVAL_MAX, POLL_BUDGET_PER_MINUTE)
+        # 分片模式下游标、调度信息和发送队列都放在共享的 SQLite 文件中
+        self.shard = ShardCoordinator(SHARD_FILE, WORKER_ID, self.config.target_fids, SHARD_LEASE_TTL) if SHARD_FILE else None
+        if self.shard:
+            self.state_store = SqliteStateStore(SHARD_FILE, self.logger, lease_owner=WORKER_ID)
+        else:
+            self.state_store = create_state_store(STATE_BACKEND, STATE_FILE, self.logger)
+        self.state = self._load_state()
+        # 有变化待写入的FID，按 STATE_FLUSH_INTERVAL 合并写入
+        self._dirty_fids: set = set()
+        self._state_flush_lock = threading.Lock()
+        self._last_state_flush = time.time()
+        self._setup_session()
+        # 发送队列与每个 webhook 的发送线程/限速器
+        self.outbox = Outbox(SHARD_FILE or OUTBOX_FILE)
+        if self.shard:
+            self._migrate_to_shard()
+        self._delivery_lock = threading.Lock()
+        self._delivery_events: Dict[str, threading.Event] = {}
+        self._rate_limiters: Dict[str, TokenBucket] = {}
+        # 断档补抓：每个FID同一时间最多一个补抓任务，详情请求共享一个有界线程池
+        self.backfill_executor = ThreadPoolExecutor(max_workers=max(1, BACKFILL_WORKERS), thread_name_prefix='backfill')
+        self._backfill_lock = threading.Lock()
+        self._backfilling: set = set()
+        # 补抓失败的FID -> (连续失败次数, 下次允许补抓的时间)
+        self._backfill_retry: Dict[int, Tuple[int, float]] = {}
+        # 轮询数据源；_forum_requests 按线程统计论坛请求数，用于计算各数据源的开销
+        self.sources = create_poll_sources(POLL_SOURCES, self, self.logger)
+        self._forum_requests = threading.local()
+        # 飞书应用凭据池（Token 缓存 + 后台刷新）
+        self.feishu_pool = FeishuCredentialPool(
+            FEISHU_APPS, self._fetch_feishu_token, FEISHU_UPLOAD_RATE_PER_MINUTE, FEISHU_TOKEN_REFRESH_AHEAD
+        )
+        self._check_config()
+
+    def _setup_logging(self):
+        handlers = [logging.StreamHandler()]
+        if LOG_FILE:
+            file_handler = TimedRotatingFileHandler(
+                LOG_FILE, when="midnight", backupCount=LOG_RETENTION_DAYS, encoding='utf-8'
+            )
+            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            handlers.append(file_handler)
+        
+        for handler in handlers:
+            self.logger.addHandler(handler)
+
+    def _setup_session(self):
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Connection': 'keep-alive',
+            'Cookie': self.config.cookie
+        })
+
+    def _migrate_to_shard(self):
+        """
+        首次启用分片时，把单机模式的游标与未发送的消息导入共享文件
+        否则所有FID会从 last_pid=0 重新推送全部可见历史，outbox.db 中待发送的消息也不会再被发送
+        """
+        shard_path = os.path.abspath(SHARD_FILE)
+        if not self.state:
+            legacy_path = STATE_FILE
+            if STATE_BACKEND == 'sqlite' and STATE_FILE.endswith('.json'):
+                legacy_path = STATE_FILE[:-len('.json')] + '.db'
+            if STATE_FILE and os.path.abspath(legacy_path) != shard_path and \
+                    (os.path.exists(STATE_FILE) or os.path.exists(legacy_path)):
+                legacy = create_state_store(STATE_BACKEND, STATE_FILE, self.logger)
+                try:
+                    state = legacy.load()
+                finally:
+                    legacy.close()
+                if state:
+                    imported = self.state_store.import_missing(state)
+                    self.state = self._load_state()
+                    self.logger.info(f"[分片] 已从 {legacy_path} 导入 {imported} 个FID的游标")
+        if OUTBOX_FILE and OUTBOX_FILE != ':memory:' and os.path.exists(OUTBOX_FILE) and \
+                os.path.abspath(OUTBOX_FILE) != shard_path:
+            imported = self.outbox.import_pending(OUTBOX_FILE)
+            if imported:
+                self.logger.info(f"[分片] 已从 {OUTBOX_FILE} 导入 {imported} 条待发送消息")
+
+    def _load_state(self) -> Dict:
+        return self.state_store.load()
+
+    def _save_state(self, fid: Optional[int] = None):
+        """标记FID状态已变化；距上次写入超过 STATE_FLUSH_INTERVAL 时才真正落盘"""
+        with self.state_lock:
+            if fid is None:
+                self._dirty_fids.update(self.state)
+            else:
+                self._dirty_fids.add(fid)
+        if time.time() - self._last_state_flush >= STATE_FLUSH_INTERVAL:
+            self._flush_state()
+
+    def _flush_state(self):
+        """将有变化的FID状态写入存储"""
+        with self._state_flush_lock:
+            with self.state_lock:
+                if not self._dirty_fids:
+                    return
+                dirty, self._dirty_fids = self._dirty_fids, set()
+                snapshot = {fid: dict(fid_state) for fid, fid_state in self.state.items()}
+            self._last_state_flush = time.time()
+            try:
+                self.state_store.save(snapshot, dirty)
+            except Exception as e:
+                self.logger.error(f"保存状态失败: {e}")
+                with self.state_lock:
+                    self._dirty_fids.update(dirty)
+
+    def _forum_get(self, url: str, **kwargs):
+        """论坛请求统一入口，受熔断与按主机并发/间隔限制"""
+        self._forum_requests.count = getattr(self._forum_requests, 'count', 0) + 1
+        with self.breakers.for_url(url).guard() as call, self.host_limiter.acquire(url):
+            response = self.session.get(url, **kwargs)
+            call.failed = response.status_code >= 500
+            return response
+
+    def _check_config(self):
+        errors, warnings = validate_config(self.config)
+        for message in errors:
+            self.logger.error(f"❌ {message}")
+        for message in warnings:
+            self.logger.warning(f"⚠️  {message}")
+        if len(FEISHU_APPS) > 1:
+            self.logger.info(f"飞书图片上传使用 {len(FEISHU_APPS)} 个应用分摊")
+
+    def _get_livelastpost(self, fid: int, last_pid: int) -> Optional[Dict]:
+        with POLL_DURATION.time(fid=fid):
+            return self._request_livelastpost(fid, last_pid)
+
+    def _request_livelastpost(self, fid: int, last_pid: int) -> Optional[Dict]:
+        url = f"{BASE_URL}/forum.php"
+        params = {'mod': 'misc', 'action': 'livelastpost', 'type': 'post', 'fid': fid, 'postid': last_pid}
+        headers = {'Referer': f"{BASE_URL}/group-{fid}-1.html", 'Accept': 'application/json', 'X-Requested-With': 'XMLHttpRequest'}
+        breaker = self.breakers.for_url(url)
+
+        # 添加重试机制，最多重试2次
+        for attempt in range(3):
+            try:
+                self.logger.debug(f"FID {fid}: 请求 livelastpost (尝试 {attempt + 1}/3)")
+                response = self._forum_get(url, params=params, headers=headers, timeout=15)
+
+                # 检查HTTP状态码
+                if response.status_code == 504:
+                    self.logger.warning(f"FID {fid}: 服务器网关超时 (504)，论坛服务器可能负载过高或维护中")
+                    if attempt < 2 and breaker.available():  # 不是最后一次尝试，且论坛未熔断
+                        POLL_RETRIES.inc(fid=fid, reason='http_504')
+                        self.logger.info(f"FID {fid}: {5 * (attempt + 1)} 秒后重试...")
+                        time.sleep(5 * (attempt + 1))
+                        continue
+                    POLL_REQUESTS.inc(fid=fid, result='http_504')
+                    return None
+
+                if response.status_code != 200:
+                    self.logger.warning(f"FID {fid}: HTTP {response.status_code} 错误")
+                    POLL_REQUESTS.inc(fid=fid, result='http_error')
+                    return None
+
+                # 检查响应内容是否包含登录提示
+                response_text = response.text
+                if 'not_loggedin' in response_text:
+                    self.logger.warning(f"FID {fid}: Cookie 可能已失效")
+                    POLL_REQUESTS.inc(fid=fid, result='not_logged_in')
+                    return None
+            
+                if '504 Gateway Time-out' in response_text:
+                    self.logger.warning(f"FID {fid}: 响应内容显示网关超时")
+                    if attempt < 2:
+                        POLL_RETRIES.inc(fid=fid, reason='http_504')
+                        self.logger.info(f"FID {fid}: {5 * (attempt + 1)} 秒后重试...")
+                        time.sleep(5 * (attempt + 1))
+                        continue
+                    POLL_REQUESTS.inc(fid=fid, result='http_504')
+                    return None
+
+                # 尝试解析JSON
+                try:
+                    data = response.json()
+                except json.JSONDecodeError as e:
+                    self.logger.warning(f"FID {fid}: 响应不是有效JSON: {e}")
+                    self.logger.debug(f"FID {fid}: 响应内容前200字符: {response_text[:200]}")
+                    POLL_REQUESTS.inc(fid=fid, result='invalid_json')
+                    return None
+            
+                count = int(data.get('count', 0))
+                if count > 0:
+                    self.logger.info(f"FID {fid}: 发现 {count} 条新内容")
+                    POLL_REQUESTS.inc(fid=fid, result='ok')
+                    return data
+                else:
+                    self.logger.debug(f"FID {fid}: 暂无新内容 (count={count})")
+                    POLL_REQUESTS.inc(fid=fid, result='empty')
+                    return None
+            
+            except requests.exceptions.Timeout:
+                self.logger.warning(f"FID {fid}: 请求超时 (尝试 {attempt + 1}/3)")
+                if attempt < 2 and breaker.available():
+                    POLL_RETRIES.inc(fid=fid, reason='timeout')
+                    time.sleep(3)
+                    continue
+                POLL_REQUESTS.inc(fid=fid, result='timeout')
+                return None
+
+            except CircuitOpenError:
+                self.logger.debug(f"FID {fid}: 论坛接口熔断中，跳过本轮轮询")
+                POLL_REQUESTS.inc(fid=fid, result='circuit_open')
+                return None
+
+            except requests.exceptions.RequestException as e:
+                self.logger.error(f"FID {fid}: 网络请求异常: {e}")
+                if attempt < 2 and breaker.available():
+                    POLL_RETRIES.inc(fid=fid, reason='network')
+                    time.sleep(3)
+                    continue
+                POLL_REQUESTS.inc(fid=fid, result='network_error')
+                return None
+
+            except Exception as e:
+                self.logger.error(f"FID {fid}: 处理 livelastpost 时出现异常: {e}")
+                POLL_REQUESTS.inc(fid=fid, result='error')
+                return None
+
+        return None
+
+    def _fetch_viewthread(self, tid: int, page: int = 1, max_age: Optional[float] = None) -> Dict:
+        """
+        获取 viewthread 接口数据，按 (tid, page) 短期缓存，同一热帖的多条回复只请求一次
+        """
+        key = ('viewthread', tid, page)
+        data = self.thread_cache.get(key, max_age)
+        THREAD_DETAIL_REQUESTS.inc(source='cache' if data is not None else 'api')
+        if data is None:
+            url = f"{BASE_URL}/api/mobile/index.php"
+            params = {'version': '4', 'module': 'viewthread', 'tid': tid}
+            if page > 1:
+                params['page'] = page
+            response = self._forum_get(url, params=params, timeout=15)
+            data = response.json()
+            self.thread_cache.put(key, data)
+            self._remember_pages(tid, page, data)
+        return data
+
+    def _has_pid(self, data: Dict, target_pid: int) -> bool:
+        return any(int(post.get('pid', 0)) == target_pid for post in data.get('Variables', {}).get('postlist', []))
+
+    @staticmethod
+    def _thread_last_page(data: Dict) -> int:
+        """按 viewthread 返回的回复数与每页条数计算主题最后一页"""
+        variables = data.get('Variables', {})
+        ppp = int(variables.get('ppp') or 0) or len(variables.get('postlist', [])) or 1
+        replies = int(variables.get('thread', {}).get('replies') or 0)
+        return max(1, math.ceil((replies + 1) / ppp))
+
+    def _remember_pages(self, tid: int, page: int, data: Dict):
+        """记录本页各 pid 所在页码与主题当前最后一页"""
+        postlist = data.get('Variables', {}).get('postlist', [])
+        if not postlist:
+            return
+        for post in postlist:
+            self.post_pages.put(int(post.get('pid', 0)), page)
+        self.post_pages.put(('tail', tid), self._thread_last_page(data))
+
+    def _fetch_thread_page(self, tid: int, page: int, target_pid: int) -> Dict:
+        data = self._fetch_viewthread(tid, page)
+        if not self._has_pid(data, target_pid):
+            # 缓存可能早于这条回复，稍旧的缓存重新拉取一次
+            data = self._fetch_viewthread(tid, page, max_age=THREAD_REFRESH_AGE)
+        return data
+
+    def _findpost_page(self, tid: int, pid: int) -> Optional[int]:
+        """通过 Discuz 的 findpost 跳转得到 pid 所在页码（只读取跳转地址，不下载页面）"""
+        url = f"{BASE_URL}/forum.php"
+        params = {'mod': 'redirect', 'goto': 'findpost', 'ptid': tid, 'pid': pid}
+        try:
+            response = self._forum_get(url, params=params, timeout=10, allow_redirects=False)
+        except Exception:
+            return None
+        THREAD_DETAIL_REQUESTS.inc(source='findpost')
+        location = response.headers.get('Location', '')
+        if not location:
+            return None
+        # 跳转到 forum.php?mod=viewthread&tid=X&page=N#pidM 或伪静态 thread-X-N-1.html，第一页可能不带页码
+        m = re.search(r'[?&]page=(\d+)', location) or re.search(r'thread-\d+-(\d+)-', location)
+        return int(m.group(1)) if m else 1
+
+    def _locate_post(self, tid: int, target_pid: int, data: Dict, page: int) -> Optional[Dict]:
+        """
+        目标帖子不在预期的页：先按最新回复数计算的最后一页，仍找不到再用 findpost 跳转定位
+        """
+        tried = {page}
+        last_page = self._thread_last_page(data)
+        if last_page not in tried:
+            tried.add(last_page)
+            data = self._fetch_thread_page(tid, last_page, target_pid)
+            if self._has_pid(data, target_pid):
+                return data
+        found = self._findpost_page(tid, target_pid)
+        if found and found not in tried:
+            data = self._fetch_thread_page(tid, found, target_pid)
+            if self._has_pid(data, target_pid):
+                return data
+        return None
+
+    def _get_thread_detail(self, tid: int, target_pid: Optional[int]) -> Optional[Dict]:
+        """
+        获取包含目标帖子的那一页：优先按 pid→页码索引与主题最后一页直接请求，长主题的新回复通常只需一次请求
+        """
+        try:
+            page = 1
+            if target_pid:
+                page = self.post_pages.get(target_pid) or self.post_pages.get(('tail', tid)) or 1
+            data = self._fetch_thread_page(tid, page, target_pid) if target_pid else self._fetch_viewthread(tid)
+            if 'show_thread_nopermission' in str(data):
+                # 网页版同样没有权限，不再下载整页 HTML，由调用方使用 livelastpost 摘要
+                THREAD_FALLBACKS.inc(reason='no_permission')
+                return None
+            if target_pid and not self._has_pid(data, target_pid):
+                data = self._locate_post(tid, target_pid, data, page)
+                if data is None:
+                    # 网页第一页同样没有这条回复，不再下载整页 HTML，由调用方使用 livelastpost 摘要
+                    THREAD_FALLBACKS.inc(reason='pid_missing')
+                    return None
+            return data
+        except Exception as e:
+            self.logger.debug(f"TID {tid}: 获取帖子详情失败: {e}")
+            THREAD_FALLBACKS.inc(reason='error')
+            return None
+
+    def _get_thread_posts(self, tid: int, pids: List[int]) -> Dict[int, Dict]:
+        """
+        同一主题的多条新回复合并获取：按页定位，同一页只请求一次（后续回复命中缓存），再逐条提取
+        """
+        results = {}
+        for pid in pids:
+            detail = self._get_thread_detail(tid, pid)
+            extracted = self._extract_post_content(detail, pid) if detail else None
+            if extracted:
+                results[pid] = extracted
+        return results
+
+    def _extract_post_content(self, thread_data: Dict, target_pid: int) -> Optional[Dict]:
+        try:
+            if not isinstance(thread_data, dict): return None
+            vars = thread_data.get('Variables', {})
+            post_list = vars.get('postlist', [])
+            target = next((p for p in post_list if int(p.get('pid', 0)) == target_pid), None)
+            if not target: return None
+            
+            subject = vars.get('thread', {}).get('subject', '无标题')
+            text, images = self._clean_content(target.get('message', ''))
+            return {
+                'subject': subject,
+                'author': target.get('author', '未知'),
+                'time': target.get('dateline', ''),
+                'content': text,
+                'images': images,
+                'url': f"{BASE_URL}/thread-{vars.get('thread', {}).get('tid', '')}-1-1.html"
+            }
+        except Exception:
+            return None
+
+    def _extract_from_livelastpost(self, post_item: Dict, fid: int) -> Optional[Dict]:
+        text, images = self._clean_content(post_item.get('message', ''))
+        tid = self._extract_tid_from_message(post_item.get('message', ''))
+        return {
+            'subject': text[:30] + '...' if text else '新动态',
+            'author': post_item.get('author', '未知'),
+            'time': post_item.get('dateline', ''),
+            'content': text,
+            'images': images,
+            'url': f"{BASE_URL}/thread-{tid}-1-1.html" if tid else f"{BASE_URL}/group-{fid}-1.html"
+        }
+
+    def _clean_content(self, html_content: str) -> Tuple[str, List[str]]:
+        if not html_content: return "", []
+        text, srcs = self.html_backend.extract(html_content)
+        images = []
+        for src in srcs:
+            if src and 'smilies' not in src:
+                # =========== 修复代码开始 ===========
+                # 修复：去除末尾可能存在的错误符号 '>'
+                src = src.strip('>')
+
+                # 修复：只有当不是 Discuz 动态 PHP 链接时，才去除 ? 后面的参数
+                # 如果 URL 包含 forum.php 或 mod=image，说明参数是必须的，不能删
+                if '?' in src and 'forum.php' not in src and 'mod=image' not in src:
+                    src = src.split('?')[0]
+                # =========== 修复代码结束 ===========
+
+                full_url = urljoin(BASE_URL + '/', src)
+
+                # 去重：防止同一张图被添加多次
+                if full_url not in images:
+                    images.append(full_url)
+
+        return text.strip(), images
+
+    def _extract_tid_from_message(self, html: str) -> Optional[int]:
+        m = re.search(r'thread-(\d+)', html)
+        return int(m.group(1)) if m else None
+
+    def _format_message(self, post_data: Dict) -> str:
+        t = post_data.get('time', '')
+        if str(t).isdigit(): t = datetime.fromtimestamp(int(t)).strftime('%Y-%m-%d %H:%M:%S')
+        content = post_data.get('content', '')
+        if PREVIEW_LIMIT > 0: content = content[:PREVIEW_LIMIT]
+        return f"### {post_data.get('subject')}\n**作者**: {post_data.get('author')}  **时间**: {t}\n\n{content}\n\n[🔗 查看原帖]({post_data.get('url')}){self._duplicate_note(post_data)}"
+
+    def _duplicate_note(self, post_data: Dict) -> str:
+        """annotate 策略下标注相同内容首次出现的位置"""
+        first = post_data.get('duplicate_of')
+        if not first:
+            return ''
+        return f"\n\n> 🔁 相同内容已发布于 FID {first.get('fid')}（PID {first.get('pid')}）"
+
+    # ================= 通用图片上传 =================
+    def _universal_upload_image(self, img_url: str) -> str:
+        """
+        使用全局配置的AppID和Secret上传图片到图床
+        """
+        if not IMAGE_UPLOAD_APP_ID or not IMAGE_UPLOAD_APP_SECRET:
+            self.logger.warning("[图床] 未配置全局AppID/Secret，无法上传图片")
+            return img_url
+
+        cached = self.image_cache.lookup('image_host', url=img_url)
+        if cached:
+            self.logger.debug(f"[图床] 命中缓存: {img_url}")
+            IMAGE_UPLOADS.inc(backend='image_host', result='cache')
+            return cached
+        failure = self.image_cache.failure(img_url, 'download', 'image_host')
+        if failure:
+            self.logger.debug(f"[图床] 冷却期内跳过已知失败图片 ({failure}): {img_url}")
+            return img_url
+        breaker = self.breakers.for_url(IMAGE_UPLOAD_URL)
+        if not breaker.available():
+            # 图床熔断中，直接使用原链接，不再下载
+            IMAGE_UPLOADS.inc(backend='image_host', result='circuit_open')
+            return img_url
+
+        img_content, img_format = self._download_image(img_url, '图床')
+        if img_content is None:
+            return img_url
+
+        # 验证内容是否为空
+        if len(img_content) < 100:
+            self.logger.warning(f"[图床] 下载的图片太小或为空: {len(img_content)} bytes")
+            self.image_cache.mark_failure('download', img_url, '图片为空')
+            return img_url
+
+        digest = hashlib.sha256(img_content).hexdigest()
+        cached = self.image_cache.lookup('image_host', url=img_url, digest=digest)
+        if cached:
+            self.logger.debug(f"[图床] 内容命中缓存: {img_url}")
+            IMAGE_UPLOADS.inc(backend='image_host', result='cache')
+            return cached
+
+        img_content, img_format = self._transcode_for_upload(img_content, img_format, '图床')
+
+        # 确定MIME类型和扩展名
+        mime, ext = IMAGE_FORMATS[img_format]
+        filename = f"img_{int(time.time())}_{random.randint(100,999)}{ext}"
+
+        # 使用配置的图床上传地址
+        for attempt in range(3):  # 最多重试3次
+            res = None  # 初始化res变量，避免作用域问题
+            try:
+                upload_url = IMAGE_UPLOAD_URL
+
+                # 构建multipart/form-data
+                files = {'image': (filename, img_content, mime)}
+
+                # 从上传URL解析域名用于设置请求头
+                parsed_url = urlparse(upload_url)
+                domain = f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+                # 设置请求头
+                headers = {
+                    'Accept': 'application/json, text/javascript, */*; q=0.01',
+                    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+                    'Connection': 'keep-alive',
+                    'Origin': domain,
+                    'Referer': domain + '/',
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                    'X-Requested-With': 'XMLHttpRequest',
+                    'Content-Type': None  # 让requests自动设置multipart边界
+                }
+
+                self.logger.debug(f"[图床] 尝试上传 {filename} (尝试 {attempt + 1}/3)")
+
+                # 发送上传请求
+                upload_timeout = 60 if attempt == 0 else 45
+                with breaker.guard() as call, self.upload_limiter.acquire(upload_url), \
+                        IMAGE_UPLOAD_DURATION.time(backend='image_host'):
+                    res = self.http_clients.for_url(upload_url).post(
+                        upload_url,
+                        files=files,
+                        headers=headers,
+                        timeout=upload_timeout,
+                        verify=False,
+                        allow_redirects=True
+                    )
+                    call.failed = res.status_code >= 500
+
+                # 检查响应
                 if res.status_code == 200:
                     try:
                         data = res.json()
@@ -424,6 +2768,8 @@ class DiscuzSentinel:
                             if img_url_result:
                                 final_url = img_url_result.replace('\\/', '/')
                                 self.logger.info(f"✅ [图床] 上传成功: {final_url}")
+                                self.image_cache.store('image_host', final_url, url=img_url, digest=digest)
+                                IMAGE_UPLOADS.inc(backend='image_host', result='ok')
                                 return final_url
                         else:
                             # 特殊处理"非法图片文件"错误
@@ -431,6 +2777,7 @@ class DiscuzSentinel:
                             if '非法图片文件' in error_msg:
                                 self.logger.warning(f"[图床] 服务器拒绝图片 (非法图片文件): {img_url}")
                                 self.logger.debug(f"[图床] 图片大小: {len(img_content)} bytes")
+                                self.image_cache.mark_failure('image_host', img_url, '非法图片文件')
                                 return img_url
                             else:
                                 self.logger.warning(f"[图床] API响应错误: {data}")
@@ -440,6 +2787,10 @@ class DiscuzSentinel:
                 else:
                     self.logger.warning(f"[图床] HTTP {res.status_code} 错误")
 
+            except CircuitOpenError:
+                self.logger.info(f"[图床] 图床熔断中，使用原链接: {img_url}")
+                IMAGE_UPLOADS.inc(backend='image_host', result='circuit_open')
+                return img_url
             except requests.exceptions.ConnectionError as e:
                 if "RemoteDisconnected" in str(e) or "Connection aborted" in str(e) or "Connection reset by peer" in str(e):
                     self.logger.warning(f"[图床] 连接被服务器断开 (尝试 {attempt + 1}/3): {e}")
@@ -463,376 +2814,1379 @@ class DiscuzSentinel:
                 except:
                     pass
 
-            if should_retry and attempt < 2:
-                retry_delay = 2 * (attempt + 1)  # 2秒, 4秒
-                self.logger.info(f"[图床] {retry_delay} 秒后重试...")
-                time.sleep(retry_delay)
-            elif not should_retry:
-                break  # 跳出重试循环
+            if not should_retry or not breaker.available():
+                break  # 跳出重试循环（图片非法，或图床已熔断）
+            if attempt < 2:
+                retry_delay = 2 * (attempt + 1)  # 2秒, 4秒
+                self.logger.info(f"[图床] {retry_delay} 秒后重试...")
+                time.sleep(retry_delay)
+
+        # 上传失败，返回原链接
+        IMAGE_UPLOADS.inc(backend='image_host', result='failed')
+        return img_url
+
+    def _is_valid_image(self, image_data: bytes) -> bool:
+        """
+        验证图片数据是否有效（PNG / JPEG / GIF / BMP / WebP 文件头）
+        """
+        if not image_data or len(image_data) < 4:
+            return False
+        return _sniff_image_format(image_data[:16]) is not None
+
+    def _create_transcode_pool(self) -> Optional['ProcessPoolExecutor']:
+        """图片压缩在独立进程中运行，避免占用轮询线程的 GIL"""
+        if not IMAGE_TRANSCODE:
+            return None
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            self.logger.warning("已开启图片压缩，但未安装 Pillow (pip install Pillow)，将直接上传原图")
+            return None
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # 使用 spawn 启动子进程，避免在多线程进程中 fork
+        return ProcessPoolExecutor(max_workers=max(1, IMAGE_TRANSCODE_WORKERS),
+                                   mp_context=multiprocessing.get_context('spawn'))
+
+    def _transcode_for_upload(self, img_content, img_format: str, tag: str) -> Tuple[object, str]:
+        """上传前按配置压缩/转码图片，失败或无收益时返回原图"""
+        if self.transcode_pool is None:
+            return img_content, img_format
+        try:
+            future = self.transcode_pool.submit(
+                _transcode_image, img_content, img_format, IMAGE_MAX_DIMENSION,
+                IMAGE_TRANSCODE_FORMAT, IMAGE_TRANSCODE_QUALITY, IMAGE_TRANSCODE_MIN_BYTES
+            )
+            result = future.result(timeout=30)
+        except Exception as e:
+            self.logger.warning(f"[{tag}] 图片压缩失败，上传原图: {e}")
+            return img_content, img_format
+        if not result:
+            return img_content, img_format
+
+        data, out_format = result
+        saved = len(img_content) - len(data)
+        IMAGE_TRANSCODE_SAVED.inc(saved)
+        self.logger.info(
+            f"[{tag}] 图片压缩 {img_format} {len(img_content) // 1024}KB -> {out_format} {len(data) // 1024}KB "
+            f"(节省 {saved // 1024}KB, {saved * 100 // len(img_content)}%)"
+        )
+        return data, out_format
+
+    def _download_image(self, img_url: str, tag: str) -> Tuple[Optional[bytearray], Optional[str]]:
+        """
+        流式下载图片，供图床和飞书上传共用
+        先读取文件头嗅探格式，HTML 页面或未知格式立即中止；超过 IMAGE_MAX_BYTES 同样中止。
+        使用图片主机自己的连接池、并发限制和熔断器，不受论坛礼貌限速影响，图片主机故障也不会熔断论坛轮询
+        返回 (图片数据, 格式)，数据按块追加到 bytearray（上传时 multipart 编码还会复制一次）；失败返回 (None, None)
+        """
+        headers = {"Referer": BASE_URL + "/", "User-Agent": self.session.headers.get("User-Agent")}
+        start = time.time()
+        result, reason = 'error', None
+        try:
+            breaker = self.breakers.get(f"image-{urlparse(img_url).netloc}")
+            with breaker.guard() as call, self.download_limiter.acquire(img_url):
+                r = self.http_clients.for_url(img_url).get(img_url, headers=headers, timeout=15, stream=True)
+                call.failed = r.status_code >= 500
+                try:
+                    if r.status_code != 200:
+                        self.logger.warning(f"[{tag}] 图片下载失败 HTTP {r.status_code}: {img_url}")
+                        result = 'http_error'
+                        return None, None
+
+                    length = r.headers.get('Content-Length', '')
+                    if length.isdigit() and int(length) > IMAGE_MAX_BYTES:
+                        result, reason = 'too_large', f'超过大小上限({length} bytes)'
+                        return None, None
+
+                    data = bytearray()
+                    img_format = None
+                    for chunk in r.iter_content(chunk_size=64 * 1024):
+                        data += chunk
+                        if img_format is None and len(data) >= 16:
+                            img_format = _sniff_image_format(bytes(data[:16]))
+                            if img_format is None:
+                                result, reason = 'invalid', 'HTML页面' if data.lstrip()[:1] == b'<' else '格式无效'
+                                return None, None
+                        if len(data) > IMAGE_MAX_BYTES:
+                            result, reason = 'too_large', f'超过大小上限({IMAGE_MAX_BYTES} bytes)'
+                            return None, None
+
+                    if img_format is None:
+                        img_format = _sniff_image_format(bytes(data))
+                        if img_format is None:
+                            result, reason = 'invalid', '图片为空' if not data else '格式无效'
+                            return None, None
+
+                    result = 'ok'
+                    return data, img_format
+                finally:
+                    r.close()
+        except Exception as e:
+            self.logger.warning(f"[{tag}] 下载图片异常: {e}")
+            return None, None
+        finally:
+            IMAGE_DOWNLOADS.inc(result=result)
+            IMAGE_DOWNLOAD_DURATION.observe(time.time() - start)
+            if reason:
+                self.logger.warning(f"[{tag}] 放弃下载图片({reason}): {img_url}")
+                self.image_cache.mark_failure('download', img_url, reason)
+
+    # ================= 飞书专用：获取Token并上传 =================
+    def _fetch_feishu_token(self, app_id: str, app_secret: str) -> Optional[Tuple[str, float]]:
+        """获取 tenant_access_token，返回 (token, 有效期秒数)"""
+        try:
+            with self.breakers.for_url(FEISHU_TOKEN_API).guard() as call:
+                resp = self.http_clients.for_url(FEISHU_TOKEN_API).post(
+                    FEISHU_TOKEN_API, json={"app_id": app_id, "app_secret": app_secret}, timeout=10
+                )
+                call.failed = resp.status_code >= 500
+            data = resp.json()
+            if data.get("code") == 0:
+                FEISHU_TOKEN_REFRESHES.inc(result='ok')
+                return data["tenant_access_token"], float(data.get("expire", 3600))
+            FEISHU_TOKEN_REFRESHES.inc(result='rejected')
+            self.logger.error(f"飞书 Token 获取失败 ({app_id}): {data}")
+        except CircuitOpenError:
+            FEISHU_TOKEN_REFRESHES.inc(result='circuit_open')
+        except Exception as e:
+            self.logger.error(f"飞书 Token 获取失败 ({app_id}): {e}")
+            FEISHU_TOKEN_REFRESHES.inc(result='error')
+        return None
+
+    def _get_feishu_token(self) -> Optional[str]:
+        """主应用（全局 app_id）的 Token"""
+        if not self.feishu_pool:
+            return None
+        return self.feishu_pool.token(self.feishu_pool.apps[0])
+
+    def _upload_to_feishu_server(self, img_url: str) -> Optional[str]:
+        """
+        将图片上传到飞书服务器，获取 image_key (用于直接显示)
+        """
+        cached = self.image_cache.lookup('feishu', url=img_url)
+        if cached:
+            self.logger.debug(f"[飞书] 命中缓存: {img_url}")
+            IMAGE_UPLOADS.inc(backend='feishu', result='cache')
+            return cached
+        failure = self.image_cache.failure(img_url, 'download', 'feishu')
+        if failure:
+            self.logger.debug(f"[飞书] 冷却期内跳过已知失败图片 ({failure}): {img_url}")
+            return None
+
+        if not self.feishu_pool: return None
+
+        try:
+            # 下载图片（流式，HTML/未知格式/超大文件会提前中止）
+            img_content, img_format = self._download_image(img_url, '飞书')
+            if img_content is None:
+                return None
+
+            digest = hashlib.sha256(img_content).hexdigest()
+            cached = self.image_cache.lookup('feishu', url=img_url, digest=digest)
+            if cached:
+                self.logger.debug(f"[飞书] 内容命中缓存: {img_url}")
+                IMAGE_UPLOADS.inc(backend='feishu', result='cache')
+                return cached
+            img_content, img_format = self._transcode_for_upload(img_content, img_format, '飞书')
+            # 按实际格式确定后缀，防止飞书报错
+            ext = IMAGE_FORMATS[img_format][1]
+
+            # 构造文件名
+            filename = f"image{ext}"
+
+            # 飞书要求字段名为 image，且文件名后缀必须正确
+            files = {"image_type": (None, "message"), "image": (filename, img_content)}
+
+            # 按剩余额度选择应用上传，被限流时换一个应用重试
+            for _ in range(len(self.feishu_pool.apps)):
+                app = self.feishu_pool.pick()
+                token = self.feishu_pool.token(app)
+                if not token:
+                    return None
+                headers = {"Authorization": f"Bearer {token}"}
+                with self.breakers.for_url(FEISHU_IMAGE_API).guard() as call, \
+                        self.upload_limiter.acquire(FEISHU_IMAGE_API), IMAGE_UPLOAD_DURATION.time(backend='feishu'):
+                    resp = self.http_clients.for_url(FEISHU_IMAGE_API).post(FEISHU_IMAGE_API, headers=headers, files=files, timeout=20)
+                    call.failed = resp.status_code >= 500
+                try:
+                    data = resp.json()
+                except ValueError:
+                    data = {}
+                # 99991400: 请求频率超限
+                if resp.status_code != 429 and data.get("code") != 99991400:
+                    break
+                retry_after = resp.headers.get('x-ogw-ratelimit-reset') or resp.headers.get('Retry-After') or ''
+                self.feishu_pool.report_limited(app, float(retry_after) if retry_after.isdigit() else 30)
+                self.logger.warning(f"[飞书] 应用 {app.app_id} 上传被限流")
+                IMAGE_UPLOADS.inc(backend='feishu', result='rate_limited')
+
+            if data.get("code") == 0:
+                key = data.get("data", {}).get("image_key")
+                self.logger.info(f"✅ [飞书] 原生上传成功 key: {key}")
+                if key:
+                    self.image_cache.store('feishu', key, url=img_url, digest=digest)
+                IMAGE_UPLOADS.inc(backend='feishu', result='ok')
+                return key
+            else:
+                self.logger.warning(f"[飞书] 上传失败: {data} | URL: {img_url}")
+                IMAGE_UPLOADS.inc(backend='feishu', result='failed')
+                return None
+        except CircuitOpenError:
+            self.logger.debug(f"[飞书] 开放平台熔断中，跳过上传: {img_url}")
+            IMAGE_UPLOADS.inc(backend='feishu', result='circuit_open')
+            return None
+        except Exception as e:
+            self.logger.error(f"[飞书] 上传异常: {e}")
+            IMAGE_UPLOADS.inc(backend='feishu', result='error')
+            return None
+
+    def _process_images(self, upload_func, img_urls: List[str]) -> List:
+        """
+        并发处理图片（下载+上传），结果顺序与输入一致
+        """
+        def safe_upload(img_url):
+            try:
+                return upload_func(img_url)
+            except Exception as e:
+                self.logger.error(f"图片处理异常: {e} | URL: {img_url}")
+                return None
+
+        return list(self.image_executor.map(safe_upload, img_urls))
+
+    # ================= 发送逻辑 =================
+
+    def send_dingtalk(self, message: str, post_data: Dict = None, webhook_config: Dict = None) -> bool:
+        if not webhook_config:
+            return False
+
+        webhook_url = webhook_config.get('webhook_url', '')
+        secret = webhook_config.get('secret', '')
+
+        if not webhook_url:
+            return False
+
+        final_markdown = message
+        # 钉钉使用外链，调用全局图片上传
+        if post_data and post_data.get('images'):
+            self.logger.info(f"钉钉：正在处理 {len(post_data['images'])} 张图片...")
+            new_urls = self._process_images(self._universal_upload_image, post_data['images'])
+            for img_url, new_url in zip(post_data['images'], new_urls):
+                if new_url and new_url != img_url:
+                    final_markdown += f"\n\n![图片]({new_url})"
+                else:
+                    final_markdown += f"\n\n[🖼️ 图片无法预览]({img_url})"
+
+        return self._post_dingtalk(webhook_url, secret, post_data.get('subject', '新动态'), final_markdown)
+
+    def _post_dingtalk(self, webhook_url: str, secret: str, title: str, markdown: str) -> bool:
+        """发送钉钉 markdown 消息（按需加签）"""
+        breaker = self.breakers.for_webhook(webhook_url)
+        # 加签
+        if secret:
+            timestamp = str(round(time.time() * 1000))
+            string_to_sign = f"{timestamp}\n{secret}"
+            hmac_code = hmac.new(secret.encode('utf-8'), string_to_sign.encode('utf-8'), digestmod=hashlib.sha256).digest()
+            sign = urllib.parse.quote_plus(base64.b64encode(hmac_code))
+            delimiter = '&' if '?' in webhook_url else '?'
+            webhook_url = f"{webhook_url}{delimiter}timestamp={timestamp}&sign={sign}"
+
+        try:
+            payload = {
+                "msgtype": "markdown",
+                "markdown": {"title": title, "text": markdown}
+            }
+            with breaker.guard() as call, WEBHOOK_SEND_DURATION.time(type='dingtalk'):
+                resp = self.http_clients.for_url(webhook_url).post(webhook_url, json=payload, timeout=10)
+                call.failed = resp.status_code >= 500
+            result = resp.json() if resp.status_code == 200 else {}
+            if result.get('errcode') == 0:
+                self.logger.info("✅ [钉钉] 消息发送成功")
+                WEBHOOK_SENDS.inc(type='dingtalk', result='ok')
+                return True
+            self.logger.warning(f"钉钉发送失败: HTTP {resp.status_code} {resp.text[:200]}")
+            WEBHOOK_SENDS.inc(type='dingtalk', result='failed')
+            return False
+        except CircuitOpenError:
+            WEBHOOK_SENDS.inc(type='dingtalk', result='circuit_open')
+            return False
+        except Exception as e:
+            self.logger.error(f"钉钉发送异常: {e}")
+            WEBHOOK_SENDS.inc(type='dingtalk', result='error')
+            return False
+
+    def _feishu_image_elements(self, images: List[str]) -> List[Dict]:
+        """
+        处理图片并生成飞书卡片元素：配置了飞书应用时上传为原生图片，否则使用图床外链
+        """
+        elements = []
+        # 只要配置了飞书应用，就可以尝试上传原图（开放平台熔断时直接走外链）
+        if self.feishu_pool and self.breakers.for_url(FEISHU_IMAGE_API).available():
+            image_keys = self._process_images(self._upload_to_feishu_server, images)
+            for image_key in image_keys:
+                if image_key:
+                    elements.append({
+                        "tag": "img",
+                        "img_key": image_key,
+                        "alt": {"tag": "plain_text", "content": "图片"}
+                    })
+        # 降级方案：使用外链（未配置飞书应用，或开放平台熔断中）
+        else:
+            # 使用全局图片上传
+            new_urls = self._process_images(self._universal_upload_image, images)
+            for img_url, new_url in zip(images, new_urls):
+                new_url = new_url or img_url
+                elements.append({
+                    "tag": "div",
+                    "text": {
+                        "tag": "lark_md",
+                        "content": f"[🖼️ 点击查看图片]({new_url})"
+                    }
+                })
+        return elements
+
+    def _build_feishu_card(self, message: str, subject: str, image_elements: List[Dict]) -> Dict:
+        """构建飞书消息卡片：正文 + 图片 + 页脚"""
+        elements = [
+            {
+                "tag": "div",
+                "text": {
+                    "tag": "lark_md",
+                    "content": message
+                }
+            }
+        ]
+        elements.extend(image_elements)
+        elements.append({"tag": "hr"})
+        elements.append({
+            "tag": "note",
+            "elements": [{"tag": "plain_text", "content": f"DiscuzSentinel • {datetime.now().strftime('%H:%M:%S')}"}]
+        })
+
+        return {
+            "config": {"wide_screen_mode": True},
+            "header": {
+                "title": {"tag": "plain_text", "content": subject},
+                "template": "blue"
+            },
+            "elements": elements
+        }
+
+    def send_feishu(self, message: str, post_data: Dict = None, webhook_config: Dict = None) -> bool:
+        if not webhook_config:
+            return False
+
+        webhook_url = webhook_config.get('webhook_url', '')
+
+        # 检查是否具备发送条件
+        use_api_mode = False
+        if not webhook_url:
+            # 如果没有配置webhook，使用全局的AppID/Secret进行API发送
+            if IMAGE_UPLOAD_APP_ID and IMAGE_UPLOAD_APP_SECRET:
+                use_api_mode = True
+            else:
+                self.logger.warning("飞书配置不完整：既无 Webhook，也无全局AppID，无法发送")
+                return False
+
+        # 图片处理逻辑
+        image_elements = []
+        if post_data and post_data.get('images'):
+            self.logger.info(f"飞书：正在处理 {len(post_data['images'])} 张图片...")
+            image_elements = self._feishu_image_elements(post_data['images'])
+
+        # 构建卡片内容 (webhook 和 api 通用)
+        card_content = self._build_feishu_card(message, post_data.get('subject', '新动态'), image_elements)
+
+        try:
+            if use_api_mode:
+                # API模式：使用全局配置发送
+                token = self._get_feishu_token()
+                if not token:
+                    self.logger.error("无法获取飞书 Token，发送失败")
+                    return False
+
+                # 默认使用全局配置中的第一个FID对应的配置作为目标ID（这里需要扩展配置）
+                # 暂时不支持API模式，建议使用Webhook模式
+                self.logger.warning("API模式暂不支持，请使用Webhook模式")
+                return False
+
+            else:
+                # =========== Webhook 发送 ===========
+                return self._post_feishu_card(webhook_url, card_content)
+
+        except DeliveryRejected:
+            raise
+        except Exception as e:
+            self.logger.error(f"飞书发送异常: {e}")
+            WEBHOOK_SENDS.inc(type='feishu', result='error')
+            return False
+
+    def _post_feishu_card(self, webhook_url: str, card_content: Dict) -> bool:
+        """通过 Webhook 发送飞书消息卡片"""
+        try:
+            payload = {
+                "msg_type": "interactive",
+                "card": card_content
+            }
+            with self.breakers.for_webhook(webhook_url).guard() as call, WEBHOOK_SEND_DURATION.time(type='feishu'):
+                resp = self.http_clients.for_url(webhook_url).post(webhook_url, json=payload, timeout=10)
+                call.failed = resp.status_code >= 500
+            result = resp.json() if resp.status_code in (200, 400) else {}
+            # 新版返回 code，旧版返回 StatusCode
+            code = result.get('code', result.get('StatusCode'))
+            if code == 0:
+                self.logger.info("✅ [飞书] 消息发送成功 (Webhook模式)")
+                WEBHOOK_SENDS.inc(type='feishu', result='ok')
+                return True
+            self.logger.warning(f"飞书发送失败: HTTP {resp.status_code} {resp.text[:200]}")
+            if code in FEISHU_REJECT_CODES:
+                WEBHOOK_SENDS.inc(type='feishu', result='rejected')
+                raise DeliveryRejected(f"飞书拒收: {code} {result.get('msg', result.get('StatusMessage', ''))}")
+            WEBHOOK_SENDS.inc(type='feishu', result='failed')
+            return False
+        except DeliveryRejected:
+            raise
+        except CircuitOpenError:
+            WEBHOOK_SENDS.inc(type='feishu', result='circuit_open')
+            return False
+        except Exception as e:
+            self.logger.error(f"飞书发送异常: {e}")
+            WEBHOOK_SENDS.inc(type='feishu', result='error')
+            return False
+
+    # ================= 摘要模式 =================
+
+    def _digest_entry(self, post_data: Dict) -> str:
+        """摘要中单条帖子的 markdown：作者、时间、正文预览与原帖链接"""
+        t = post_data.get('time', '')
+        if str(t).isdigit(): t = datetime.fromtimestamp(int(t)).strftime('%Y-%m-%d %H:%M:%S')
+        content = post_data.get('content', '')
+        if len(content) > DIGEST_PREVIEW_LIMIT:
+            content = content[:DIGEST_PREVIEW_LIMIT] + '...'
+        images = len(post_data.get('images') or [])
+        image_note = f"  🖼️ {images} 张图片" if images else ''
+        return (f"**作者**: {post_data.get('author')}  **时间**: {t}\n\n{content}\n\n"
+                f"[🔗 查看原帖]({post_data.get('url')}){image_note}{self._duplicate_note(post_data)}")
+
+    def _build_feishu_digest_card(self, posts: List[Dict]) -> Dict:
+        """摘要卡片：每条帖子一个折叠面板，图片放在面板内"""
+        elements = []
+        for post_data in posts:
+            panel_elements = [{"tag": "div", "text": {"tag": "lark_md", "content": self._digest_entry(post_data)}}]
+            if post_data.get('images'):
+                panel_elements.extend(self._feishu_image_elements(post_data['images']))
+            elements.append({
+                "tag": "collapsible_panel",
+                "expanded": False,
+                "header": {"title": {"tag": "plain_text", "content": post_data.get('subject') or '新动态'}},
+                "elements": panel_elements
+            })
+        elements.append({"tag": "hr"})
+        elements.append({
+            "tag": "note",
+            "elements": [{"tag": "plain_text", "content": f"DiscuzSentinel • {datetime.now().strftime('%H:%M:%S')}"}]
+        })
+        return {
+            "config": {"wide_screen_mode": True},
+            "header": {
+                "title": {"tag": "plain_text", "content": f"📰 {len(posts)} 条新动态"},
+                "template": "blue"
+            },
+            "elements": elements
+        }
+
+    def _build_dingtalk_digest(self, posts: List[Dict]) -> str:
+        """钉钉 markdown 不支持折叠，按帖子分节，图片只保留数量提示"""
+        sections = [f"### 📰 {len(posts)} 条新动态"]
+        for i, post_data in enumerate(posts, 1):
+            sections.append(f"#### {i}. {post_data.get('subject') or '新动态'}\n{self._digest_entry(post_data)}")
+        return '\n\n---\n\n'.join(sections)
+
+    def send_digest(self, posts: List[Dict], webhook_config: Dict) -> bool:
+        """将多条帖子合并为一条消息发送"""
+        webhook_url = webhook_config.get('webhook_url', '')
+        if not webhook_url:
+            return False
+        self.logger.info(f"摘要模式：合并 {len(posts)} 条帖子为一条消息")
+        if webhook_config.get('webhook_type', '').lower() == 'dingtalk':
+            return self._post_dingtalk(webhook_url, webhook_config.get('secret', ''),
+                                       f"{len(posts)} 条新动态", self._build_dingtalk_digest(posts))
+        return self._post_feishu_card(webhook_url, self._build_feishu_digest_card(posts))
+    
+    def _poll_fid(self, fid: int) -> int:
+        """
+        轮询单个FID（使用第一个启用的数据源），返回新帖数量
+        """
+        return self._poll_group(self.sources.sources[0], [fid])[fid] or 0
+
+    def _poll_group(self, source, fids: List[int]) -> Dict[int, Optional[int]]:
+        """
+        用指定数据源轮询一组FID：批量数据源一次请求覆盖整组，再逐个FID处理；返回各FID的新帖数量（异常为 None）
+        """
+        with self.state_lock:
+            cursors = {fid: dict(self.state.get(fid, {})) for fid in fids}
+        self._forum_requests.count = 0
+        for fid in fids:
+            if cursors[fid].get('gaps'):
+                # 上次未完成（重启或补抓失败）的断档继续补抓
+                self._start_backfill(fid)
+            if source.batch and not cursors[fid].get('last_pid'):
+                # 首次启动或热加载新增的FID：批量数据源只能从历史中全部翻出，先记下当前最大 pid，不推送历史帖子
+                cursors[fid]['last_pid'] = self._seed_cursor(fid)
+
+        try:
+            results = source.fetch(fids, cursors)
+        except Exception as e:
+            self.logger.error(f"数据源 {source.name} 请求失败 (FID {fids}): {e}")
+            results = {}
+        counts: Dict[int, Optional[int]] = {}
+        for fid in fids:
+            try:
+                counts[fid] = self._process_poll(fid, cursors[fid], results.get(fid))
+            except Exception as e:
+                self.logger.error(f"FID {fid}: 轮询异常: {e}")
+                counts[fid] = None
+        self.sources.record(source.name, len(fids), self._forum_requests.count, sum(c or 0 for c in counts.values()))
+        return counts
 
-        # 上传失败，返回原链接
-        return img_url
+    def _seed_cursor(self, fid: int) -> int:
+        """用一次 livelastpost 请求取得该FID当前最大的 pid 作为游标，返回该 pid（失败返回 0，下次轮询重试）"""
+        data = self._get_livelastpost(fid, 0)
+        pids = [int(item.get('pid', 0)) for item in (data or {}).get('list', [])]
+        if not pids:
+            return 0
+        with self.state_lock:
+            fid_state = self.state.setdefault(fid, {'last_pid': 0, 'last_tid': 0})
+            fid_state['last_pid'] = max(fid_state.get('last_pid', 0), max(pids))
+            last_pid = fid_state['last_pid']
+        self._save_state(fid)
+        self.logger.info(f"FID {fid}: 没有游标，从当前最新的 PID {last_pid} 开始监控")
+        return last_pid
 
-    def _is_valid_image(self, image_data: bytes) -> bool:
+    def _process_poll(self, fid: int, cursor: Dict, data: Optional[Dict]) -> int:
         """
-        验证图片数据是否有效
+        处理数据源返回的单个FID结果：获取详情并按时间顺序写入发送队列，推进游标，返回新帖数量
         """
-        if not image_data or len(image_data) < 4:
-            return False
+        last_pid = cursor.get('last_pid', 0)
+        last_poll = cursor.get('last_poll')
+        if not data:
+            return 0
 
-        # 检查文件头标识
-        # PNG: \x89PNG
-        # JPEG: \xFF\xD8
-        # GIF: GIF8
-        # BMP: BM
-        # WebP: RIFF....WEBP
+        # 收集所有新帖子，按时间顺序排序
+        new_posts = []
+        max_pid = last_pid
 
-        if image_data.startswith(b'\x89PNG'):
-            return True
-        elif image_data.startswith(b'\xFF\xD8'):
-            return True
-        elif image_data.startswith(b'GIF8'):
-            return True
-        elif image_data.startswith(b'BM'):
-            return True
-        elif len(image_data) > 12 and image_data.startswith(b'RIFF') and b'WEBP' in image_data[8:12]:
-            return True
+        # 首先按 PID 从小到大处理，确保不遗漏
+        items = []
+        for item in sorted(data.get('list', []), key=lambda x: int(x.get('pid', 0))):
+            pid = int(item.get('pid', 0))
+            if pid <= max_pid:
+                continue
+            items.append((pid, item))
+            max_pid = pid
+        gap = self._detect_gap(data, items, last_pid, last_poll)
 
-        # 检查是否包含HTML（下载失败的标志）
-        if b'<html' in image_data.lower() or b'<!DOCTYPE' in image_data.lower():
-            return False
+        # 按主题分组，每个主题本轮只获取一次详情
+        pids_by_tid: Dict[int, List[int]] = {}
+        for pid, item in items:
+            tid = item.get('tid') or self._extract_tid_from_message(item.get('message', ''))
+            if tid:
+                pids_by_tid.setdefault(tid, []).append(pid)
+        details: Dict[int, Dict] = {}
+        for tid, pids in pids_by_tid.items():
+            details.update(self._get_thread_posts(tid, pids))
 
-        # 检查是否是其他常见的图片格式或二进制数据
-        # 对于Discuz论坛的动态图片，可能不是标准格式但仍然有效
-        # 只要不是HTML/XML内容就可以尝试上传
+        for pid, item in items:
+            # 获取帖子数据
+            post_data = details.get(pid) or self._extract_from_livelastpost(item, fid)
 
-        return False
+            if post_data and self._is_duplicate(fid, pid, post_data):
+                continue
 
-    # ================= 飞书专用：获取Token并上传 =================
-    def _get_feishu_token(self) -> Optional[str]:
-        now = time.time()
-        if self.feishu_token and self.feishu_token_expire > now:
-            return self.feishu_token
-        if not (IMAGE_UPLOAD_APP_ID and IMAGE_UPLOAD_APP_SECRET):
+            if post_data:
+                # 添加时间戳用于排序
+                self._stamp_post(post_data, pid)
+                new_posts.append(post_data)
+
+        # 如果有新帖子，按时间顺序排序后写入发送队列
+        if new_posts:
+            # 按时间戳从小到大排序（旧时间在前）
+            new_posts.sort(key=lambda x: x['_timestamp'])
+
+            self.logger.info(f"FID {fid}: 发现 {len(new_posts)} 条新内容，按时间顺序加入发送队列")
+
+            for post_data in new_posts:
+                self._enqueue_post(fid, post_data)
+
+        # 入队完成后再推进游标，发送失败由发送队列负责重试
+        # 更新状态
+        with self.state_lock:
+            fid_state = self.state.setdefault(fid, {})
+            fid_state['last_pid'] = max_pid
+            if gap:
+                fid_state['gaps'] = fid_state.get('gaps', []) + [gap]
+        self._save_state(fid)
+        if gap:
+            self.logger.warning(f"FID {fid}: PID {gap[0]}~{gap[1]} 之间可能有遗漏，开始后台补抓")
+            self._start_backfill(fid)
+        return len(items)
+
+    # ==================== 断档补抓 ====================
+
+    def _detect_gap(self, data: Dict, items: List[Tuple[int, Dict]], last_pid: int,
+                    last_poll: Optional[float]) -> Optional[List]:
+        """
+        判断游标与本次最早的新帖之间是否可能有数据源没有返回的帖子：返回条数少于 count（列表被截断）
+        PID 是全站递增的，同一FID相邻两帖的 PID 通常不连续，不能据此判断断档
+        返回 [last_pid, 最早新帖pid, 断档起始时间]，无断档返回 None
+        """
+        if BACKFILL_WORKERS <= 0 or not last_pid or not items:
             return None
-        try:
-            url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-            resp = requests.post(url, json={"app_id": IMAGE_UPLOAD_APP_ID, "app_secret": IMAGE_UPLOAD_APP_SECRET}, timeout=10)
-            data = resp.json()
-            if data.get("code") == 0:
-                self.feishu_token = data["tenant_access_token"]
-                self.feishu_token_expire = now + int(data.get("expire", 3600)) - 60
-                return self.feishu_token
-        except Exception as e:
-            self.logger.error(f"飞书 Token 获取失败: {e}")
+        if int(data.get('count', 0)) <= len(data.get('list', [])):
             return None
+        # 断档起始时间留出余量，避免论坛时钟偏差漏掉边界上的帖子
+        since = (last_poll or time.time() - BACKFILL_AFTER) - POLL_INTERVAL_MAX
+        return [last_pid, items[0][0], since]
 
-    def _upload_to_feishu_server(self, img_url: str) -> Optional[str]:
+    def _start_backfill(self, fid: int):
         """
-        将图片上传到飞书服务器，获取 image_key (用于直接显示)
+        在后台线程补抓该FID记录的断档，同一FID同时只有一个补抓任务；实时轮询不受影响
+        上次补抓失败时按指数退避，退避期内的轮询不会重新发起补抓
         """
-        token = self._get_feishu_token()
-        if not token: return None
+        with self._backfill_lock:
+            if fid in self._backfilling:
+                return
+            retry = self._backfill_retry.get(fid)
+            if retry and time.time() < retry[1]:
+                return
+            self._backfilling.add(fid)
+        threading.Thread(target=self._backfill_fid, args=(fid,), name=f'backfill-{fid}', daemon=True).start()
 
+    def _backfill_fid(self, fid: int):
+        """逐个处理断档：并发获取详情，按 PID 顺序写入发送队列，完成后从状态中移除"""
         try:
-            # 下载图片
-            headers = {"Referer": BASE_URL + "/", "User-Agent": self.session.headers.get("User-Agent")}
-            r = self.session.get(img_url, headers=headers, timeout=15)
-
-            # 检查 HTTP 状态
-            if r.status_code != 200:
-                self.logger.warning(f"[飞书] 图片下载失败 HTTP {r.status_code}: {img_url}")
-                return None
+            while True:
+                with self.state_lock:
+                    gaps = self.state.get(fid, {}).get('gaps', [])
+                    if not gaps:
+                        return
+                    gap = gaps[0]
+                lo, hi, since = gap
+                started = time.time()
+                posts = self._backfill_range(fid, lo, hi, since)
+                recovered = 0
+                for pid in sorted(posts):
+                    post_data = posts[pid]
+                    if self._is_duplicate(fid, pid, post_data):
+                        continue
+                    self._stamp_post(post_data, pid)
+                    self._enqueue_post(fid, post_data)
+                    recovered += 1
+                BACKFILL_POSTS.inc(recovered, fid=fid)
+                with self.state_lock:
+                    fid_state = self.state.setdefault(fid, {})
+                    remaining = [g for g in fid_state.get('gaps', []) if g != gap]
+                    if remaining:
+                        fid_state['gaps'] = remaining
+                    else:
+                        fid_state.pop('gaps', None)
+                self._save_state(fid)
+                with self._backfill_lock:
+                    self._backfill_retry.pop(fid, None)
+                self.logger.info(
+                    f"FID {fid}: 补抓 PID {lo}~{hi} 完成，找回 {recovered} 条，耗时 {time.time() - started:.1f}s"
+                )
+        except Exception as e:
+            self._backfill_failed(fid, e)
+        finally:
+            with self._backfill_lock:
+                self._backfilling.discard(fid)
+            # 断档关闭后恢复该FID暂停的推送
+            self._resume_delivery()
 
-            # 检查是否下载到了 HTML 网页（由于 cookie 过期或防盗链）
-            if r.content.strip().startswith(b'<'):
-                self.logger.warning(f"[飞书] 下载到的似乎是 HTML 页面而非图片: {img_url}")
-                return None
+    def _backfill_failed(self, fid: int, error: Exception):
+        """补抓失败：断档保留在状态中按指数退避重试，连续失败过多时放弃该断档"""
+        with self._backfill_lock:
+            attempts = self._backfill_retry.get(fid, (0, 0.0))[0] + 1
+            if attempts < BACKFILL_MAX_ATTEMPTS:
+                backoff = min(BACKFILL_RETRY_MAX, BACKFILL_RETRY_BASE * (2 ** (attempts - 1)))
+                self._backfill_retry[fid] = (attempts, time.time() + backoff)
+            else:
+                self._backfill_retry.pop(fid, None)
+        if attempts < BACKFILL_MAX_ATTEMPTS:
+            self.logger.warning(f"FID {fid}: 补抓失败，{backoff:.0f} 秒后重试 ({attempts}/{BACKFILL_MAX_ATTEMPTS}): {error}")
+            return
+        with self.state_lock:
+            fid_state = self.state.setdefault(fid, {})
+            gaps = fid_state.pop('gaps', [])
+        self._save_state(fid)
+        self.logger.error(f"FID {fid}: 连续 {attempts} 次补抓失败，放弃断档 {gaps}: {error}")
 
-            # 动态判断图片后缀，防止飞书报错
-            img_content = r.content
-            ext = '.jpg' # 默认
-            if img_content.startswith(b'\x89PNG'): ext = '.png'
-            elif img_content.startswith(b'GIF8'): ext = '.gif'
-            elif img_content.startswith(b'BM'): ext = '.bmp'
-            elif img_content.startswith(b'\xFF\xD8'): ext = '.jpg'
-            elif len(img_content) > 12 and b'WEBP' in img_content[0:15]: ext = '.webp'
+    def _held_fids(self) -> set:
+        """有未补完断档的FID：补抓完成前暂停推送，保证找回的旧帖先于更新的帖子送达"""
+        with self.state_lock:
+            return {fid for fid, fid_state in self.state.items() if fid_state.get('gaps')}
 
-            # 构造文件名
-            filename = f"image{ext}"
+    def _backfill_range(self, fid: int, lo: int, hi: int, since: float) -> Dict[int, Dict]:
+        """找出断档期间有新回复的主题，在有界线程池中并发获取 lo < pid < hi 的帖子"""
+        tids = self._backfill_threads(fid, since)
+        futures = [self.backfill_executor.submit(self._backfill_thread, tid, lo, hi) for tid in tids]
+        posts: Dict[int, Dict] = {}
+        for future in futures:
+            posts.update(future.result())
+        return posts
 
-            # 上传飞书
-            url = "https://open.feishu.cn/open-apis/im/v1/images"
-            headers = {"Authorization": f"Bearer {token}"}
+    def _backfill_threads(self, fid: int, since: float) -> List[int]:
+        """
+        从版块主题列表（按最后回复时间倒序）中找出 since 之后有回复的主题
+        置顶主题不参与翻页判断；非置顶主题出现早于 since 的即停止翻页
+        """
+        tids: List[int] = []
+        for page in range(1, BACKFILL_MAX_PAGES + 1):
+            response = self._forum_get(
+                f"{BASE_URL}/api/mobile/index.php",
+                params={'version': '4', 'module': 'forumdisplay', 'fid': fid, 'page': page},
+                timeout=15
+            )
+            threads = response.json().get('Variables', {}).get('forum_threadlist', [])
+            if not threads:
+                break
+            reached_end = False
+            for thread in threads:
+                tid = int(thread.get('tid', 0))
+                if int(thread.get('dblastpost') or 0) >= since:
+                    if tid and tid not in tids:
+                        tids.append(tid)
+                elif int(thread.get('displayorder') or 0) <= 0:
+                    reached_end = True
+            if reached_end:
+                break
+        return tids
 
-            # 飞书要求字段名为 image，且文件名后缀必须正确
-            files = {"image_type": (None, "message"), "image": (filename, img_content)}
+    def _backfill_thread(self, tid: int, lo: int, hi: int) -> Dict[int, Dict]:
+        """提取主题中 lo < pid < hi 的帖子"""
+        posts: Dict[int, Dict] = {}
+        for data in self._thread_pages_after(tid, lo):
+            for post in data.get('Variables', {}).get('postlist', []):
+                pid = int(post.get('pid', 0))
+                if lo < pid < hi and pid not in posts:
+                    post_data = self._extract_post_content(data, pid)
+                    if post_data:
+                        posts[pid] = post_data
+        return posts
 
-            resp = requests.post(url, headers=headers, files=files, timeout=20)
-            data = resp.json()
+    def _thread_pages_after(self, tid: int, lo: int) -> List[Dict]:
+        """
+        从主题最后一页向前翻，直到越过 lo，返回各页 viewthread 数据（最多 BACKFILL_MAX_PAGES 页）
+        已知主题最后一页时从该页开始，短主题与活跃的长主题通常只需一次请求
+        """
+        start = self.post_pages.get(('tail', tid)) or 1
+        first = self._fetch_viewthread(tid, start, max_age=THREAD_REFRESH_AGE)
+        if 'show_thread_nopermission' in str(first):
+            return []
+        last_page = self._thread_last_page(first)
+        pages = []
+        for page in range(last_page, max(0, last_page - BACKFILL_MAX_PAGES), -1):
+            data = first if page == start else self._fetch_viewthread(tid, page, max_age=THREAD_REFRESH_AGE)
+            pages.append(data)
+            pids = [int(post.get('pid', 0)) for post in data.get('Variables', {}).get('postlist', [])]
+            if not pids or min(pids) <= lo:
+                break
+        return pages
 
-            if data.get("code") == 0:
-                key = data.get("data", {}).get("image_key")
-                self.logger.info(f"✅ [飞书] 原生上传成功 key: {key}")
-                return key
-            else:
-                self.logger.warning(f"[飞书] 上传失败: {data} | URL: {img_url}")
-                return None
-        except Exception as e:
-            self.logger.error(f"[飞书] 上传异常: {e}")
-            return None
+    def _is_duplicate(self, fid: int, pid: int, post_data: Dict) -> bool:
+        """
+        内容指纹去重，返回 True 表示按该FID的 duplicate_policy 跳过
+        skip: 直接丢弃，不上传图片也不推送；annotate: 照常推送并标注首次出现的位置；off: 只登记指纹
+        """
+        fp = content_fingerprint(post_data.get('content', ''), post_data.get('images') or [])
+        if fp is None:
+            return False
+        first = self.fingerprints.check(fp, fid, pid)
+        if not first:
+            return False
+        policy = self.config.fid_mappings.get(str(fid), {}).get('duplicate_policy', 'off')
+        if policy == 'off':
+            return False
+        DUPLICATE_POSTS.inc(fid=fid, policy=policy)
+        if policy == 'skip':
+            self.logger.info(f"FID {fid}: PID {pid} 与 FID {first.get('fid')} PID {first.get('pid')} 内容重复，跳过推送")
+            return True
+        post_data['duplicate_of'] = first
+        return False
 
-    # ================= 发送逻辑 =================
+    def _schedule_next(self, fid: int, count: Optional[int]) -> float:
+        """根据本次轮询结果计算并保存该FID的下次轮询时间"""
+        now = time.time()
+        with self.state_lock:
+            fid_state = self.state.setdefault(fid, {'last_pid': 0})
+            if count is not None:
+                self.scheduler.observe(fid_state, count, now)
+            all_states = [self.state.get(f, {}) for f in self._active_fids()]
+            interval = self.scheduler.interval(fid_state, all_states)
+            fid_state['next_poll'] = now + interval
+        self.logger.debug(f"FID {fid}: 发帖速率 {fid_state.get('rate', 0.0) * 60:.2f} 帖/分钟，{interval:.0f} 秒后再次轮询")
+        self._save_state(fid)
+        return fid_state['next_poll']
 
-    def send_dingtalk(self, message: str, post_data: Dict = None, webhook_config: Dict = None) -> bool:
+    def _enqueue_post(self, fid: int, post_data: Dict):
+        """根据FID映射将帖子写入发送队列"""
+        pid = post_data['_pid']
+        webhook_config = self.config.fid_mappings.get(str(fid))
         if not webhook_config:
-            return False
+            self.logger.info(f"FID {fid}: 未配置webhook映射，跳过推送")
+            return
 
+        webhook_type = webhook_config.get('webhook_type', '').lower()
+        if webhook_type not in WEBHOOK_RATE_LIMITS:
+            self.logger.warning(f"FID {fid}: 未知的webhook类型: {webhook_type}")
+            return
+        if not webhook_config.get('webhook_url'):
+            self.logger.warning(f"FID {fid}: 未配置webhook地址，跳过推送")
+            return
+
+        if self.outbox.enqueue(fid, pid, webhook_config, post_data):
+            self.logger.info(f"已加入发送队列 PID {pid} (时间: {post_data.get('time', '未知')})")
+        self._ensure_delivery_worker(webhook_config['webhook_url'])
+
+    def _get_rate_limiter(self, webhook_config: Dict) -> TokenBucket:
         webhook_url = webhook_config.get('webhook_url', '')
-        secret = webhook_config.get('secret', '')
+        with self._delivery_lock:
+            limiter = self._rate_limiters.get(webhook_url)
+            if limiter is None:
+                webhook_type = webhook_config.get('webhook_type', '').lower()
+                rate, burst = WEBHOOK_RATE_LIMITS.get(webhook_type, (20, 1))
+                rate = webhook_config.get('rate_per_minute', rate)
+                limiter = self._rate_limiters[webhook_url] = TokenBucket(rate, min(burst, max(1, int(rate))))
+            return limiter
 
-        if not webhook_url:
-            return False
+    def _ensure_delivery_worker(self, webhook_key: str):
+        """确保该 webhook 有一个发送线程在运行，并唤醒它"""
+        with self._delivery_lock:
+            event = self._delivery_events.get(webhook_key)
+            if event is None:
+                event = self._delivery_events[webhook_key] = threading.Event()
+                threading.Thread(
+                    target=self._delivery_loop, args=(webhook_key, event),
+                    name=f"delivery-{len(self._delivery_events)}", daemon=True
+                ).start()
+        event.set()
 
-        final_markdown = message
-        # 钉钉使用外链，调用全局图片上传
-        if post_data and post_data.get('images'):
-            self.logger.info(f"钉钉：正在处理 {len(post_data['images'])} 张图片...")
-            for img_url in post_data['images']:
-                new_url = self._universal_upload_image(img_url)
-                if new_url != img_url:
-                    final_markdown += f"\n\n![图片]({new_url})"
+    def _delivery_loop(self, webhook_key: str, event: threading.Event):
+        """发送线程：按顺序投递某个 webhook 的待发送消息，失败后指数退避重试"""
+        while True:
+            event.clear()
+            try:
+                # 分片模式下只发送本 worker 持有的FID的消息
+                fids = self.shard.owned() if self.shard else None
+                item = self.outbox.next_pending(webhook_key, fids, WORKER_ID if self.shard else None,
+                                                self._held_fids())
+                if not item:
+                    event.wait(timeout=30)
+                    continue
+
+                delay = item['next_attempt'] - time.time()
+                if delay > 0:
+                    event.wait(timeout=min(delay, 30))
+                    continue
+
+                # webhook 熔断期间不消耗重试次数，冷却结束后由下一条消息探测
+                breaker = self.breakers.for_webhook(_webhook_url(webhook_key))
+                if not breaker.available():
+                    event.wait(timeout=min(max(breaker.retry_in(), 1), 30))
+                    continue
+
+                if self.shard and not self.outbox.claim(item['id'], WORKER_ID, DELIVERY_CLAIM_TTL):
+                    continue
+
+                self._get_rate_limiter(item['webhook_config']).acquire()
+                batch = self._digest_batch(webhook_key, item)
+                if batch:
+                    self._deliver_digest(batch)
                 else:
-                    final_markdown += f"\n\n[🖼️ 图片无法预览]({img_url})"
-                time.sleep(0.5)
+                    self._deliver(item)
+            except Exception as e:
+                self.logger.error(f"发送线程异常: {e}")
+                time.sleep(5)
 
-        # 加签
-        if secret:
-            timestamp = str(round(time.time() * 1000))
-            string_to_sign = f"{timestamp}\n{secret}"
-            hmac_code = hmac.new(secret.encode('utf-8'), string_to_sign.encode('utf-8'), digestmod=hashlib.sha256).digest()
-            sign = urllib.parse.quote_plus(base64.b64encode(hmac_code))
-            delimiter = '&' if '?' in webhook_url else '?'
-            webhook_url = f"{webhook_url}{delimiter}timestamp={timestamp}&sign={sign}"
+    def _deliver(self, item: Dict) -> bool:
+        post_data = item['post_data']
+        webhook_config = item['webhook_config']
+        webhook_type = webhook_config.get('webhook_type', '').lower()
+        pid = item['pid']
+        # 两段式推送：先发不含图片的正文，图片处理完成后单独补发
+        followup = (webhook_config.get('image_delivery') == 'followup' and bool(post_data.get('images'))
+                    and not post_data.get('_images_only'))
 
         try:
-            payload = {
-                "msgtype": "markdown",
-                "markdown": {"title": post_data.get('subject', '新动态'), "text": final_markdown}
-            }
-            requests.post(webhook_url, json=payload, timeout=10)
-            return True
-        except Exception as e:
-            self.logger.error(f"钉钉发送异常: {e}")
-            return False
-
-    def send_feishu(self, message: str, post_data: Dict = None, webhook_config: Dict = None) -> bool:
-        if not webhook_config:
+            if post_data.get('_images_only'):
+                msg = self._format_image_followup(post_data)
+            elif followup:
+                msg = self._format_message(post_data) + f"\n\n> 🖼️ {len(post_data['images'])} 张图片稍后发送"
+                post_data = dict(post_data, images=[])
+            else:
+                msg = self._format_message(post_data)
+            if webhook_type == 'dingtalk':
+                ok = self.send_dingtalk(msg, post_data, webhook_config)
+            else:
+                ok = self.send_feishu(msg, post_data, webhook_config)
+        except DeliveryRejected as e:
+            self._reject_delivery(item, str(e))
             return False
+        except Exception as e:
+            self.logger.error(f"FID {item['fid']}: 推送 PID {pid} 异常: {e}")
+            ok = False
 
-        webhook_url = webhook_config.get('webhook_url', '')
+        if ok and followup:
+            self._enqueue_image_followup(item)
+        self._record_delivery(item, ok)
+        return ok
 
-        # 检查是否具备发送条件
-        use_api_mode = False
-        if not webhook_url:
-            # 如果没有配置webhook，使用全局的AppID/Secret进行API发送
-            if IMAGE_UPLOAD_APP_ID and IMAGE_UPLOAD_APP_SECRET:
-                use_api_mode = True
-            else:
-                self.logger.warning("飞书配置不完整：既无 Webhook，也无全局AppID，无法发送")
-                return False
+    def _format_image_followup(self, post_data: Dict) -> str:
+        """图片补发消息的正文：标题与原帖链接，便于和先发出的正文对应"""
+        return f"### {post_data.get('subject')}（图片）\n\n[🔗 查看原帖]({post_data.get('url')})"
 
-        # 构建卡片内容 (webhook 和 api 通用)
-        elements = [
-            {
-                "tag": "div",
-                "text": {
-                    "tag": "lark_md",
-                    "content": message
-                }
-            }
-        ]
+    def _enqueue_image_followup(self, item: Dict):
+        """正文已送达，图片作为补发消息进入独立队列，由单独的发送线程上传并推送"""
+        webhook_key = item['webhook_config']['webhook_url'] + FOLLOWUP_KEY_SUFFIX
+        post_data = dict(item['post_data'], _images_only=True)
+        self.outbox.enqueue(item['fid'], item['pid'], item['webhook_config'], post_data, webhook_key=webhook_key)
+        self._ensure_delivery_worker(webhook_key)
 
-        # 图片处理逻辑
-        if post_data and post_data.get('images'):
-            self.logger.info(f"飞书：正在处理 {len(post_data['images'])} 张图片...")
+    def _record_delivery(self, item: Dict, ok: bool):
+        """记录发送结果：成功标记已发送，失败按指数退避安排重试或放弃"""
+        post_data = item['post_data']
+        pid = item['pid']
+        if ok:
+            self.outbox.mark_sent(item['id'])
+            # 端到端延迟按首条消息（正文）计算，图片补发不重复统计；发布时间无法解析的帖子不计入
+            if post_data.get('_posted_at') and not post_data.get('_images_only'):
+                DELIVERY_LAG.observe(max(0.0, time.time() - post_data['_posted_at']), fid=item['fid'])
+            self.logger.info(f"已推送 PID {pid} (时间: {post_data.get('time', '未知')})")
+            return
 
-            # 只要配置了全局AppID/Secret，就可以尝试上传原图
-            if IMAGE_UPLOAD_APP_ID and IMAGE_UPLOAD_APP_SECRET:
-                for img_url in post_data['images']:
-                    image_key = self._upload_to_feishu_server(img_url)
-                    if image_key:
-                        elements.append({
-                            "tag": "img",
-                            "img_key": image_key,
-                            "alt": {"tag": "plain_text", "content": "图片"}
-                        })
-                    time.sleep(0.5)
-            # 降级方案：使用外链
-            else:
-                for img_url in post_data['images']:
-                    # 使用全局图片上传
-                    new_url = self._universal_upload_image(img_url)
-                    elements.append({
-                        "tag": "div",
-                        "text": {
-                            "tag": "lark_md",
-                            "content": f"[🖼️ 点击查看图片]({new_url})"
-                        }
-                    })
+        attempts = item['attempts'] + 1
+        if attempts >= DELIVERY_MAX_ATTEMPTS:
+            self.outbox.mark_dead(item['id'], '发送失败')
+            self.logger.error(f"FID {item['fid']}: PID {pid} 连续 {attempts} 次发送失败，放弃推送")
+        else:
+            backoff = min(DELIVERY_BACKOFF_MAX, DELIVERY_BACKOFF_BASE * (2 ** (attempts - 1)))
+            backoff *= random.uniform(0.8, 1.2)
+            self.outbox.mark_retry(item['id'], '发送失败', time.time() + backoff)
+            self.logger.warning(f"FID {item['fid']}: PID {pid} 发送失败，{backoff:.0f} 秒后重试 ({attempts}/{DELIVERY_MAX_ATTEMPTS})")
 
-        elements.append({"tag": "hr"})
-        elements.append({
-            "tag": "note",
-            "elements": [{"tag": "plain_text", "content": f"DiscuzSentinel • {datetime.now().strftime('%H:%M:%S')}"}]
-        })
+    def _reject_delivery(self, item: Dict, error: str):
+        """Webhook 拒收的消息不再重试，直接放弃，后续消息不必等它退避到最大次数"""
+        self.outbox.mark_dead(item['id'], error)
+        self.logger.error(f"FID {item['fid']}: PID {item['pid']} {error}，放弃推送")
 
-        card_content = {
-            "config": {"wide_screen_mode": True},
-            "header": {
-                "title": {"tag": "plain_text", "content": post_data.get('subject', '新动态')},
-                "template": "blue"
-            },
-            "elements": elements
-        }
+    def _digest_batch(self, webhook_key: str, head: Dict) -> Optional[List[Dict]]:
+        """
+        摘要模式：该 webhook 当前可发送的消息数达到 digest_threshold 时，返回需要合并的一批消息，否则返回 None
+        """
+        webhook_config = head['webhook_config']
+        threshold = int(webhook_config.get('digest_threshold', 0))
+        if threshold < 2 or head['post_data'].get('_images_only'):
+            return None
+        limit = max(threshold, int(webhook_config.get('digest_max_posts', DIGEST_MAX_POSTS)))
+        fids = self.shard.owned() if self.shard else None
+        items = self.outbox.pending_batch(webhook_key, limit, fids, WORKER_ID if self.shard else None,
+                                          self._held_fids())
+        if self.shard:
+            items = [item for item in items if self.outbox.claim(item['id'], WORKER_ID, DELIVERY_CLAIM_TTL)]
+        return items if len(items) >= threshold else None
 
+    def _deliver_digest(self, items: List[Dict]):
         try:
-            if use_api_mode:
-                # API模式：使用全局配置发送
-                token = self._get_feishu_token()
-                if not token:
-                    self.logger.error("无法获取飞书 Token，发送失败")
-                    return False
+            ok = self.send_digest([item['post_data'] for item in items], items[0]['webhook_config'])
+        except DeliveryRejected as e:
+            # 合并消息被拒收时无法判断是哪条帖子的问题，改为逐条发送，只放弃被拒收的那条
+            self.logger.warning(f"摘要被拒收，改为逐条发送: {e}")
+            for item in items:
+                self._get_rate_limiter(item['webhook_config']).acquire()
+                self._deliver(item)
+            return
+        except Exception as e:
+            self.logger.error(f"摘要推送异常: {e}")
+            ok = False
+        for item in items:
+            self._record_delivery(item, ok)
 
-                # 默认使用全局配置中的第一个FID对应的配置作为目标ID（这里需要扩展配置）
-                # 暂时不支持API模式，建议使用Webhook模式
-                self.logger.warning("API模式暂不支持，请使用Webhook模式")
-                return False
+    def _start_delivery(self):
+        """启动时清理历史消息，并为积压的消息启动发送线程"""
+        self.outbox.purge(time.time() - OUTBOX_RETENTION)
+        self._resume_delivery()
 
-            else:
-                # =========== Webhook 发送 ===========
-                payload = {
-                    "msg_type": "interactive",
-                    "card": card_content
-                }
-                requests.post(webhook_url, json=payload, timeout=10)
-                self.logger.info("✅ [飞书] 消息发送成功 (Webhook模式)")
-                return True
+    def _resume_delivery(self):
+        """为积压的消息启动发送线程（分片模式下只看本 worker 持有的FID）"""
+        if self.shard:
+            keys = self.outbox.pending_keys(self.shard.owned(), WORKER_ID)
+        else:
+            keys = self.outbox.pending_keys()
+        for webhook_key in keys:
+            self._ensure_delivery_worker(webhook_key)
 
-        except Exception as e:
-            self.logger.error(f"飞书发送异常: {e}")
+    def _active_fids(self) -> List[int]:
+        """本进程负责轮询的FID：分片模式下为持有租约的FID"""
+        target_fids = self.config.target_fids
+        if self.shard is None:
+            return target_fids
+        owned = self.shard.owned()
+        return [fid for fid in target_fids if fid in owned]
+
+    def _rebalance_shards(self, busy: set) -> set:
+        """
+        续约并重新分配FID，返回新接管的FID
+        释放前先把游标写入共享状态库，接管后从状态库重新加载，保证游标始终只由一个 worker 推进
+        """
+        self._flush_state()
+        acquired, released = self.shard.rebalance(busy)
+        if released:
+            with self.state_lock:
+                for fid in released:
+                    self.state.pop(fid, None)
+                    self._dirty_fids.discard(fid)
+            self.logger.info(f"[分片] {WORKER_ID} 释放FID: {sorted(released)}")
+        if acquired:
+            stored = self.state_store.load()
+            with self.state_lock:
+                for fid in acquired:
+                    self.state[fid] = stored.get(fid, {'last_pid': 0, 'last_tid': 0})
+            self.logger.info(f"[分片] {WORKER_ID} 接管FID: {sorted(acquired)}")
+            self._resume_delivery()
+        return acquired
+
+    def _watch_config(self):
+        """注册 SIGHUP 重新加载配置（仅主线程可注册信号）"""
+        if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, lambda signum, frame: self._reload_requested.set())
+
+    def _config_changed(self) -> bool:
+        try:
+            return os.path.getmtime(self.config.path) != self.config.mtime
+        except OSError:
             return False
-    
+
+    def _reload_config(self):
+        """
+        重新加载配置并就地生效：增删FID、更新Webhook映射、替换Cookie
+        游标、缓存、Token 与队列中的消息保持不变；新配置有误时继续使用当前配置
+        """
+        old = self.config
+        try:
+            new = Config.load(old.path)
+            # 先完整校验，任何状态都还没有改动
+            errors, _ = validate_config(new)
+            if errors:
+                for message in errors:
+                    self.logger.error(f"[配置] ❌ {message}")
+                raise ValueError(f"新配置有 {len(errors)} 处错误")
+            self._apply_config(old, new)
+        except Exception as e:
+            self.logger.error(f"[配置] 重新加载失败，继续使用当前配置: {e}")
+            # 记下本次 mtime，避免每轮重复报错；文件再次修改后重试
+            try:
+                old.mtime = os.path.getmtime(old.path)
+            except OSError:
+                pass
+
+    def _apply_config(self, old: Config, new: Config):
+        """把已通过校验的新配置应用到运行中的实例"""
+        added = [fid for fid in new.target_fids if fid not in old.target_fids]
+        removed = [fid for fid in old.target_fids if fid not in new.target_fids]
+        if self.shard and (added or removed):
+            # 释放租约前先把游标写入共享状态库
+            self._flush_state()
+            released = self.shard.set_fids(new.target_fids)
+            with self.state_lock:
+                for fid in released:
+                    self.state.pop(fid, None)
+                    self._dirty_fids.discard(fid)
+        elif added:
+            with self.state_lock:
+                for fid in added:
+                    self.state.setdefault(fid, {'last_pid': 0, 'last_tid': 0})
+
+        if new.cookie != old.cookie:
+            self.session.headers['Cookie'] = new.cookie
+            self.logger.info("[配置] Cookie 已更新")
+        if new.fid_mappings != old.fid_mappings:
+            # 已入队的消息保留入队时的 webhook 配置；限速器按新配置重建
+            with self._delivery_lock:
+                self._rate_limiters.clear()
+            self.logger.info("[配置] Webhook 映射已更新")
+
+        # 整体替换引用，轮询与入队读取到的总是同一份配置
+        self.config = new
+        if added or removed:
+            self.logger.info(f"[配置] 监控FID已更新: {new.target_fids} (新增 {added}，移除 {removed})")
+        cold = old.cold_changes(new)
+        if cold:
+            self.logger.warning(f"[配置] 以下配置需重启后生效: {', '.join(cold)}")
+        self._check_config()
+
     def run(self):
-        self.logger.info(f"DiscuzSentinel 启动 | 监控FID: {TARGET_FIDS}")
-        mapped_fids = [fid for fid in TARGET_FIDS if str(fid) in FID_MAPPINGS]
+        self.logger.info(f"DiscuzSentinel 启动 | 监控FID: {self.config.target_fids}")
+        mapped_fids = [fid for fid in self.config.target_fids if str(fid) in self.config.fid_mappings]
         self.logger.info(f"已配置Webhook映射的FID: {mapped_fids}")
+        self.logger.info(f"并发配置: 全局 {MAX_CONCURRENCY} | 每主机 {PER_HOST_CONCURRENCY} (间隔 {PER_HOST_MIN_INTERVAL}s)")
+        self.logger.info(f"轮询数据源: {', '.join(source.name for source in self.sources.sources)}")
+        if self.shard:
+            self.logger.info(f"分片模式: worker {WORKER_ID} | 共享文件 {SHARD_FILE} | 租约 {SHARD_LEASE_TTL:.0f}s")
 
         if not (IMAGE_UPLOAD_APP_ID and IMAGE_UPLOAD_APP_SECRET):
             self.logger.warning("提示: 未配置全局图片上传AppID/Secret，图片将以链接形式展示。配置后可直接显示大图。")
 
-        while True:
+        self._start_delivery()
+        self.feishu_pool.start(self.logger)
+        if METRICS_PORT > 0:
             try:
-                for fid in TARGET_FIDS:
-                    fid_state = self.state.get(fid, {'last_pid': 0})
-                    data = self._get_livelastpost(fid, fid_state.get('last_pid', 0))
-                    if data:
-                        # 收集所有新帖子，按时间顺序排序
-                        new_posts = []
-                        max_pid = fid_state.get('last_pid', 0)
-
-                        # 首先按 PID 从小到大处理，确保不遗漏
-                        for item in sorted(data.get('list', []), key=lambda x: int(x.get('pid', 0))):
-                            pid = int(item.get('pid', 0))
-                            if pid <= max_pid:
-                                continue
-                
-                            # 获取帖子数据
-                            post_data = self._extract_from_livelastpost(item, fid)
-                            tid = self._extract_tid_from_message(item.get('message', ''))
-                            if tid:
-                                detail = self._get_thread_detail(tid, pid)
-                                if detail:
-                                    extracted = self._extract_post_content(detail, pid)
-                                    if extracted:
-                                        post_data = extracted
-
-                            if post_data:
-                                # 添加时间戳用于排序
-                                post_data['_timestamp'] = self._parse_timestamp(post_data.get('time', ''))
-                                post_data['_pid'] = pid
-                                new_posts.append(post_data)
-
-                            max_pid = max(max_pid, pid)
-
-                        # 如果有新帖子，按时间顺序排序并立即推送
-                        if new_posts:
-                            # 按时间戳从小到大排序（旧时间在前）
-                            new_posts.sort(key=lambda x: x['_timestamp'])
-
-                            self.logger.info(f"FID {fid}: 发现 {len(new_posts)} 条新内容，开始按时间顺序推送")
-
-                            for post_data in new_posts:
-                                msg = self._format_message(post_data)
-                                pid = post_data['_pid']
-
-                                # 根据FID映射推送
-                                fid_str = str(fid)
-                                if fid_str in FID_MAPPINGS:
-                                    webhook_config = FID_MAPPINGS[fid_str]
-                                    webhook_type = webhook_config.get('webhook_type', '').lower()
-
-                                    if webhook_type == 'dingtalk':
-                                        self.send_dingtalk(msg, post_data, webhook_config)
-                                    elif webhook_type == 'feishu':
-                                        self.send_feishu(msg, post_data, webhook_config)
-                                    else:
-                                        self.logger.warning(f"FID {fid}: 未知的webhook类型: {webhook_type}")
-                                else:
-                                    self.logger.info(f"FID {fid}: 未配置webhook映射，跳过推送")
-
-                                self.logger.info(f"已推送 PID {pid} (时间: {post_data.get('time', '未知')})")
-
-                                # 推送间隔，避免触发限流
-                                time.sleep(1.5)
-
-                        # 更新状态
-                        self.state.setdefault(fid, {})['last_pid'] = max_pid
-                        self._save_state()
+                start_metrics_server(METRICS_HOST, METRICS_PORT)
+                self.logger.info(f"监控指标: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+            except OSError as e:
+                self.logger.error(f"监控指标端口启动失败: {e}")
 
-                    time.sleep(3)
-                time.sleep(random.randint(30, 60))
-            except KeyboardInterrupt:
-                break
-            except Exception as e:
-                self.logger.error(f"主循环异常: {e}")
-                time.sleep(60)
+        self._watch_config()
 
-    def _parse_timestamp(self, time_str: str) -> float:
+        # 每个FID独立调度：到期即提交到线程池，完成后各自安排下一次轮询
+        executor = ThreadPoolExecutor(max_workers=max(1, MAX_CONCURRENCY), thread_name_prefix='poll')
+        next_poll: Dict[int, float] = {}
+        in_flight: Dict[int, Future] = {}
+        next_rebalance = 0.0
+        next_config_check = time.time() + CONFIG_WATCH_INTERVAL
+        next_source_report = time.time() + SOURCE_REPORT_INTERVAL
+        next_purge = time.time() + OUTBOX_PURGE_INTERVAL
+
+        try:
+            while not self._stop_requested.is_set():
+                now = time.time()
+                # SIGHUP 或配置文件变化时重新加载；增删的FID在下面的调度中自然生效
+                if CONFIG_WATCH_INTERVAL > 0 and now >= next_config_check:
+                    next_config_check = now + CONFIG_WATCH_INTERVAL
+                    if self._config_changed():
+                        self._reload_requested.set()
+                if self._reload_requested.is_set():
+                    self._reload_requested.clear()
+                    self._reload_config()
+
+                if self.shard and now >= next_rebalance:
+                    try:
+                        # 补抓中的FID与轮询中的一样暂不释放租约
+                        self._rebalance_shards(set(in_flight) | set(self._backfilling))
+                    except sqlite3.Error as e:
+                        self.logger.error(f"[分片] 续约失败: {e}")
+                    next_rebalance = now + self.shard.ttl / 3
+
+                fids = self._active_fids()
+                due = []
+                for fid in fids:
+                    if fid not in next_poll:
+                        # 恢复上次保存的调度时间（不超过最大间隔）
+                        with self.state_lock:
+                            next_poll[fid] = min(self.state.get(fid, {}).get('next_poll', 0.0), now + POLL_INTERVAL_MAX)
+                    if fid not in in_flight and next_poll[fid] <= now:
+                        due.append(fid)
+                if due and self.sources.has_batch:
+                    # 启用了批量数据源时，即将到期的FID顺带一起轮询，一次请求覆盖更多FID
+                    due += [fid for fid in fids if fid not in in_flight and fid not in due
+                            and next_poll[fid] <= now + POLL_INTERVAL_MIN]
+                for source, group in self.sources.plan(due):
+                    future = executor.submit(self._poll_group, source, group)
+                    for fid in group:
+                        in_flight[fid] = future
+                # 已转移给其他 worker 或已从配置中移除的FID不再调度
+                for fid in set(next_poll) - set(fids) - set(in_flight):
+                    del next_poll[fid]
+
+                for fid, future in list(in_flight.items()):
+                    if not future.done():
+                        continue
+                    del in_flight[fid]
+                    count = None
+                    try:
+                        count = future.result().get(fid)
+                    except Exception as e:
+                        self.logger.error(f"FID {fid}: 轮询异常: {e}")
+                    next_poll[fid] = self._schedule_next(fid, count)
+
+                # 长期运行时定期清理已完成的历史消息，避免发送队列文件无限增长
+                if now >= next_purge:
+                    next_purge = now + OUTBOX_PURGE_INTERVAL
+                    try:
+                        self.outbox.purge(now - OUTBOX_RETENTION)
+                    except sqlite3.Error as e:
+                        self.logger.error(f"清理发送队列失败: {e}")
+
+                if now >= next_source_report:
+                    next_source_report = now + SOURCE_REPORT_INTERVAL
+                    for line in self.sources.report():
+                        self.logger.info(f"[数据源] {line}")
+
+                # 空闲期间也要把积压的状态变化写出
+                if self._dirty_fids and time.time() - self._last_state_flush >= STATE_FLUSH_INTERVAL:
+                    self._flush_state()
+
+                # 等待任一任务完成，或下一个FID到期
+                idle = [next_poll.get(fid, 0.0) for fid in fids if fid not in in_flight]
+                timeout = max(0.1, min(idle) - time.time()) if idle else 1.0
+                if in_flight:
+                    wait(list(in_flight.values()), timeout=min(timeout, 1.0), return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(min(timeout, 1.0))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._shutdown()
+
+    def stop(self):
+        """请求 run() 在本轮调度循环结束后退出（落盘并释放资源后返回），供在其他线程中运行时使用"""
+        self._stop_requested.set()
+
+    def run_once(self, timeout: float = 120) -> int:
         """
-        解析时间字符串为时间戳，用于排序
+        单次运行（供 cron / systemd timer 调用）：每个FID轮询一次，等待到期的消息发送完毕，落盘后返回
+        返回仍有消息待发送的 webhook 数，0 表示全部送达；失败退避中的消息留在发送队列中，下次运行继续发送
         """
+        self.logger.info(f"DiscuzSentinel 单次运行 | 监控FID: {self.config.target_fids}")
+        try:
+            if self.shard:
+                self._rebalance_shards(set())
+            self._start_delivery()
+
+            with ThreadPoolExecutor(max_workers=max(1, MAX_CONCURRENCY), thread_name_prefix='poll') as executor:
+                futures = {}
+                for source, group in self.sources.plan(self._active_fids()):
+                    future = executor.submit(self._poll_group, source, group)
+                    futures.update((fid, future) for fid in group)
+            for fid, future in futures.items():
+                count = None
+                try:
+                    count = future.result().get(fid)
+                except Exception as e:
+                    self.logger.error(f"FID {fid}: 轮询异常: {e}")
+                self._schedule_next(fid, count)
+            for line in self.sources.report():
+                self.logger.info(f"[数据源] {line}")
+
+            # 等待断档补抓与发送线程处理完到期的消息；熔断中的 webhook 不再等待
+            deadline = time.time() + timeout
+            while True:
+                fids = self.shard.owned() if self.shard else None
+                due = [key for key in self.outbox.due_keys(fids, WORKER_ID if self.shard else None,
+                                                           self._held_fids())
+                       if self.breakers.for_webhook(_webhook_url(key)).available()]
+                if (not due and not self._backfilling) or time.time() >= deadline:
+                    break
+                time.sleep(0.2)
+            if due:
+                self.logger.warning(f"等待超时，{len(due)} 个 webhook 仍有消息待发送，下次运行继续")
+            return len(due)
+        finally:
+            self._shutdown()
+
+    def _shutdown(self):
+        """退出前落盘状态与缓存、释放分片租约、关闭连接"""
+        if self.transcode_pool:
+            self.transcode_pool.shutdown(wait=False, cancel_futures=True)
+        self.backfill_executor.shutdown(wait=False, cancel_futures=True)
+        self._flush_state()
+        if self.shard:
+            self.shard.release_all()
+        self.image_cache.flush()
+        self.fingerprints.flush()
+        self.http_clients.close()
+
+    def _stamp_post(self, post_data: Dict, pid: int):
+        """
+        写入排序用的时间戳与 pid；发布时间能解析时另记 _posted_at，推送延迟只按真实的发布时间统计
+        """
+        posted_at = self._parse_dateline(post_data.get('time', ''))
+        if posted_at is not None:
+            post_data['_posted_at'] = posted_at
+        post_data['_timestamp'] = self._parse_timestamp(post_data.get('time', ''))
+        post_data['_pid'] = pid
+
+    def _parse_dateline(self, time_str: str) -> Optional[float]:
+        """解析论坛的发布时间（时间戳或格式化字符串），缺失或无法解析时返回 None"""
         if not time_str:
-            return 0.0
+            return None
 
         # 如果已经是数字时间戳
         if str(time_str).isdigit():
-            try:
-                return float(time_str)
-            except:
-                pass
+            return float(time_str)
 
-        # 如果是格式化的时间字符串，尝试解析
-        try:
-            # 常见的格式：2025-12-25 13:08:20
-            if isinstance(time_str, str):
-                dt = datetime.strptime(time_str, '%Y-%m-%d %H:%M:%S')
-                return dt.timestamp()
-        except:
-            pass
+        # 常见的格式：2025-12-25 13:08:20，部分页面不带秒
+        if isinstance(time_str, str):
+            for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'):
+                try:
+                    return datetime.strptime(time_str.strip(), fmt).timestamp()
+                except ValueError:
+                    continue
+        return None
 
+    def _parse_timestamp(self, time_str: str) -> float:
+        """
+        解析时间字符串为时间戳，用于排序
+        """
+        if not time_str:
+            return 0.0
+        posted_at = self._parse_dateline(time_str)
         # 如果解析失败，返回当前时间戳作为默认值
-        return time.time()
+        return time.time() if posted_at is None else posted_at
+
+# ==================== 命令行 ====================
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='discuz_sentinel', description="DiscuzSentinel - Discuz! 论坛新帖监控")
+    parser.add_argument('-c', '--config', help="配置文件路径（默认取环境变量 DISCUZ_SENTINEL_CONFIG，否则为 config.json）")
+    commands = parser.add_subparsers(dest='command', metavar='{run,once,check-config,bench,loadtest}')
+    commands.add_parser('run', help="持续轮询并推送（默认）")
+    once = commands.add_parser('once', help="每个FID轮询一次，推送并保存状态后退出，适合 cron / systemd timer")
+    once.add_argument('--timeout', type=float, default=120, help="等待消息发送完成的最长时间(秒)，默认 120")
+    commands.add_parser('check-config', help="检查配置文件后退出")
+    commands.add_parser('bench', help="运行消息热路径微基准，其余参数传给 bench_sentinel.py", add_help=False)
+    commands.add_parser('loadtest', help="启动本地模拟服务做端到端压测，其余参数传给 loadtest_sentinel.py", add_help=False)
+    args, extra = parser.parse_known_args(argv)
+    command = args.command or 'run'
+
+    if command == 'bench':
+        if args.config:
+            os.environ['DISCUZ_SENTINEL_CONFIG'] = args.config
+        import bench_sentinel
+        return bench_sentinel.main(extra)
+    if command == 'loadtest':
+        import loadtest_sentinel
+        return loadtest_sentinel.main(extra)
+    if extra:
+        parser.error(f"无法识别的参数: {' '.join(extra)}")
+
+    try:
+        config = Config.load(args.config)
+        if command == 'check-config':
+            # 按启动时的方式解析一遍，提前发现类型错误
+            configure(config)
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    if command == 'check-config':
+        errors, warnings = validate_config(config)
+        for message in warnings:
+            print(f"⚠️  {message}")
+        for message in errors:
+            print(f"❌ {message}")
+        if not errors:
+            print(f"✅ 配置有效: {config.path} | 监控FID: {config.target_fids}")
+        return 1 if errors else 0
+
+    sentinel = DiscuzSentinel(config)
+    if command == 'once':
+        return 1 if sentinel.run_once(args.timeout) else 0
+    sentinel.run()
+    return 0
 
 if __name__ == "__main__":
-    DiscuzSentinel().run()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
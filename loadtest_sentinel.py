@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DiscuzSentinel 端到端压测
+在子进程中启动本地模拟服务：论坛（livelastpost / viewthread / 版块列表 / 导读 / RSS / findpost / 帖子网页 / 附件图片）、
+图床上传、飞书开放平台（Token / 图片上传 / 机器人）与钉钉机器人。按设定的发帖速率、图片数量与大小、延迟和错误率生成负载，
+在本进程中用真实的 DiscuzSentinel 轮询并推送，最后输出吞吐、发帖→推送与发现→推送的延迟分位数，以及 CPU、内存、线程数。
+
+用法：
+    python loadtest_sentinel.py                                  # 默认 4 个FID、每秒 2 帖、运行 60 秒
+    python loadtest_sentinel.py --rate 20 --fids 16 --duration 120
+    python loadtest_sentinel.py --images 4 --image-size 500000 --upload-latency 0.5
+    python loadtest_sentinel.py --error-rate 0.05 --hotlink-rate 0.1     # 论坛 504 与防盗链页面
+    python loadtest_sentinel.py --image-delivery followup --sources livelastpost,guide
+    python loadtest_sentinel.py --set system.max_concurrency=8 --json out.json
+    python discuz_sentinel.py loadtest ...                       # 同上
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+os.environ.setdefault('DISCUZ_SENTINEL_CONFIG', os.path.join(FIXTURES_DIR, 'config.json'))
+
+import discuz_sentinel as ds  # noqa: E402
+
+# 帖子正文中的标记，模拟机器人据此把收到的消息对应回帖子
+MARKER = 'lt:'
+# 生成正文用的词表，保证每条帖子内容不同，不被内容指纹去重
+WORDS = ('行情', '大盘', '板块', '低吸', '高抛', '仓位', '龙头', '量能', '回调', '突破', '均线', '资金',
+         '情绪', '题材', '复盘', '止损', '打板', '分时', '放量', '缩量', '利好', '利空', '主力', '散户')
+# livelastpost 每次最多返回的条数，超出时 count 大于列表长度
+LIVELASTPOST_LIMIT = 20
+
+# ==================== 模拟论坛数据 ====================
+
+class StubWorld:
+    """模拟服务共享的帖子数据与统计（运行在子进程中）"""
+
+    def __init__(self, options: Dict):
+        self.options = options
+        self.fids: List[int] = list(range(1001, 1001 + options['fids']))
+        self.lock = threading.Lock()
+        self.posts: Dict[int, Dict] = {}
+        self.threads: Dict[int, Dict] = {}
+        self.fid_pids: Dict[int, List[int]] = {fid: [] for fid in self.fids}
+        self.next_pid = 100000
+        self.next_tid = 5000
+        self.detected: Dict[int, float] = {}
+        self.delivered: Dict[int, float] = {}
+        self.messages: Dict[str, int] = {}
+        self.requests: Dict[str, int] = {}
+        self.generating = threading.Event()
+        self.urls: Dict[str, str] = {}
+
+    def count(self, table: Dict[str, int], key: str):
+        with self.lock:
+            table[key] = table.get(key, 0) + 1
+
+    def delay(self, key: str):
+        latency = self.options[key]
+        if latency > 0:
+            time.sleep(random.uniform(0.5, 1.5) * latency)
+
+    # ---------- 发帖 ----------
+
+    def generate(self):
+        """按泊松过程发帖：约 20% 为新主题，其余回复本版块已有主题"""
+        while True:
+            self.generating.wait()
+            time.sleep(random.expovariate(self.options['rate']))
+            if self.generating.is_set():
+                self.add_post()
+
+    def add_post(self) -> int:
+        fid = random.choice(self.fids)
+        now = time.time()
+        with self.lock:
+            pid = self.next_pid = self.next_pid + 1
+            fid_threads = [tid for tid, thread in self.threads.items() if thread['fid'] == fid]
+            if not fid_threads or random.random() < 0.2:
+                tid = self.next_tid = self.next_tid + 1
+                self.threads[tid] = {'fid': fid, 'tid': tid, 'subject': f"压测主题 {tid}", 'pids': [],
+                                     'created': now, 'lastpost': now}
+            else:
+                # 回复偏向最近的主题，模拟热帖
+                tid = max(random.sample(fid_threads, min(3, len(fid_threads))))
+            thread = self.threads[tid]
+            thread['pids'].append(pid)
+            thread['lastpost'] = now
+            text = ''.join(random.choice(WORDS) for _ in range(random.randint(12, 40)))
+            images = ''.join(
+                f'<img src="{self.urls["forum"]}/data/attachment/forum/{pid}_{i}.jpg" />'
+                for i in range(self.options['images'])
+            )
+            self.posts[pid] = {
+                'pid': pid, 'tid': tid, 'fid': fid, 'created': now, 'author': f"user{pid % 97}",
+                'message': f"{MARKER}{pid} {text}<br />{images}",
+            }
+            self.fid_pids[fid].append(pid)
+        return pid
+
+    def post_item(self, pid: int) -> Dict:
+        post = self.posts[pid]
+        first = self.threads[post['tid']]['pids'][0] == pid
+        return {'pid': str(pid), 'tid': str(post['tid']), 'author': post['author'],
+                'dateline': str(int(post['created'])), 'message': post['message'], 'first': '1' if first else '0'}
+
+    def mark_detected(self, pids):
+        now = time.time()
+        with self.lock:
+            for pid in pids:
+                self.detected.setdefault(pid, now)
+
+    def record_delivery(self, kind: str, body: str):
+        now = time.time()
+        self.count(self.messages, kind)
+        with self.lock:
+            for pid in re.findall(re.escape(MARKER) + r'(\d+)', body):
+                self.delivered.setdefault(int(pid), now)
+
+    def thread_page(self, tid: int, page: int) -> Dict:
+        ppp = self.options['ppp']
+        with self.lock:
+            thread = self.threads[tid]
+            pids = list(thread['pids'])
+            last_page = max(1, (len(pids) + ppp - 1) // ppp)
+            page = min(max(1, page), last_page)
+            page_pids = pids[(page - 1) * ppp:page * ppp]
+            postlist = [self.post_item(pid) for pid in page_pids]
+        self.mark_detected(page_pids)
+        return {'Variables': {
+            'ppp': str(ppp),
+            'thread': {'tid': str(tid), 'fid': str(thread['fid']), 'subject': thread['subject'],
+                       'replies': str(len(pids) - 1)},
+            'postlist': postlist,
+        }}
+
+    def thread_list(self, fid: Optional[int], limit: int) -> List[Dict]:
+        with self.lock:
+            threads = [t for t in self.threads.values() if fid is None or t['fid'] == fid]
+            threads.sort(key=lambda t: t['lastpost'], reverse=True)
+            return [{'tid': str(t['tid']), 'fid': str(t['fid']), 'subject': t['subject'],
+                     'dblastpost': str(int(t['lastpost'])), 'replies': str(len(t['pids']) - 1), 'displayorder': '0'}
+                    for t in threads[:limit]]
+
+    def stats(self) -> Dict:
+        with self.lock:
+            created = {pid: post['created'] for pid, post in self.posts.items()}
+            return {
+                'generated': len(self.posts),
+                'created': created,
+                'detected': dict(self.detected),
+                'delivered': dict(self.delivered),
+                'messages': dict(self.messages),
+                'requests': dict(self.requests),
+            }
+
+# ==================== 模拟服务 ====================
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    world: StubWorld = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status: int, body, content_type: str = 'application/json; charset=utf-8', headers: Dict = None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, ensure_ascii=False)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _query(self) -> Dict[str, str]:
+        return {key: values[0] for key, values in parse_qs(urlsplit(self.path).query).items()}
+
+class ForumHandler(_StubHandler):
+    """论坛：livelastpost、mobile API、RSS、findpost、帖子网页与附件图片"""
+
+    def do_GET(self):
+        world = self.world
+        path, query = urlsplit(self.path).path, self._query()
+        if path.startswith('/data/attachment/'):
+            return self._image(path)
+
+        world.delay('latency')
+        if random.random() < world.options['error_rate']:
+            world.count(world.requests, 'forum_504')
+            return self._send(504, '<html><body><h1>504 Gateway Time-out</h1></body></html>', 'text/html')
+
+        if path == '/forum.php' and query.get('action') == 'livelastpost':
+            return self._livelastpost(int(query.get('fid', 0)), int(query.get('postid', 0)))
+        if path == '/forum.php' and query.get('goto') == 'findpost':
+            return self._findpost(int(query.get('ptid', 0)), int(query.get('pid', 0)))
+        if path == '/forum.php' and query.get('mod') == 'rss':
+            return self._rss(int(query['fid']) if query.get('fid') else None)
+        if path == '/api/mobile/index.php':
+            module = query.get('module')
+            world.count(world.requests, module or 'api')
+            if module == 'viewthread' and int(query.get('tid', 0)) in world.threads:
+                return self._send(200, world.thread_page(int(query['tid']), int(query.get('page', 1))))
+            if module == 'forumdisplay':
+                threads = world.thread_list(int(query.get('fid', 0)), 20 * int(query.get('page', 1)))[-20:]
+                return self._send(200, {'Variables': {'forum_threadlist': threads}})
+            if module == 'forumguide':
+                return self._send(200, {'Variables': {'forum_threadlist': world.thread_list(None, 50)}})
+            return self._send(200, {'Message': {'messageval': 'thread_nonexistence'}})
+        m = re.match(r'/thread-(\d+)-(\d+)-1\.html$', path)
+        if m and int(m.group(1)) in world.threads:
+            return self._thread_html(int(m.group(1)), int(m.group(2)))
+        self._send(404, {'error': 'not found'})
+
+    def _livelastpost(self, fid: int, postid: int):
+        world = self.world
+        world.count(world.requests, 'livelastpost')
+        with world.lock:
+            pids = [pid for pid in world.fid_pids.get(fid, []) if pid > postid]
+            items = []
+            for pid in pids[-LIVELASTPOST_LIMIT:][::-1]:
+                post = world.posts[pid]
+                items.append({
+                    'pid': str(pid), 'author': post['author'], 'dateline': str(int(post['created'])),
+                    'message': f'<a href="thread-{post["tid"]}-1-1.html">{world.threads[post["tid"]]["subject"]}</a> '
+                               f'{post["message"]}',
+                })
+        world.mark_detected(int(item['pid']) for item in items)
+        self._send(200, {'count': str(len(pids)), 'list': items})
+
+    def _findpost(self, tid: int, pid: int):
+        world = self.world
+        world.count(world.requests, 'findpost')
+        with world.lock:
+            pids = world.threads.get(tid, {}).get('pids', [])
+            page = pids.index(pid) // world.options['ppp'] + 1 if pid in pids else 1
+        self._send(302, b'', 'text/html', {'Location': f"forum.php?mod=viewthread&tid={tid}&page={page}#pid{pid}"})
+
+    def _rss(self, fid: Optional[int]):
+        world = self.world
+        world.count(world.requests, 'rss')
+        with world.lock:
+            threads = [t for t in world.threads.values() if fid is None or t['fid'] == fid]
+            threads = sorted(threads, key=lambda t: t['created'], reverse=True)[:20]
+            items = ''.join(
+                f"<item><title>{t['subject']}</title>"
+                f"<link>{world.urls['forum']}/forum.php?mod=viewthread&amp;tid={t['tid']}</link>"
+                f"<category>版块{t['fid']}</category><pubDate>{formatdate(t['created'])}</pubDate></item>"
+                for t in threads
+            )
+        self._send(200, f'<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel>{items}</channel></rss>',
+                   'application/xml; charset=utf-8')
+
+    def _thread_html(self, tid: int, page: int):
+        world = self.world
+        world.count(world.requests, 'thread_html')
+        data = world.thread_page(tid, page)
+        cells = ''.join(f'<tr><td class="t_f" id="postmessage_{p["pid"]}">{p["message"]}</td></tr>'
+                        for p in data['Variables']['postlist'])
+        self._send(200, f"<html><body><table>{cells}</table></body></html>", 'text/html; charset=utf-8')
+
+    def _image(self, path: str):
+        world = self.world
+        world.delay('image_latency')
+        # 同一张图片的防盗链结果固定，便于验证失败冷却
+        if random.Random(path).random() < world.options['hotlink_rate']:
+            world.count(world.requests, 'image_hotlink')
+            return self._send(200, '<!DOCTYPE html><html><body>禁止外链</body></html>', 'text/html; charset=utf-8')
+        world.count(world.requests, 'image')
+        size = max(128, world.options['image_size'])
+        body = b'\xFF\xD8\xFF\xE0' + random.Random(path).randbytes(size - 4)
+        self._send(200, body, 'image/jpeg')
+
+class ImageHostHandler(_StubHandler):
+    """图床上传接口"""
+
+    def do_POST(self):
+        world = self.world
+        self._body()
+        world.delay('upload_latency')
+        world.count(world.requests, 'image_host_upload')
+        n = random.randint(1, 10 ** 9)
+        self._send(200, {'code': 200, 'data': {'url': f"{world.urls['image_host']}/i/{n}.jpg"}})
+
+class FeishuHandler(_StubHandler):
+    """飞书开放平台：Token、图片上传与自定义机器人"""
+
+    def do_POST(self):
+        world = self.world
+        path = urlsplit(self.path).path
+        body = self._body()
+        if path.endswith('/tenant_access_token/internal'):
+            world.count(world.requests, 'feishu_token')
+            return self._send(200, {'code': 0, 'tenant_access_token': 't-loadtest', 'expire': 7200})
+        if path.endswith('/im/v1/images'):
+            world.delay('upload_latency')
+            world.count(world.requests, 'feishu_image')
+            return self._send(200, {'code': 0, 'data': {'image_key': f"img_v2_{random.randint(1, 10 ** 9)}"}})
+        if '/bot/v2/hook/' in path:
+            world.delay('webhook_latency')
+            world.record_delivery('feishu', body.decode('utf-8', 'replace'))
+            return self._send(200, {'code': 0, 'msg': 'success'})
+        self._send(404, {'code': 404})
+
+class DingtalkHandler(_StubHandler):
+    """钉钉自定义机器人"""
+
+    def do_POST(self):
+        world = self.world
+        body = self._body()
+        world.delay('webhook_latency')
+        world.record_delivery('dingtalk', body.decode('utf-8', 'replace'))
+        self._send(200, {'errcode': 0, 'errmsg': 'ok'})
+
+def run_stubs(options: Dict, conn):
+    """子进程入口：启动各模拟服务，按父进程的指令开始/暂停发帖、返回统计、退出"""
+    world = StubWorld(options)
+    servers = {}
+    for name, handler in (('forum', ForumHandler), ('image_host', ImageHostHandler),
+                          ('feishu', FeishuHandler), ('dingtalk', DingtalkHandler)):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), type(handler.__name__, (handler,), {'world': world}))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers[name] = server
+        world.urls[name] = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=world.generate, daemon=True).start()
+    conn.send({'urls': world.urls, 'fids': world.fids})
+
+    while True:
+        command = conn.recv()
+        if command == 'start':
+            world.generating.set()
+        elif command == 'pause':
+            world.generating.clear()
+        elif command == 'stats':
+            conn.send(world.stats())
+        elif command == 'stop':
+            break
+    for server in servers.values():
+        server.shutdown()
+
+# ==================== 压测驱动 ====================
+
+def build_config(args, urls: Dict[str, str], fids: List[int], workdir: str) -> Dict:
+    mappings = {}
+    for i, fid in enumerate(fids):
+        kind = args.webhook if args.webhook != 'mixed' else ('feishu' if i % 2 == 0 else 'dingtalk')
+        if kind == 'feishu':
+            mapping = {'webhook_url': f"{urls['feishu']}/open-apis/bot/v2/hook/{fid}", 'webhook_type': 'feishu'}
+        else:
+            mapping = {'webhook_url': f"{urls['dingtalk']}/robot/send?access_token={fid}", 'webhook_type': 'dingtalk'}
+        mapping['image_delivery'] = args.image_delivery
+        if args.webhook_rate:
+            mapping['rate_per_minute'] = args.webhook_rate
+        mappings[str(fid)] = mapping
+
+    config = {
+        'discuz': {'target_fids': ','.join(map(str, fids)), 'cookie': 'auth=loadtest', 'base_url': urls['forum']},
+        'image_upload': {
+            'app_id': 'cli_loadtest', 'app_secret': 'loadtest',
+            'upload_url': f"{urls['image_host']}/upload/upload.html",
+            'feishu_base_url': urls['feishu'],
+            'cache_file': '',
+        },
+        'notifications': {'fid_mappings': mappings},
+        'system': {
+            'log_file': '',
+            'log_level': args.log_level,
+            'state_file': os.path.join(workdir, 'state.json'),
+            'outbox_file': os.path.join(workdir, 'outbox.db'),
+            'fingerprint_file': '',
+            'poll_interval_min': args.poll_interval,
+            'poll_interval_max': max(args.poll_interval, 10),
+            'poll_budget_per_minute': 0,
+            'per_host_min_interval': 0,
+            'poll_sources': args.sources.split(','),
+            'config_watch_interval': 0,
+        },
+    }
+    for item in args.set:
+        key, _, value = item.partition('=')
+        section, _, name = key.partition('.')
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        config.setdefault(section, {})[name] = value
+    return config
+
+class ResourceSampler:
+    """每秒采样本进程（即 DiscuzSentinel，不含模拟服务）的内存与线程数"""
+
+    def __init__(self):
+        self.rss: List[float] = []
+        self.threads: List[int] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def rss_mib() -> float:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+        except (OSError, ValueError, AttributeError):
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def _run(self):
+        while not self._stop.wait(1.0):
+            self.rss.append(self.rss_mib())
+            self.threads.append(threading.active_count())
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]  # noqa: E731
+    return {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': values[-1]}
+
+def summarize(stats: Dict, started: float, duration: float, cpu: float, sampler: ResourceSampler) -> Dict:
+    created, detected, delivered = stats['created'], stats['detected'], stats['delivered']
+    end_to_end = [delivered[pid] - created[pid] for pid in delivered if pid in created]
+    detect_to_delivery = [delivered[pid] - detected[pid] for pid in delivered if pid in detected]
+    detection = [detected[pid] - created[pid] for pid in detected if pid in created]
+    last = max(delivered.values()) if delivered else started
+    return {
+        'generated': stats['generated'],
+        'detected': len(detected),
+        'delivered': len(delivered),
+        'throughput_per_second': len(delivered) / max(1e-6, last - started),
+        'latency_post_to_delivery': percentiles(end_to_end),
+        'latency_post_to_detection': percentiles(detection),
+        'latency_detection_to_delivery': percentiles(detect_to_delivery),
+        'messages': stats['messages'],
+        'requests': stats['requests'],
+        'cpu_seconds': cpu,
+        'cpu_percent': 100 * cpu / max(1e-6, duration),
+        'rss_mib_peak': max(sampler.rss, default=ResourceSampler.rss_mib()),
+        'rss_mib_end': sampler.rss[-1] if sampler.rss else ResourceSampler.rss_mib(),
+        'threads_peak': max(sampler.threads, default=threading.active_count()),
+    }
+
+def print_report(result: Dict):
+    print(f"\n发帖 {result['generated']} | 发现 {result['detected']} | 推送 {result['delivered']} | "
+          f"吞吐 {result['throughput_per_second']:.2f} 帖/秒")
+    for key, label in (('latency_post_to_detection', '发帖→发现'), ('latency_detection_to_delivery', '发现→推送'),
+                       ('latency_post_to_delivery', '发帖→推送')):
+        p = result[key]
+        if p:
+            print(f"{label:<8} p50 {p['p50']:7.2f}s  p90 {p['p90']:7.2f}s  p99 {p['p99']:7.2f}s  max {p['max']:7.2f}s")
+    print(f"CPU {result['cpu_seconds']:.1f}s ({result['cpu_percent']:.0f}%) | 内存峰值 {result['rss_mib_peak']:.1f} MiB | "
+          f"结束时 {result['rss_mib_end']:.1f} MiB | 线程峰值 {result['threads_peak']}")
+    print(f"收到消息: {result['messages']}")
+    print(f"模拟服务请求: {result['requests']}")
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="DiscuzSentinel 端到端压测（本地模拟论坛、图床、飞书与钉钉）")
+    parser.add_argument('--duration', type=float, default=60, help="发帖持续时间(秒)")
+    parser.add_argument('--drain', type=float, default=60, help="停止发帖后等待推送完成的最长时间(秒)")
+    parser.add_argument('--fids', type=int, default=4, help="模拟的FID数量")
+    parser.add_argument('--rate', type=float, default=2, help="全站发帖速率(帖/秒)")
+    parser.add_argument('--images', type=int, default=1, help="每帖图片数")
+    parser.add_argument('--image-size', type=int, default=100 * 1024, help="每张图片大小(字节)")
+    parser.add_argument('--ppp', type=int, default=10, help="主题每页帖数")
+    parser.add_argument('--latency', type=float, default=0.05, help="论坛接口平均延迟(秒)")
+    parser.add_argument('--image-latency', type=float, default=0.05, help="图片下载平均延迟(秒)")
+    parser.add_argument('--upload-latency', type=float, default=0.1, help="图床/飞书图片上传平均延迟(秒)")
+    parser.add_argument('--webhook-latency', type=float, default=0.05, help="机器人接口平均延迟(秒)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="论坛接口返回 504 的比例")
+    parser.add_argument('--hotlink-rate', type=float, default=0.0, help="图片返回防盗链 HTML 页面的比例")
+    parser.add_argument('--webhook', choices=('feishu', 'dingtalk', 'mixed'), default='mixed', help="机器人类型")
+    parser.add_argument('--webhook-rate', type=float, help="覆盖每个机器人的每分钟发送上限")
+    parser.add_argument('--image-delivery', choices=('inline', 'followup'), default='inline', help="图片推送方式")
+    parser.add_argument('--sources', default='livelastpost', help="轮询数据源，逗号分隔")
+    parser.add_argument('--poll-interval', type=float, default=2, help="轮询间隔下限(秒)")
+    parser.add_argument('--log-level', default='ERROR', help="DiscuzSentinel 日志级别")
+    parser.add_argument('--set', action='append', default=[], metavar='SECTION.KEY=VALUE',
+                        help="覆盖任意配置项，值按 JSON 解析，如 --set system.max_concurrency=8")
+    parser.add_argument('--json', dest='json_file', help="将结果另存为 JSON 文件")
+    args = parser.parse_args(argv)
+
+    # 模拟服务在本机，不经过代理
+    os.environ['NO_PROXY'] = ','.join(filter(None, [os.environ.get('NO_PROXY'), '127.0.0.1', 'localhost']))
+    options = {key: getattr(args, key) for key in ('fids', 'rate', 'images', 'image_size', 'ppp', 'latency',
+                                                   'image_latency', 'upload_latency', 'webhook_latency',
+                                                   'error_rate', 'hotlink_rate')}
+    conn, child_conn = multiprocessing.Pipe()
+    stubs = multiprocessing.Process(target=run_stubs, args=(options, child_conn), daemon=True)
+    stubs.start()
+    info = conn.recv()
+    workdir = tempfile.mkdtemp(prefix='sentinel-loadtest-')
+    try:
+        config_file = os.path.join(workdir, 'config.json')
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump(build_config(args, info['urls'], info['fids'], workdir), f, ensure_ascii=False, indent=2)
+        sentinel = ds.DiscuzSentinel(ds.Config.load(config_file))
+        print(f"模拟服务: {info['urls']}")
+        print(f"FID {len(info['fids'])} 个 | 发帖 {args.rate}/秒 × {args.duration:.0f} 秒 | "
+              f"每帖 {args.images} 张图片 × {args.image_size // 1024} KiB | 数据源 {args.sources}")
+
+        sampler = ResourceSampler()
+        cpu_start = sum(os.times()[:2])
+        started = time.time()
+        sampler.start()
+        runner = threading.Thread(target=sentinel.run, name='sentinel', daemon=True)
+        runner.start()
+        conn.send('start')
+        time.sleep(args.duration)
+        conn.send('pause')
+
+        # 停止发帖后等待积压的帖子推送完
+        deadline = time.time() + args.drain
+        while True:
+            conn.send('stats')
+            stats = conn.recv()
+            if len(stats['delivered']) >= stats['generated'] or time.time() >= deadline:
+                break
+            time.sleep(1)
+        sentinel.stop()
+        runner.join(timeout=30)
+        sampler.stop()
+        duration = time.time() - started
+        result = summarize(stats, started, duration, sum(os.times()[:2]) - cpu_start, sampler)
+        result['options'] = vars(args)
+        result['sources'] = sentinel.sources.report()
+    finally:
+        conn.send('stop')
+        stubs.join(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(result)
+    for line in result['sources']:
+        print(f"[数据源] {line}")
+    if args.json_file:
+        with open(args.json_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+测试断档补抓：断档识别、按 PID 顺序补发、补完前暂停推送、失败退避、断档状态持久化
+"""
+
+import logging
+import time
+
+import discuz_sentinel as ds
+
+logger = logging.getLogger("test_backfill")
+
+class _Response:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+def _viewthread(tid, pids, replies, ppp=2):
+    return {'Variables': {
+        'ppp': ppp,
+        'thread': {'tid': tid, 'subject': f'主题{tid}', 'replies': replies},
+        'postlist': [{'pid': pid, 'author': 'a', 'dateline': str(pid), 'message': f'内容 {pid}'} for pid in pids],
+    }}
+
+def test_detect_gap_from_truncated_list():
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    data = {'count': 2, 'list': [{}, {}]}
+    items = [(120, {}), (121, {})]
+
+    # PID 全站递增，不连续不代表断档；列表完整时即使停机很久也不补抓
+    assert sentinel._detect_gap(data, items, 100, time.time() - 30) is None
+    assert sentinel._detect_gap(data, items, 100, time.time() - 3600) is None
+    assert sentinel._detect_gap({'count': 50, 'list': [{}, {}]}, items, 100, time.time())[:2] == [100, 120]
+
+def test_backfill_enqueues_in_pid_order(monkeypatch):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    now = time.time()
+    threads = [
+        {'tid': 1, 'dblastpost': now, 'displayorder': 1},
+        {'tid': 2, 'dblastpost': now},
+        {'tid': 3, 'dblastpost': now - 10},
+        {'tid': 4, 'dblastpost': now - 86400},
+    ]
+    pages = {
+        (1, 1): _viewthread(1, [90, 91], 1),
+        (2, 1): _viewthread(2, [50, 60], 4),
+        (2, 2): _viewthread(2, [99, 103], 4),
+        (2, 3): _viewthread(2, [105], 4),
+        (3, 1): _viewthread(3, [101, 104], 1),
+    }
+    monkeypatch.setattr(sentinel, '_forum_get', lambda url, params, timeout: _Response(
+        {'Variables': {'forum_threadlist': threads if params['page'] == 1 else []}}))
+    monkeypatch.setattr(sentinel, '_fetch_viewthread', lambda tid, page=1, max_age=None: pages[(tid, page)])
+    enqueued = []
+    monkeypatch.setattr(sentinel, '_enqueue_post', lambda fid, post: enqueued.append(post['_pid']))
+
+    sentinel.state[147] = {'last_pid': 110, 'last_tid': 0, 'gaps': [[100, 106, now - 600]]}
+    sentinel._backfilling.add(147)
+    sentinel._backfill_fid(147)
+
+    assert enqueued == [101, 103, 104, 105]
+    assert 'gaps' not in sentinel.state[147]
+    assert not sentinel._backfilling
+
+def test_gaps_survive_sqlite_round_trip(tmp_path):
+    store = ds.SqliteStateStore(str(tmp_path / 'state.db'), logger)
+    store.save({147: {'last_pid': 110, 'last_tid': 0, 'gaps': [[100, 106, 1700000000.0]]},
+                148: {'last_pid': 5, 'last_tid': 0}}, {147, 148})
+
+    state = store.load()
+    assert state[147]['gaps'] == [[100, 106, 1700000000.0]]
+    assert 'gaps' not in state[148]
+
+def test_gap_holds_delivery_until_backfilled():
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    webhook = sentinel.config.fid_mappings['147']
+    url = webhook['webhook_url']
+    sentinel.state[147] = {'last_pid': 120, 'last_tid': 0, 'gaps': [[100, 120, time.time() - 600]]}
+    sentinel.outbox.enqueue(147, 120, webhook, {'subject': '实时'})
+
+    # 断档未补完时不推送该FID的新帖
+    assert sentinel.outbox.next_pending(url, held=sentinel._held_fids()) is None
+
+    # 补抓找回的旧帖入队较晚，但按 PID 排在前面
+    sentinel.outbox.enqueue(147, 105, webhook, {'subject': '补抓'})
+    sentinel.state[147].pop('gaps')
+    assert sentinel.outbox.next_pending(url, held=sentinel._held_fids())['pid'] == 105
+
+def test_failed_backfill_backs_off(monkeypatch):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    calls = []
+
+    def fail(fid, lo, hi, since):
+        calls.append(fid)
+        raise ValueError('forum down')
+
+    monkeypatch.setattr(sentinel, '_backfill_range', fail)
+    monkeypatch.setattr(ds.threading, 'Thread', _InlineThread)
+    sentinel.state[147] = {'last_pid': 120, 'last_tid': 0, 'gaps': [[100, 120, time.time() - 600]]}
+
+    sentinel._start_backfill(147)
+    sentinel._start_backfill(147)
+    assert calls == [147]
+    assert sentinel.state[147]['gaps']
+
+    # 连续失败达到上限后放弃断档，恢复推送
+    for _ in range(ds.BACKFILL_MAX_ATTEMPTS - 1):
+        sentinel._backfill_retry[147] = (sentinel._backfill_retry[147][0], 0)
+        sentinel._start_backfill(147)
+    assert len(calls) == ds.BACKFILL_MAX_ATTEMPTS
+    assert 'gaps' not in sentinel.state[147]
+    assert 147 not in sentinel._held_fids()
+
+class _InlineThread:
+    def __init__(self, target, args=(), **kwargs):
+        self._target, self._args = target, args
+
+    def start(self):
+        self._target(*self._args)
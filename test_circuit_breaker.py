@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+测试熔断器：连续失败后打开、冷却后单个探测、探测结果决定关闭或重新打开
+"""
+
+import pytest
+import requests
+
+import discuz_sentinel as ds
+
+def _fail(breaker):
+    with pytest.raises(requests.exceptions.ConnectionError):
+        with breaker.guard():
+            raise requests.exceptions.ConnectionError('down')
+
+def test_opens_after_consecutive_failures():
+    breaker = ds.CircuitBreaker('test-open', failure_threshold=3, reset_timeout=60)
+    _fail(breaker)
+    _fail(breaker)
+    with breaker.guard() as call:
+        call.failed = True  # HTTP 5xx
+    assert breaker.state == ds.CircuitBreaker.OPEN
+    assert not breaker.available()
+
+    with pytest.raises(ds.CircuitOpenError):
+        with breaker.guard():
+            pytest.fail('熔断打开时不应发起调用')
+
+def test_half_open_allows_single_probe():
+    breaker = ds.CircuitBreaker('test-probe', failure_threshold=1, reset_timeout=0)
+    _fail(breaker)
+
+    assert breaker.allow()
+    assert breaker.state == ds.CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == ds.CircuitBreaker.CLOSED
+    assert 'sentinel_circuit_state{endpoint="test-probe"} 0.0' in ds.METRICS.render()
+
+def test_failed_probe_reopens():
+    breaker = ds.CircuitBreaker('test-reopen', failure_threshold=1, reset_timeout=0)
+    _fail(breaker)
+    breaker.reset_timeout = 60
+    breaker._opened_at -= 60
+
+    _fail(breaker)
+    assert breaker.state == ds.CircuitBreaker.OPEN
+    assert breaker.retry_in() > 0
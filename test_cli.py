@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+测试命令行：导入模块不读取配置、不加载重依赖；check-config 的退出码
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import discuz_sentinel as ds
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def test_import_without_config():
+    env = dict(os.environ, DISCUZ_SENTINEL_CONFIG=os.path.join(ROOT, 'missing.json'))
+    code = "import sys, discuz_sentinel; print(sorted({'requests', 'bs4'} & set(sys.modules)))"
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '[]'
+
+def test_check_config(tmp_path, capsys):
+    assert ds.main(['check-config']) == 0
+
+    with open(ds.config_path(), encoding='utf-8') as f:
+        data = json.load(f)
+    data['notifications']['fid_mappings']['147']['webhook_type'] = 'slack'
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(data), encoding='utf-8')
+    assert ds.main(['-c', str(path), 'check-config']) == 1
+    assert 'webhook_type' in capsys.readouterr().out
+
+    assert ds.main(['-c', str(tmp_path / 'missing.json'), 'check-config']) == 1
+
+def test_loadtest_delivers_every_post(tmp_path, capsys):
+    out = tmp_path / 'loadtest.json'
+    assert ds.main(['loadtest', '--duration', '3', '--drain', '30', '--rate', '4', '--fids', '2',
+                    '--poll-interval', '0.5', '--json', str(out)]) == 0
+
+    result = json.loads(out.read_text(encoding='utf-8'))
+    assert result['generated'] > 0
+    assert result['delivered'] == result['generated']
+    assert result['latency_post_to_delivery']['p50'] > 0
+    assert '发帖→推送' in capsys.readouterr().out
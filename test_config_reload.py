@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+测试配置热加载：增删FID、替换Cookie、更新映射，游标保持不变；错误配置不影响运行
+"""
+
+import json
+import shutil
+
+import discuz_sentinel as ds
+
+def _write(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+def _sentinel(tmp_path):
+    path = str(tmp_path / 'config.json')
+    shutil.copy(ds.config_path(), path)
+    sentinel = ds.DiscuzSentinel(ds.Config.load(path))
+    with open(path, encoding='utf-8') as f:
+        return sentinel, path, json.load(f)
+
+def test_reload_applies_hot_settings(tmp_path):
+    sentinel, path, data = _sentinel(tmp_path)
+    sentinel.state[147] = {'last_pid': 3100001, 'last_tid': 0}
+
+    data['discuz']['target_fids'] = '147,149'
+    data['discuz']['cookie'] = 'auth=new'
+    data['notifications']['fid_mappings']['149'] = {'webhook_url': 'https://example.invalid/hook', 'webhook_type': 'feishu'}
+    data['system']['max_concurrency'] = 8
+    _write(path, data)
+    sentinel._reload_config()
+
+    assert sentinel._active_fids() == [147, 149]
+    assert sentinel.session.headers['Cookie'] == 'auth=new'
+    assert '149' in sentinel.config.fid_mappings
+    assert sentinel.state[147]['last_pid'] == 3100001
+    assert sentinel.state[149]['last_pid'] == 0
+    assert ds.Config.load(path).cold_changes(ds.Config.load(ds.config_path())) == ['system.max_concurrency']
+
+def test_invalid_config_keeps_current(tmp_path):
+    sentinel, path, _ = _sentinel(tmp_path)
+    current = sentinel.config
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"discuz": ')
+
+    sentinel._reload_config()
+
+    assert sentinel.config is current
+    assert not sentinel._config_changed()
+
+def test_config_failing_validation_keeps_current(tmp_path):
+    sentinel, path, data = _sentinel(tmp_path)
+    current = sentinel.config
+    sentinel.state[147] = {'last_pid': 3100001, 'last_tid': 0}
+
+    for broken in ({'target_fids': ''}, {'fid_mappings': {'147': 'https://example.invalid/hook'}}):
+        bad = json.loads(json.dumps(data))
+        if 'target_fids' in broken:
+            bad['discuz']['target_fids'] = broken['target_fids']
+        else:
+            bad['notifications']['fid_mappings'] = broken['fid_mappings']
+        _write(path, bad)
+        sentinel._reload_config()
+
+        assert sentinel.config is current
+        assert sentinel._active_fids() == [147, 148]
+        assert sentinel.state[147]['last_pid'] == 3100001
+        assert not sentinel._config_changed()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+测试摘要模式：积压达到阈值才合并、单条摘要的帖子数上限、未到重试时间的消息不计入、合并发送的结果作用于整批
+"""
+
+import time
+
+import discuz_sentinel as ds
+
+WEBHOOK = {'webhook_url': 'https://example.invalid/hook', 'webhook_type': 'feishu',
+           'digest_threshold': 3, 'digest_max_posts': 4}
+URL = WEBHOOK['webhook_url']
+
+def _sentinel(monkeypatch, ok=True):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    sent = []
+    monkeypatch.setattr(sentinel, 'send_digest', lambda posts, config: sent.append([p['_pid'] for p in posts]) or ok)
+    return sentinel, sent
+
+def _enqueue(sentinel, pids):
+    for pid in pids:
+        sentinel.outbox.enqueue(147, pid, WEBHOOK, {'subject': f'帖子 {pid}', '_pid': pid})
+
+def test_below_threshold_is_sent_individually(monkeypatch):
+    sentinel, sent = _sentinel(monkeypatch)
+    _enqueue(sentinel, [1, 2])
+
+    # 未达到阈值时不等待凑批，逐条发送
+    assert sentinel._digest_batch(URL, sentinel.outbox.next_pending(URL)) is None
+    assert sent == []
+
+def test_backlog_is_merged_up_to_max_posts(monkeypatch):
+    sentinel, sent = _sentinel(monkeypatch)
+    _enqueue(sentinel, [1, 2, 3, 4, 5, 6])
+
+    batch = sentinel._digest_batch(URL, sentinel.outbox.next_pending(URL))
+    sentinel._deliver_digest(batch)
+
+    assert sent == [[1, 2, 3, 4]]
+    # 剩余两条不足阈值，改为逐条发送
+    assert sentinel._digest_batch(URL, sentinel.outbox.next_pending(URL)) is None
+    assert [item['pid'] for item in sentinel.outbox.pending_batch(URL, 10)] == [5, 6]
+
+def test_messages_waiting_for_retry_do_not_count(monkeypatch):
+    sentinel, _ = _sentinel(monkeypatch)
+    _enqueue(sentinel, [1, 2, 3])
+    retrying = sentinel.outbox.next_pending(URL)
+    sentinel.outbox.mark_retry(retrying['id'], '发送失败', time.time() + 60)
+
+    assert sentinel._digest_batch(URL, sentinel.outbox.next_pending(URL)) is None
+
+def test_failed_digest_retries_every_post(monkeypatch):
+    sentinel, sent = _sentinel(monkeypatch, ok=False)
+    _enqueue(sentinel, [1, 2, 3])
+
+    sentinel._deliver_digest(sentinel._digest_batch(URL, sentinel.outbox.next_pending(URL)))
+
+    assert sent == [[1, 2, 3]]
+    rows = sentinel.outbox._conn.execute("SELECT status, attempts FROM outbox ORDER BY pid").fetchall()
+    assert [tuple(row) for row in rows] == [('pending', 1)] * 3
+    assert sentinel.outbox.due_keys() == []
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+测试飞书凭据池：并发请求同一应用只获取一次 Token、提前刷新、按剩余额度选择应用、被限流(429)时换用其他应用
+"""
+
+import threading
+import time
+
+import discuz_sentinel as ds
+
+APPS = [('cli_a', 'secret_a'), ('cli_b', 'secret_b')]
+
+def test_concurrent_token_requests_fetch_once():
+    calls = []
+
+    def fetch(app_id, app_secret):
+        calls.append(app_id)
+        time.sleep(0.05)
+        return f'token-{app_id}', 7200
+
+    pool = ds.FeishuCredentialPool(APPS[:1], fetch, rate_per_minute=50, refresh_ahead=600)
+    app = pool.apps[0]
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(pool.token(app))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ['cli_a']
+    assert tokens == ['token-cli_a'] * 8
+
+def test_token_refreshed_ahead_of_expiry():
+    tokens = iter(['old', 'new'])
+    pool = ds.FeishuCredentialPool(APPS[:1], lambda app_id, secret: (next(tokens), 7200), 50, refresh_ahead=600)
+    app = pool.apps[0]
+
+    assert pool.token(app) == 'old'
+    # 剩余不足 refresh_ahead 时，后台刷新会换新 Token；前台请求仍可继续使用旧 Token
+    app.expire = time.time() + 300
+    assert pool.token(app) == 'old'
+    assert pool._refresh(app, pool.refresh_ahead) == 'new'
+
+def test_rate_limited_app_is_rotated_out():
+    pool = ds.FeishuCredentialPool(APPS, lambda app_id, secret: ('t', 7200), rate_per_minute=50, refresh_ahead=600)
+    a, b = pool.apps
+
+    # 优先选择近一分钟剩余额度更多的应用
+    assert pool.pick() is a
+    assert pool.pick() is b
+
+    pool.report_limited(a, retry_after=30)
+    assert [pool.pick() for _ in range(3)] == [b, b, b]
+
+    # 全部被限流时选择最早解除限流的应用
+    pool.report_limited(b, retry_after=60)
+    assert pool.pick() is a
+
+class _Response:
+    def __init__(self, status_code, data, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self._data
+
+def test_upload_retries_with_another_app_on_429(monkeypatch):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    sentinel.feishu_pool = ds.FeishuCredentialPool(APPS, lambda app_id, secret: (f'token-{app_id}', 7200), 50, 600)
+    png = bytearray(b'\x89PNG\r\n\x1a\n' + b'\x00' * 8)
+    monkeypatch.setattr(sentinel, '_download_image', lambda url, tag: (png, 'png'))
+    responses = [
+        _Response(429, {'code': 99991400}, {'Retry-After': '30'}),
+        _Response(200, {'code': 0, 'data': {'image_key': 'img_v2'}}),
+    ]
+    auth = []
+
+    class _Session:
+        def post(self, url, headers, **kwargs):
+            auth.append(headers['Authorization'])
+            return responses.pop(0)
+
+    monkeypatch.setattr(sentinel.http_clients, 'for_url', lambda url: _Session())
+
+    assert sentinel._upload_to_feishu_server('https://img.example.invalid/a.png') == 'img_v2'
+    assert auth == ['Bearer token-cli_a', 'Bearer token-cli_b']
+    assert sentinel.feishu_pool.apps[0].limited_until > time.time() + 20
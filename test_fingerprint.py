@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+测试内容指纹去重：近似重复识别、同帖重复检出与索引持久化
+"""
+
+import logging
+
+import discuz_sentinel as ds
+
+logger = logging.getLogger("test_fingerprint")
+
+TEXT = "今日大盘缩量震荡，半导体板块午后拉升，北向资金净流入超过五十亿元，明天重点关注成交量能否持续放大。"
+IMAGES = ["https://www.55188.com/data/attachment/forum/202401/01/12345.jpg"]
+
+def test_near_duplicates_are_detected(tmp_path):
+    index = ds.FingerprintIndex('', 100, 86400, 3, logger)
+    fp = ds.content_fingerprint(TEXT, IMAGES)
+
+    assert index.check(fp, 147, 1) is None
+    # 转发时多了换行，末尾补了一句
+    edited = ds.content_fingerprint(TEXT.replace('，', '，\n') + '补充一句', IMAGES)
+    assert index.check(edited, 148, 2)['fid'] == 147
+    # 同一帖子再次检出不算重复
+    assert index.check(fp, 147, 1) is None
+
+    other = ds.content_fingerprint("周末消息面汇总：多家券商上调目标价，新能源车销量环比回升，光伏装机数据超出预期。", [])
+    assert index.check(other, 149, 3) is None
+    assert ds.content_fingerprint("顶", []) is None
+
+def test_index_persists_across_restart(tmp_path):
+    path = str(tmp_path / 'fingerprints.json')
+    fp = ds.content_fingerprint(TEXT, IMAGES)
+    index = ds.FingerprintIndex(path, 100, 86400, 3, logger)
+    index.check(fp, 147, 1)
+    index.flush()
+
+    reloaded = ds.FingerprintIndex(path, 100, 86400, 3, logger)
+    assert reloaded.check(fp, 148, 2)['pid'] == 1
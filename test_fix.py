@@ -3,9 +3,14 @@
 测试修复的URL清洗逻辑
 """
 
+import discuz_sentinel as ds
+
 def test_url_cleaning():
     """测试URL清洗逻辑"""
 
+    sentinel = ds.DiscuzSentinel.__new__(ds.DiscuzSentinel)
+    sentinel.html_backend = ds.create_html_backend('auto')
+
     # 测试用例
     test_cases = [
         # (原始URL, 期望的处理后URL)
@@ -15,25 +20,22 @@ def test_url_cleaning():
         ("https://www.55188.com/data/attachment/forum/202401/01/12345.png>", "https://www.55188.com/data/attachment/forum/202401/01/12345.png"),  # 去除末尾>
     ]
 
+    failures = 0
     for original_url, expected_url in test_cases:
-        # 模拟修复后的逻辑
-        src = original_url
-
-        # 修复：去除末尾可能存在的错误符号 '>'
-        src = src.strip('>')
+        # 直接调用实际的正文清洗逻辑
+        _, images = sentinel._clean_content(f'<img src="{original_url.replace("&", "&amp;")}" />')
 
-        # 修复：只有当不是 Discuz 动态 PHP 链接时，才去除 ? 后面的参数
-        if '?' in src and 'forum.php' not in src and 'mod=image' not in src:
-            src = src.split('?')[0]
-
-        result = src
+        result = images[0] if images else None
         status = "✅" if result == expected_url else "❌"
         print(f"{status} 原始: {original_url}")
         print(f"   结果: {result}")
         print(f"   期望: {expected_url}")
         if result != expected_url:
             print("   *** 不匹配 ***")
+            failures += 1
         print()
 
+    assert failures == 0
+
 if __name__ == "__main__":
     test_url_cleaning()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+测试按主机限流：同一主机的并发上限、相邻请求的最小间隔，不同主机互不影响
+"""
+
+import threading
+import time
+
+import discuz_sentinel as ds
+
+def _run(limiter, urls, hold=0.0):
+    """并发请求 urls，返回每次进入临界区的 (时间, 主机) 与同一主机的最大并发数"""
+    entries, active, peak = [], {}, {}
+    lock = threading.Lock()
+
+    def request(url):
+        with limiter.acquire(url):
+            host = ds.urlparse(url).netloc
+            with lock:
+                entries.append((time.monotonic(), host))
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(hold)
+            with lock:
+                active[host] -= 1
+
+    threads = [threading.Thread(target=request, args=(url,)) for url in urls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(entries), peak
+
+def test_concurrency_is_capped_per_host():
+    limiter = ds.HostLimiter(max_concurrency=2)
+    urls = ['https://forum.invalid/a'] * 6 + ['https://img.invalid/b'] * 2
+
+    _, peak = _run(limiter, urls, hold=0.05)
+
+    assert peak['forum.invalid'] == 2
+    assert peak['img.invalid'] <= 2
+
+def test_min_interval_between_requests_to_same_host():
+    limiter = ds.HostLimiter(max_concurrency=4, min_interval=0.1)
+    urls = ['https://forum.invalid/a'] * 4 + ['https://img.invalid/b']
+
+    entries, _ = _run(limiter, urls)
+
+    forum = [at for at, host in entries if host == 'forum.invalid']
+    assert all(b - a >= 0.09 for a, b in zip(forum, forum[1:]))
+    # 其他主机不必排在论坛请求之后
+    img = [at for at, host in entries if host == 'img.invalid']
+    assert img[0] - forum[0] < 0.1
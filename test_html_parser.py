@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+HTML解析后端等价性测试：确保切换解析器不会改变推送内容
+"""
+
+import json
+import os
+
+import pytest
+
+import discuz_sentinel as ds
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+with open(os.path.join(FIXTURES_DIR, 'posts.json'), 'r', encoding='utf-8') as f:
+    POSTS = [post['message'] for post in json.load(f)]
+
+with open(os.path.join(FIXTURES_DIR, 'thread_page.html'), 'r', encoding='utf-8') as f:
+    THREAD_PAGE = f.read()
+
+# 解析边界情况：实体、注释、CDATA、多余的结束标签、嵌套单元格等
+EDGE_CASES = [
+    'a<br>b</br>c',
+    '<p>x<img src=a>y</img>z',
+    '&amp;&foo;&amp &lt<b>z</b>',
+    '<rt>r</rt><template><b>t</b></template>w',
+    '<![CDATA[cd]]>x',
+    '&#128;&#0;&#65;a',
+    '<div/>a<br/>b',
+    '<td class="a t_f b">n<td>m</td>q</td>r',
+]
+
+SAMPLES = POSTS + EDGE_CASES + [THREAD_PAGE]
+
+def _available_backends():
+    backends = []
+    for name in ds.HTML_BACKENDS:
+        try:
+            backends.append(ds.HTML_BACKENDS[name]())
+        except ImportError:
+            pass
+    return backends
+
+def _clean(backend, html):
+    sentinel = ds.DiscuzSentinel.__new__(ds.DiscuzSentinel)
+    sentinel.html_backend = backend
+    return sentinel._clean_content(html)
+
+@pytest.mark.parametrize('html', SAMPLES)
+def test_stream_backend_matches_bs4(html):
+    """标准库流式解析与 BeautifulSoup 结果完全一致"""
+    reference = ds.Bs4Backend()
+    backend = ds.StreamBackend()
+    assert backend.extract(html) == reference.extract(html)
+    assert backend.extract_node(html, 'td', 't_f') == reference.extract_node(html, 'td', 't_f')
+
+@pytest.mark.parametrize('html', SAMPLES)
+def test_auto_backend_matches_bs4(html):
+    """auto 模式选出的后端推送内容与 BeautifulSoup 一致"""
+    backend = ds.create_html_backend('auto')
+    assert _clean(backend, html) == _clean(ds.Bs4Backend(), html)
+
+def test_self_checked_backends_match_fixtures():
+    """通过启动自检的后端，在全部样例帖子上也必须一致"""
+    reference = ds.Bs4Backend()
+    for backend in _available_backends():
+        if not ds._backend_matches_reference(backend):
+            continue
+        for html in POSTS:
+            assert _clean(backend, html) == _clean(reference, html), backend.name
+
+def test_clean_content_images():
+    """图片链接清洗：去除 '>'、保留 forum.php 参数、跳过表情、去重"""
+    text, images = _clean(ds.create_html_backend('auto'), POSTS[2])
+    assert images == [
+        f"{ds.BASE_URL}/data/attachment/forum/202601/06/171200abc.png",
+        "https://img.example.com/pic/1.jpg",
+        f"{ds.BASE_URL}/forum.php?mod=image&aid=882&size=300x300&key=abc&nocache=yes&type=fixnone",
+    ]
+    assert text.startswith('走势图如下：')
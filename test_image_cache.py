@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+测试图片上传缓存：按URL与内容摘要命中、TTL 过期、失败冷却、原子落盘后重启仍有效
+"""
+
+import logging
+import time
+
+import discuz_sentinel as ds
+
+logger = logging.getLogger("test_image_cache")
+
+def _cache(tmp_path, ttl=3600, cooldown=60):
+    return ds.ImageCache(str(tmp_path / 'image_cache.json'), 100, ttl, cooldown, logger)
+
+def test_lookup_by_url_and_digest(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store('feishu', 'img_key_1', url='https://IMG.example.invalid/a.png?b=2&a=1#x', digest='abc')
+
+    assert cache.lookup('feishu', url='https://img.example.invalid/a.png?a=1&b=2') == 'img_key_1'
+    # 同一图片换了地址时按内容摘要命中，并补记新地址
+    assert cache.lookup('feishu', url='https://mirror.example.invalid/a.png', digest='abc') == 'img_key_1'
+    assert cache.lookup('feishu', url='https://mirror.example.invalid/a.png') == 'img_key_1'
+    assert cache.lookup('imgbed', url='https://img.example.invalid/a.png?a=1&b=2') is None
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = _cache(tmp_path, ttl=3600)
+    cache.store('feishu', 'img_key_1', url='https://img.example.invalid/a.png')
+    cache.store('feishu', 'img_key_2', url='https://img.example.invalid/b.png')
+    cache._entries['feishu|url|https://img.example.invalid/a.png']['ts'] -= 3601
+
+    assert cache.lookup('feishu', url='https://img.example.invalid/a.png') is None
+    assert cache.lookup('feishu', url='https://img.example.invalid/b.png') == 'img_key_2'
+
+def test_failures_cool_down(tmp_path):
+    cache = _cache(tmp_path, cooldown=60)
+    url = 'https://img.example.invalid/hotlink.png'
+    cache.mark_failure('download', url, 'HTML页面')
+
+    assert cache.failure(url, 'download', 'feishu') == 'HTML页面'
+    assert cache.failure(url, 'feishu') is None
+
+    # 冷却期过后允许重新下载
+    cache._entries[f'download|fail|{url}']['ts'] = time.time() - 61
+    assert cache.failure(url, 'download') is None
+
+def test_flush_survives_restart(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store('feishu', 'img_key_1', url='https://img.example.invalid/a.png', digest='abc')
+    cache.flush()
+
+    assert not (tmp_path / 'image_cache.json.tmp').exists()
+    reloaded = _cache(tmp_path)
+    assert reloaded.lookup('feishu', digest='abc') == 'img_key_1'
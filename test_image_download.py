@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+测试图片下载：并发处理保持原图顺序、流式嗅探格式、按图片主机单独限流与熔断，不占用论坛的礼貌限速
+"""
+
+import time
+
+import pytest
+
+import discuz_sentinel as ds
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+class _Response:
+    def __init__(self, status_code, body=b''):
+        self.status_code = status_code
+        self.headers = {'Content-Length': str(len(body))}
+        self._body = body
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self._body), chunk_size):
+            yield self._body[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+class _Session:
+    def __init__(self, responses):
+        self.responses = responses
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return self.responses.pop(0)
+
+def _sentinel(monkeypatch, responses):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    session = _Session(responses)
+    monkeypatch.setattr(sentinel.http_clients, 'for_url', lambda url: session)
+    monkeypatch.setattr(sentinel, '_forum_get', lambda url, **kwargs: pytest.fail('图片下载不应经过论坛请求入口'))
+    return sentinel, session
+
+def test_download_uses_image_host_session(monkeypatch):
+    sentinel, session = _sentinel(monkeypatch, [_Response(200, PNG), _Response(200, b'<html>login</html>' * 4)])
+
+    data, img_format = sentinel._download_image('https://img.example.invalid/a.png', 'test')
+    assert bytes(data) == PNG and img_format == 'png'
+
+    assert sentinel._download_image('https://img.example.invalid/b.png', 'test') == (None, None)
+    assert session.urls == ['https://img.example.invalid/a.png', 'https://img.example.invalid/b.png']
+
+def test_image_host_failures_do_not_trip_forum_breaker(monkeypatch):
+    responses = [_Response(503) for _ in range(ds.CIRCUIT_FAILURE_THRESHOLD)]
+    sentinel, _ = _sentinel(monkeypatch, responses)
+
+    for i in range(ds.CIRCUIT_FAILURE_THRESHOLD):
+        assert sentinel._download_image(f'{ds.BASE_URL}/data/attachment/{i}.jpg', 'test') == (None, None)
+
+    assert sentinel.breakers.for_url(ds.BASE_URL).state == ds.CircuitBreaker.CLOSED
+    image_breaker = sentinel.breakers.get(f"image-{ds.urlparse(ds.BASE_URL).netloc}")
+    assert image_breaker.state == ds.CircuitBreaker.OPEN
+
+def test_concurrent_processing_keeps_image_order():
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    urls = [f'https://img.example.invalid/{i}.png' for i in range(6)]
+
+    def upload(url):
+        index = int(url.rsplit('/', 1)[1].split('.')[0])
+        # 靠前的图片处理得更慢，先完成的结果不能排到前面
+        time.sleep(0.02 * (len(urls) - index))
+        if index == 3:
+            raise ValueError('upload failed')
+        return f'key-{index}'
+
+    start = time.monotonic()
+    results = sentinel._process_images(upload, urls)
+
+    assert results == ['key-0', 'key-1', 'key-2', None, 'key-4', 'key-5']
+    assert time.monotonic() - start < 0.02 * sum(range(1, len(urls) + 1))
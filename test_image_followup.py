@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+测试两段式推送：正文先发且不含图片，图片作为补发消息进入独立队列
+"""
+
+import discuz_sentinel as ds
+
+WEBHOOK = {'webhook_url': 'https://example.invalid/hook', 'webhook_type': 'feishu', 'image_delivery': 'followup'}
+POST = {'subject': '标题', 'author': 'a', 'time': '', 'content': '正文', 'url': 'https://example.invalid/thread-1-1-1.html',
+        'images': ['https://example.invalid/1.jpg', 'https://example.invalid/2.jpg'], '_pid': 1}
+
+def test_text_first_then_images(monkeypatch):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    sent = []
+    monkeypatch.setattr(sentinel, 'send_feishu', lambda msg, post, config: sent.append((msg, post['images'])) or True)
+    monkeypatch.setattr(sentinel, '_ensure_delivery_worker', lambda key: None)
+
+    sentinel.outbox.enqueue(147, 1, WEBHOOK, POST)
+    sentinel._deliver(sentinel.outbox.next_pending(WEBHOOK['webhook_url']))
+
+    assert sent[0][1] == [] and '2 张图片稍后发送' in sent[0][0]
+    assert sentinel.outbox.next_pending(WEBHOOK['webhook_url']) is None
+
+    followup = sentinel.outbox.next_pending(WEBHOOK['webhook_url'] + ds.FOLLOWUP_KEY_SUFFIX)
+    assert ds._webhook_url(WEBHOOK['webhook_url'] + ds.FOLLOWUP_KEY_SUFFIX) == WEBHOOK['webhook_url']
+    sentinel._deliver(followup)
+
+    assert sent[1][1] == POST['images'] and '（图片）' in sent[1][0]
+    assert sentinel.outbox.due_keys() == []
+
+def test_inline_is_default(monkeypatch):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    sent = []
+    monkeypatch.setattr(sentinel, 'send_feishu', lambda msg, post, config: sent.append(post['images']) or True)
+    webhook = dict(WEBHOOK, image_delivery='inline')
+
+    sentinel.outbox.enqueue(147, 1, webhook, POST)
+    sentinel._deliver(sentinel.outbox.next_pending(webhook['webhook_url']))
+
+    assert sent == [POST['images']]
+    assert sentinel.outbox.due_keys() == []
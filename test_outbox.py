@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+测试发送队列：入队去重、失败退避重试与放弃、拒收的消息直接放弃、令牌桶限速、重启后继续发送未完成的消息
+"""
+
+import time
+
+import discuz_sentinel as ds
+
+WEBHOOK = {'webhook_url': 'https://example.invalid/hook', 'webhook_type': 'feishu'}
+URL = WEBHOOK['webhook_url']
+
+def test_enqueue_dedups_by_key(tmp_path):
+    outbox = ds.Outbox(str(tmp_path / 'outbox.db'))
+
+    assert outbox.enqueue(147, 1, WEBHOOK, {'subject': 'a'})
+    assert not outbox.enqueue(147, 1, WEBHOOK, {'subject': 'a'})
+    # 同一帖子的图片补发使用独立的队列键
+    assert outbox.enqueue(147, 1, WEBHOOK, {'subject': 'a'}, webhook_key=URL + ds.FOLLOWUP_KEY_SUFFIX)
+    assert outbox.enqueue(148, 1, WEBHOOK, {'subject': 'b'})
+
+    assert len(outbox.pending_batch(URL, 10)) == 2
+
+def test_failed_delivery_backs_off_then_dead_letters():
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    sentinel.outbox.enqueue(147, 1, WEBHOOK, {'subject': 'a'})
+
+    delays = []
+    for attempt in range(1, ds.DELIVERY_MAX_ATTEMPTS):
+        item = sentinel.outbox.next_pending(URL)
+        sentinel._record_delivery(item, False)
+        item = sentinel.outbox.next_pending(URL)
+        assert item['attempts'] == attempt
+        delays.append(item['next_attempt'] - time.time())
+
+    # 指数退避（含 ±20% 抖动），不超过上限
+    assert delays[0] < ds.DELIVERY_BACKOFF_BASE * 1.2 + 1
+    assert delays[2] > delays[0]
+    assert max(delays) <= ds.DELIVERY_BACKOFF_MAX * 1.2
+    assert sentinel.outbox.due_keys() == []
+
+    sentinel._record_delivery(sentinel.outbox.next_pending(URL), False)
+    assert sentinel.outbox.next_pending(URL) is None
+    row = sentinel.outbox._conn.execute("SELECT status, attempts FROM outbox").fetchone()
+    assert tuple(row) == ('dead', ds.DELIVERY_MAX_ATTEMPTS)
+
+def test_rejected_message_is_dead_lettered_without_blocking(monkeypatch):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    sentinel.outbox.enqueue(147, 1, WEBHOOK, {'subject': 'a'})
+    sentinel.outbox.enqueue(147, 2, WEBHOOK, {'subject': 'b'})
+    codes = [19024, 0]
+
+    class _Response:
+        status_code = 200
+        text = ''
+
+        def json(self):
+            return {'code': codes.pop(0), 'msg': ''}
+
+    class _Session:
+        def post(self, url, **kwargs):
+            return _Response()
+
+    monkeypatch.setattr(sentinel.http_clients, 'for_url', lambda url: _Session())
+
+    # 飞书拒收（不含关键词）的消息不再退避重试，后面的消息立即发送
+    assert not sentinel._deliver(sentinel.outbox.next_pending(URL))
+    item = sentinel.outbox.next_pending(URL)
+    assert item['pid'] == 2 and item['next_attempt'] <= time.time()
+    assert sentinel._deliver(item)
+    rows = sentinel.outbox._conn.execute("SELECT pid, status, attempts FROM outbox ORDER BY pid").fetchall()
+    assert [tuple(row) for row in rows] == [(1, 'dead', 1), (2, 'sent', 0)]
+
+def test_token_bucket_paces_after_burst():
+    bucket = ds.TokenBucket(rate_per_minute=600, burst=2)
+
+    start = time.monotonic()
+    bucket.acquire()
+    bucket.acquire()
+    assert time.monotonic() - start < 0.05
+
+    # 突发额度用完后按每分钟 600 次（每 0.1 秒 1 次）放行
+    bucket.acquire()
+    bucket.acquire()
+    assert 0.18 <= time.monotonic() - start < 0.5
+
+def test_unfinished_messages_survive_restart(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    outbox = ds.Outbox(path)
+    outbox.enqueue(147, 1, WEBHOOK, {'subject': 'a'})
+    outbox.enqueue(147, 2, WEBHOOK, {'subject': 'b'})
+    # 发送到一半时进程退出：消息已取出（分片模式下已认领）但还没有标记结果
+    sending = outbox.next_pending(URL, {147}, 'worker-a')
+    assert outbox.claim(sending['id'], 'worker-a', ttl=60)
+    outbox._conn.close()
+
+    reopened = ds.Outbox(path)
+    assert reopened.pending_keys() == [URL]
+    assert reopened.next_pending(URL)['pid'] == 1
+    # 认领过期后由其他 worker 接手
+    reopened._conn.execute("UPDATE outbox SET claim_expires = 0")
+    assert reopened.next_pending(URL, {147}, 'worker-b')['pid'] == 1
+
+def test_delivery_lag_uses_parsed_dateline_only():
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    lag = ds.DELIVERY_LAG
+
+    def observed(fid):
+        return lag._values.get(lag._key({'fid': fid}), (None, 0.0, 0))[2]
+
+    # 发布时间无法解析时只用于排序，不计入推送延迟
+    for fid, time_str in ((9901, '3 分钟前'), (9902, str(int(time.time()) - 60))):
+        post = {'subject': 'a', 'time': time_str}
+        sentinel._stamp_post(post, 1)
+        sentinel.outbox.enqueue(fid, 1, WEBHOOK, post)
+        sentinel._record_delivery(sentinel.outbox.next_pending(URL), True)
+
+    assert observed(9901) == 0
+    assert observed(9902) == 1 and lag._values[lag._key({'fid': 9902})][1] >= 60
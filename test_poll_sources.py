@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+测试轮询数据源：按开销选择数据源、导读列表与 RSS 一次请求覆盖多个FID、开销统计
+"""
+
+import time
+
+import discuz_sentinel as ds
+
+RSS = """<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0"><channel>
+<item><title>a</title><link>https://forum.invalid/forum.php?mod=viewthread&amp;tid=1</link><category>甲</category></item>
+<item><title>b</title><link>https://forum.invalid/thread-2-1-1.html</link><category>乙</category></item>
+<item><title>c</title><link>https://forum.invalid/thread-3-1-1.html</link><category>甲</category></item>
+</channel></rss>"""
+
+THREADS = {
+    1: {'fid': 147, 'pids': [201, 202]},
+    2: {'fid': 999, 'pids': [203]},
+    3: {'fid': 147, 'pids': [204]},
+}
+
+# 主题的最后回复时间随回复数变化，便于判断导读列表中的主题是否有新回复
+STARTED = int(time.time())
+
+class _Response:
+    status_code = 200
+    text = ''
+
+    def __init__(self, data=None, content=b''):
+        self._data = data
+        self.content = content
+
+    def json(self):
+        return self._data
+
+class _Forum:
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, params, **kwargs):
+        module = params.get('module') or params.get('mod')
+        self.requests.append((module, params.get('tid')))
+        if module == 'rss':
+            return _Response(content=RSS.encode('utf-8'))
+        if module == 'misc':
+            pids = [pid for t in THREADS.values() if t['fid'] == params['fid'] for pid in t['pids']]
+            return _Response({'count': len(pids), 'list': [{'pid': pid} for pid in pids]})
+        if module == 'forumguide':
+            return _Response({'Variables': {'forum_threadlist': [
+                {'tid': tid, 'fid': t['fid'], 'dblastpost': STARTED + len(t['pids'])} for tid, t in THREADS.items()
+            ]}})
+        thread = THREADS[params['tid']]
+        return _Response({'Variables': {
+            'ppp': 10,
+            'thread': {'tid': params['tid'], 'fid': thread['fid'], 'subject': '主题', 'replies': len(thread['pids']) - 1},
+            'postlist': [{'pid': pid, 'author': 'a', 'dateline': str(pid), 'message': f'帖子 {pid}'} for pid in thread['pids']],
+        }})
+
+def _sentinel(monkeypatch, names):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    sentinel.sources = ds.create_poll_sources(names, sentinel, sentinel.logger)
+    forum = _Forum()
+
+    def forum_get(url, params, **kwargs):
+        sentinel._forum_requests.count += 1
+        return forum.get(url, params, **kwargs)
+
+    monkeypatch.setattr(sentinel, '_forum_get', forum_get)
+    enqueued = []
+    monkeypatch.setattr(sentinel, '_enqueue_post', lambda fid, post: enqueued.append((fid, post['_pid'])))
+    for fid in (147, 148):
+        sentinel.state[fid] = {'last_pid': 200, 'last_tid': 0, 'last_poll': time.time() - 30}
+    return sentinel, forum, enqueued
+
+def test_plan_prefers_cheaper_source(monkeypatch):
+    sentinel, _, _ = _sentinel(monkeypatch, ['livelastpost', 'guide'])
+    sources = sentinel.sources
+
+    assert [(src.name, group) for src, group in sources.plan([147])] == [('livelastpost', [147])]
+    assert [(src.name, group) for src, group in sources.plan([147, 148])] == [('guide', [147, 148])]
+
+    # 导读列表实测每次需要大量详情请求后，两个FID改为逐个请求 livelastpost
+    for _ in range(20):
+        sources.record('guide', 2, 12, 1)
+    assert [src.name for src, _ in sources.plan([147, 148])] == ['livelastpost', 'livelastpost']
+
+def test_guide_covers_many_fids(monkeypatch):
+    sentinel, forum, enqueued = _sentinel(monkeypatch, ['guide'])
+    source = sentinel.sources.sources[0]
+
+    counts = sentinel._poll_group(source, [147, 148])
+
+    assert counts == {147: 3, 148: 0}
+    assert enqueued == [(147, 201), (147, 202), (147, 204)]
+    assert sentinel.state[147]['last_pid'] == 204
+    assert ('viewthread', 2) not in forum.requests
+    assert 'guide: 轮询 1 次' in sentinel.sources.report()[0]
+
+def test_rss_resolves_forums_once(monkeypatch):
+    sentinel, forum, enqueued = _sentinel(monkeypatch, ['rss'])
+    source = sentinel.sources.sources[0]
+
+    assert sentinel._poll_group(source, [147, 148]) == {147: 2, 148: 0}
+    assert enqueued == [(147, 201), (147, 204)]
+
+    # 已处理过的主题不再获取详情
+    forum.requests = []
+    sentinel._poll_group(source, [147, 148])
+    assert forum.requests == [('rss', None)]
+
+def test_plan_never_replaces_replies_with_rss(monkeypatch):
+    sentinel, _, _ = _sentinel(monkeypatch, ['livelastpost', 'rss'])
+    sources = sentinel.sources
+
+    # RSS 每次只需一次请求，但不含回复，不能替代 livelastpost
+    for _ in range(20):
+        sources.record('rss', 2, 1, 0)
+    assert [src.name for src, _ in sources.plan([147, 148])] == ['livelastpost', 'livelastpost']
+
+    errors, warnings = ds.validate_config(ds.Config({
+        'discuz': {'target_fids': '147'},
+        'notifications': {'fid_mappings': {}},
+        'system': {'poll_sources': ['livelastpost', 'rss']},
+    }))
+    assert not errors
+    assert any('rss' in w for w in warnings)
+
+def test_guide_skips_failed_response(monkeypatch):
+    sentinel, _, enqueued = _sentinel(monkeypatch, ['guide'])
+    source = sentinel.sources.sources[0]
+    failed = _Response()
+    failed.status_code = 502
+    monkeypatch.setattr(sentinel, '_forum_get', lambda url, params, **kwargs: failed)
+
+    assert source.fetch([147, 148], sentinel.state) == {147: None, 148: None}
+    assert enqueued == []
+
+def test_batch_sources_seed_fid_without_cursor(monkeypatch):
+    for name in ('guide', 'rss'):
+        sentinel, forum, enqueued = _sentinel(monkeypatch, [name])
+        source = sentinel.sources.sources[0]
+        # 新增的FID没有游标：记下当前最大 pid，不把历史帖子全部推送
+        sentinel.state[147] = {}
+
+        assert sentinel._poll_group(source, [147, 148]) == {147: 0, 148: 0}
+        assert enqueued == []
+        assert sentinel.state[147]['last_pid'] == 204
+
+        # 之后按该FID自己的游标正常处理（清空详情缓存，模拟下一轮轮询时缓存已过期）
+        THREADS[3]['pids'].append(205)
+        sentinel.thread_cache = ds.TTLCache(16, 30)
+        try:
+            sentinel._poll_group(source, [147, 148])
+        finally:
+            THREADS[3]['pids'].pop()
+        # RSS 不含回复
+        assert enqueued == ([(147, 205)] if name == 'guide' else [])
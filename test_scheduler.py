@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+测试自适应调度：发帖速率的 EWMA 更新、间隔随速率缩放并限制在上下界内、全局预算超出时整体放慢
+"""
+
+import pytest
+
+import discuz_sentinel as ds
+
+def test_rate_is_ewma_of_observed_posts():
+    scheduler = ds.PollScheduler(10, 300, 0)
+    fid_state = {}
+
+    scheduler.observe(fid_state, 5, 1000.0)
+    assert 'rate' not in fid_state and fid_state['last_poll'] == 1000.0
+
+    scheduler.observe(fid_state, 6, 1060.0)
+    assert fid_state['rate'] == pytest.approx(0.3 * 0.1)
+    scheduler.observe(fid_state, 0, 1120.0)
+    assert fid_state['rate'] == pytest.approx(0.7 * 0.03)
+
+def test_interval_follows_rate_within_bounds(monkeypatch):
+    monkeypatch.setattr(ds.random, 'uniform', lambda a, b: 1.0)
+    scheduler = ds.PollScheduler(10, 300, 0)
+
+    assert scheduler.interval({}, []) == 300
+    assert scheduler.interval({'rate': 1 / 60}, []) == pytest.approx(60)
+    assert scheduler.interval({'rate': 5.0}, []) == 10
+    assert scheduler.interval({'rate': 1e-6}, []) == 300
+
+def test_budget_slows_all_fids(monkeypatch):
+    monkeypatch.setattr(ds.random, 'uniform', lambda a, b: 1.0)
+    scheduler = ds.PollScheduler(10, 300, budget_per_minute=6)
+    busy = [{'rate': 1.0}] * 2   # 各自想每 10 秒轮询一次，合计 12 次/分钟
+
+    assert scheduler.interval(busy[0], busy) == pytest.approx(20)
+    # 放慢后也不超过最大间隔
+    crowd = [{'rate': 1.0}] * 100
+    assert scheduler.interval(crowd[0], crowd) == 300
+
+def test_jitter_stays_small():
+    scheduler = ds.PollScheduler(10, 300, 0)
+    intervals = [scheduler.interval({'rate': 1 / 60}, []) for _ in range(50)]
+    assert all(54 <= i <= 66 for i in intervals)
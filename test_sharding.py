@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+测试分片模式：FID 租约均分、worker 失联后接管、游标写入与消息认领的互斥
+"""
+
+import json
+import logging
+import time
+
+import discuz_sentinel as ds
+
+logger = logging.getLogger("test_sharding")
+FIDS = [147, 148, 149, 150, 151]
+
+def test_leases_are_split_and_taken_over(tmp_path):
+    path = str(tmp_path / 'shard.db')
+    a = ds.ShardCoordinator(path, 'worker-a', FIDS, ttl=5)
+    b = ds.ShardCoordinator(path, 'worker-b', FIDS, ttl=5)
+
+    assert a.rebalance()[0] == set(FIDS)
+    b.rebalance()
+    _, released = a.rebalance()
+    b.rebalance()
+
+    assert released and a.owned().isdisjoint(b.owned())
+    assert a.owned() | b.owned() == set(FIDS)
+    assert len(b.owned()) == 2
+
+    # worker-a 失联：心跳与租约过期后由 worker-b 接管全部FID
+    a._conn.execute("UPDATE shard_workers SET heartbeat = heartbeat - 60 WHERE worker_id = 'worker-a'")
+    a._conn.execute("UPDATE fid_leases SET expires = 0 WHERE owner = 'worker-a'")
+    b.rebalance()
+    assert b.owned() == set(FIDS)
+
+def test_busy_fids_are_not_released(tmp_path):
+    path = str(tmp_path / 'shard.db')
+    a = ds.ShardCoordinator(path, 'worker-a', FIDS, ttl=5)
+    a.rebalance()
+    ds.ShardCoordinator(path, 'worker-b', FIDS, ttl=5).rebalance()
+
+    _, released = a.rebalance(busy=set(FIDS))
+    assert released == set()
+
+def test_cursor_writes_are_fenced_by_lease(tmp_path):
+    path = str(tmp_path / 'shard.db')
+    a = ds.ShardCoordinator(path, 'worker-a', [147], ttl=5)
+    a.rebalance()
+    store_a = ds.SqliteStateStore(path, logger, lease_owner='worker-a')
+    store_b = ds.SqliteStateStore(path, logger, lease_owner='worker-b')
+
+    store_a.save({147: {'last_pid': 10, 'last_tid': 0}}, {147})
+    store_b.save({147: {'last_pid': 5, 'last_tid': 0}}, {147})
+
+    assert store_a.load()[147]['last_pid'] == 10
+
+def test_outbox_claim_is_exclusive(tmp_path):
+    path = str(tmp_path / 'shard.db')
+    outbox = ds.Outbox(path)
+    webhook = {'webhook_url': 'https://example.invalid/hook', 'webhook_type': 'feishu'}
+    assert outbox.enqueue(147, 1, webhook, {'subject': 'x'})
+    assert not outbox.enqueue(147, 1, webhook, {'subject': 'x'})
+
+    item = outbox.next_pending(webhook['webhook_url'], {147}, 'worker-a')
+    assert outbox.claim(item['id'], 'worker-a', ttl=60)
+    assert not outbox.claim(item['id'], 'worker-b', ttl=60)
+    assert outbox.next_pending(webhook['webhook_url'], {147}, 'worker-b') is None
+    assert outbox.next_pending(webhook['webhook_url'], {148}, 'worker-a') is None
+
+    outbox.mark_retry(item['id'], '发送失败', time.time())
+    assert outbox.claim(item['id'], 'worker-b', ttl=60)
+
+def test_first_shard_start_imports_existing_state(tmp_path):
+    with open(ds.config_path(), encoding='utf-8') as f:
+        data = json.load(f)
+    data['system'].update({
+        'state_file': str(tmp_path / 'monitor_state.json'),
+        'outbox_file': str(tmp_path / 'outbox.db'),
+        'shard_file': str(tmp_path / 'shard.db'),
+    })
+    path = tmp_path / 'config.json'
+    path.write_text(json.dumps(data), encoding='utf-8')
+    ds.JsonStateStore(data['system']['state_file'], logger).save(
+        {147: {'last_pid': 3100001, 'last_tid': 0}}, {147}
+    )
+    webhook = {'webhook_url': 'https://example.invalid/hook', 'webhook_type': 'feishu'}
+    legacy_outbox = ds.Outbox(data['system']['outbox_file'])
+    legacy_outbox.enqueue(147, 3100001, webhook, {'subject': 'x'})
+
+    try:
+        sentinel = ds.DiscuzSentinel(ds.Config.load(str(path)))
+        assert sentinel.state[147]['last_pid'] == 3100001
+        assert sentinel.outbox.next_pending(webhook['webhook_url'])['pid'] == 3100001
+        assert legacy_outbox.next_pending(webhook['webhook_url']) is None
+
+        # 再次启动不会重复导入
+        again = ds.DiscuzSentinel(ds.Config.load(str(path)))
+        assert len(again.outbox.pending_batch(webhook['webhook_url'], 10)) == 1
+    finally:
+        ds.configure(ds.Config.load(ds.config_path()))
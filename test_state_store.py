@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+测试状态持久化：JSON 原子写入、损坏文件处理、SQLite 增量写入与旧状态导入
+"""
+
+import json
+import logging
+import os
+
+import discuz_sentinel as ds
+
+logger = logging.getLogger("test_state_store")
+
+STATE = {
+    147: {'last_pid': 3100001, 'last_tid': 0, 'rate': 0.05, 'last_poll': 1767690000.0, 'next_poll': 1767690030.0},
+    148: {'last_pid': 12, 'last_tid': 0},
+}
+
+def test_json_store_round_trip(tmp_path):
+    path = str(tmp_path / 'monitor_state.json')
+    store = ds.JsonStateStore(path, logger)
+    store.save(STATE, set(STATE))
+
+    assert store.load() == STATE
+    assert not os.path.exists(path + '.tmp')
+
+def test_json_store_keeps_corrupt_file(tmp_path):
+    path = tmp_path / 'monitor_state.json'
+    path.write_text('{"147": {"last_pid": 31', encoding='utf-8')
+
+    assert ds.JsonStateStore(str(path), logger).load() == {}
+    assert not path.exists()
+    assert len(list(tmp_path.glob('monitor_state.json.corrupt-*'))) == 1
+
+def test_sqlite_store_writes_only_dirty_fids(tmp_path):
+    store = ds.SqliteStateStore(str(tmp_path / 'state.db'), logger)
+    store.save(STATE, set(STATE))
+
+    changed = {fid: dict(v) for fid, v in STATE.items()}
+    changed[147]['last_pid'] = 3100002
+    changed[148]['last_pid'] = 99
+    store.save(changed, {147})
+
+    loaded = store.load()
+    assert loaded[147]['last_pid'] == 3100002
+    assert loaded[147]['next_poll'] == STATE[147]['next_poll']
+    assert loaded[148]['last_pid'] == 12
+
+def test_sqlite_store_imports_legacy_json(tmp_path):
+    legacy = tmp_path / 'monitor_state.json'
+    legacy.write_text(json.dumps({'147': 3100001}), encoding='utf-8')
+
+    store = ds.create_state_store('sqlite', str(legacy), logger)
+
+    assert isinstance(store, ds.SqliteStateStore)
+    assert store.load() == {147: {'last_pid': 3100001, 'last_tid': 0}}
+    assert (tmp_path / 'monitor_state.db').exists()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+测试帖子详情缓存：TTL 过期与 LRU 淘汰；同一主题的多条新回复每轮只请求一次详情
+"""
+
+import time
+
+import discuz_sentinel as ds
+
+def test_ttl_cache_expiry_and_max_age():
+    cache = ds.TTLCache(max_entries=10, ttl=30)
+    cache.put('a', 1)
+
+    assert cache.get('a') == 1
+    # max_age 更短时视为未命中，但条目仍保留给其他读者
+    cache._entries['a'] = (time.time() - 10, 1)
+    assert cache.get('a', max_age=5) is None
+    assert cache.get('a') == 1
+
+    cache._entries['a'] = (time.time() - 31, 1)
+    assert cache.get('a') is None
+    assert 'a' not in cache._entries
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = ds.TTLCache(max_entries=2, ttl=30)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+class _Response:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+def test_hot_thread_fetched_once_per_cycle(monkeypatch):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    requests = []
+
+    def forum_get(url, params, **kwargs):
+        requests.append(params['tid'])
+        return _Response({'Variables': {
+            'ppp': 10,
+            'thread': {'tid': params['tid'], 'subject': '热帖', 'replies': 3},
+            'postlist': [{'pid': pid, 'author': 'a', 'dateline': '', 'message': f'回复 {pid}'} for pid in (1, 2, 3, 4)],
+        }})
+
+    monkeypatch.setattr(sentinel, '_forum_get', forum_get)
+    enqueued = []
+    monkeypatch.setattr(sentinel, '_enqueue_post', lambda fid, post: enqueued.append(post['_pid']))
+    data = {'count': 3, 'list': [{'pid': pid, 'tid': 9} for pid in (2, 3, 4)]}
+
+    assert sentinel._process_poll(147, {'last_pid': 1}, data) == 3
+    assert enqueued == [2, 3, 4]
+    assert requests == [9]
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+测试按 pid 定位所在页：长主题的新回复只请求最后一页，pid→页码索引复用，findpost 跳转定位旧回复
+"""
+
+import discuz_sentinel as ds
+
+PPP = 10
+
+class _Response:
+    def __init__(self, data=None, location=''):
+        self._data = data
+        self.headers = {'Location': location} if location else {}
+
+    def json(self):
+        return self._data
+
+class _Forum:
+    """模拟一个主题：每页 PPP 条，pid 从 100 开始连续编号"""
+
+    def __init__(self, posts):
+        self.posts = posts
+        self.requests = []
+
+    def get(self, url, params, **kwargs):
+        if params.get('goto') == 'findpost':
+            self.requests.append(('findpost', params['pid']))
+            page = (params['pid'] - 100) // PPP + 1
+            return _Response(location=f"forum.php?mod=viewthread&tid={params['ptid']}&page={page}#pid{params['pid']}")
+        page = params.get('page', 1)
+        self.requests.append(('viewthread', page))
+        pids = range(100 + (page - 1) * PPP, min(100 + self.posts, 100 + page * PPP))
+        return _Response({'Variables': {
+            'ppp': PPP,
+            'thread': {'tid': 1, 'subject': '长主题', 'replies': self.posts - 1},
+            'postlist': [{'pid': pid, 'author': 'a', 'dateline': '', 'message': f'回复 {pid}'} for pid in pids],
+        }})
+
+def _sentinel(monkeypatch, forum):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    monkeypatch.setattr(sentinel, '_forum_get', lambda url, params, **kwargs: forum.get(url, params, **kwargs))
+    return sentinel
+
+def test_new_reply_in_long_thread(monkeypatch):
+    forum = _Forum(posts=45)
+    sentinel = _sentinel(monkeypatch, forum)
+
+    assert 144 in sentinel._get_thread_posts(1, [143, 144])
+    assert forum.requests == [('viewthread', 1), ('viewthread', 5)]
+
+    # 之后的新回复直接请求最后一页
+    forum.posts, forum.requests = 46, []
+    sentinel.thread_cache = ds.TTLCache(16, 30)
+    assert sentinel._get_thread_posts(1, [145])[145]['content'] == '回复 145'
+    assert forum.requests == [('viewthread', 5)]
+
+def test_findpost_locates_older_reply(monkeypatch):
+    forum = _Forum(posts=45)
+    sentinel = _sentinel(monkeypatch, forum)
+    sentinel._get_thread_posts(1, [144])
+    forum.requests = []
+
+    assert sentinel._get_thread_posts(1, [112])[112]['content'] == '回复 112'
+    assert forum.requests == [('findpost', 112), ('viewthread', 2)]
+    assert sentinel.post_pages.get(112) == 2
+
+def test_no_permission_skips_html_fallback(monkeypatch):
+    sentinel = ds.DiscuzSentinel(ds.Config.load(ds.config_path()))
+    requests = []
+
+    def forum_get(url, params=None, **kwargs):
+        requests.append(params)
+        return _Response({'Message': {'messageval': 'show_thread_nopermission'}})
+
+    monkeypatch.setattr(sentinel, '_forum_get', forum_get)
+
+    # 无权限时不再下载整页网页，返回 None 由调用方使用 livelastpost 摘要
+    assert sentinel._get_thread_detail(1, 100) is None
+    assert sentinel._get_thread_posts(1, [100]) == {}
+    assert requests and all(params and params.get('module') == 'viewthread' for params in requests)